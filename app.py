@@ -1,11 +1,12 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g, session as flask_session
 import os
 import base64
 import numpy as np
 import cv2
 import threading
 import time
+import functools
 import io
 import sys
 from PyQt6.QtCore import QCoreApplication
@@ -31,44 +32,256 @@ class QtAppThread(threading.Thread):
 qt_thread = QtAppThread()
 qt_thread.start()
 
-from vision_encoder import VisionEncoder
+from vision_encoder import VisionEncoder, FrameBroadcaster
 from speech_recognition import SpeechRecognizer
-from reference_resolver import ReferenceResolver
+from reference_resolver import ReferenceResolver, ReferenceSpeculator, HierarchicalRefiner
+from text_vocabulary import load_vocabulary
+from session_manager import SessionManager, SessionLimitError, ResponsePipeline
+from evaluation_collector import EvaluationCollector
+from latency_trace import LatencyTrace, span, activate, set_current_trace
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+try:
+    from gesture_recognizer import GestureRecognizer, GestureWorker
+except ImportError as e:
+    print(f"無法載入手勢識別模組，手勢指向功能已停用: {e}")
+    GestureRecognizer = None
 
 app = Flask(__name__)
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
 
 # 初始化模塊
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your-api-key-here")  # 從環境變數讀取，或使用默認值
 
-vision_encoder = VisionEncoder()
-speech_recognizer = SpeechRecognizer(api_key=OPENAI_API_KEY)
-speech_recognizer.set_language("zh")
-reference_resolver = ReferenceResolver(api_key=OPENAI_API_KEY)
+# CLIP 輸入大小: 224 為原生解析度，較小的值（如 128，需為 32 的倍數）以插值位置編碼直接推理，按部署在速度與特徵質量間取捨
+VISION_IMAGE_SIZE = int(os.environ.get("VISION_IMAGE_SIZE", "224"))
+# 場景分割方式: grid 固定 3x3 網格，regions 只編碼候選物體區域（數量不超過 VISION_MAX_REGIONS，
+# 每個網格單元最多一個區域，因此上限最多為 9）
+VISION_SEGMENTATION = os.environ.get("VISION_SEGMENTATION", "grid")
+VISION_MAX_REGIONS = int(os.environ.get("VISION_MAX_REGIONS", "0")) or None
+if VISION_MAX_REGIONS is not None and VISION_MAX_REGIONS > 9:
+    print(f"⚠️ VISION_MAX_REGIONS={VISION_MAX_REGIONS} 超過網格單元數，按 9 計算")
+    VISION_MAX_REGIONS = 9
+vision_encoder = VisionEncoder(image_size=VISION_IMAGE_SIZE, segmentation=VISION_SEGMENTATION,
+                               max_regions=VISION_MAX_REGIONS)
+# 預計算的 CLIP 文本詞彙（python text_vocabulary.py 生成），存在時為每個區域添加物體/顏色/位置標籤
+CLIP_VOCABULARY = os.environ.get("CLIP_VOCABULARY", "clip_vocabulary")
+vision_encoder.vocabulary = load_vocabulary(CLIP_VOCABULARY, dim=vision_encoder.model.config.projection_dim)
+if vision_encoder.vocabulary is not None:
+    print(f"已加載區域標註詞彙: {len(vision_encoder.vocabulary)} 個詞")
+# 語音識別模型檔位 (tiny/base/small/medium/large-v2)，按部署在延遲與準確度間取捨
+STT_MODEL_TIER = os.environ.get("STT_MODEL_TIER", "small")
+STT_COMPUTE_TYPE = os.environ.get("STT_COMPUTE_TYPE") or None
+STT_REALTIME = os.environ.get("STT_REALTIME", "0") == "1"
+
+# 額外預加載的識別語言（逗號分隔），切換語言時無需重新加載模型
+STT_PRELOAD_LANGUAGES = [lang for lang in os.environ.get("STT_PRELOAD_LANGUAGES", "").split(",") if lang]
+
+speech_recognizer = SpeechRecognizer(
+    api_key=OPENAI_API_KEY,
+    model_tier=STT_MODEL_TIER,
+    compute_type=STT_COMPUTE_TYPE,
+    enable_realtime=STT_REALTIME,
+    language="zh"
+)
+if STT_PRELOAD_LANGUAGES:
+    speech_recognizer.preload(languages=STT_PRELOAD_LANGUAGES)
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "30"))  # 每次 OpenAI 請求的超時(秒)
+# 由粗到細定位: 解析到網格單元後在單元內遞歸細分的層數（0 為停用），每層多編碼 4 個子區域；
+# 子區域按參照中詞彙詞的英文文本特徵排序，需要詞彙
+REFERENCE_REFINE_DEPTH = int(os.environ.get("REFERENCE_REFINE_DEPTH", "0"))
+if REFERENCE_REFINE_DEPTH > 0 and vision_encoder.vocabulary is None:
+    print(f"⚠️ 由粗到細定位需要區域標註詞彙 ({CLIP_VOCABULARY})，已停用")
+    REFERENCE_REFINE_DEPTH = 0
+reference_resolver = ReferenceResolver(
+    api_key=OPENAI_API_KEY,
+    timeout=OPENAI_TIMEOUT,
+    refiner=HierarchicalRefiner(vision_encoder, vision_encoder.vocabulary, depth=REFERENCE_REFINE_DEPTH)
+    if REFERENCE_REFINE_DEPTH > 0 else None,
+    # 參照解析只發送區域標籤文本，不發送圖像（需要詞彙）
+    text_only=os.environ.get("REFERENCE_TEXT_ONLY", "0") == "1"
+)
+
+# 推測解析: 根據即時部分轉錄提前捕獲場景並解析參照（需要啟用即時轉錄）
+SPECULATIVE_RESOLUTION = STT_REALTIME and os.environ.get("SPECULATIVE_RESOLUTION", "1") == "1"
+
+def create_speculator():
+    """為會話創建推測解析器，未啟用時返回None"""
+    if not SPECULATIVE_RESOLUTION:
+        return None
+    return ReferenceSpeculator(
+        reference_resolver,
+        capture_scene=lambda: vision_encoder.describe_scene(force_refresh=True),
+        find_pointed_segment=get_pointed_segment
+    )
+
+# 手勢檢測設置
+GESTURE_DETECTION_FPS = 10      # 手勢檢測頻率
+GESTURE_DETECTION_WIDTH = 320   # 手勢檢測時的畫面寬度
+POINTING_MAX_AGE = 1.0          # 指向結果的有效期(秒)
+
+gesture_recognizer = None
+gesture_worker = None
+if GestureRecognizer is not None:
+    try:
+        gesture_recognizer = GestureRecognizer()
+        gesture_worker = GestureWorker(
+            gesture_recognizer,
+            detection_fps=GESTURE_DETECTION_FPS,
+            detection_width=GESTURE_DETECTION_WIDTH,
+            max_age=POINTING_MAX_AGE
+        )
+        gesture_worker.start()
+    except Exception as e:
+        print(f"初始化手勢識別器失敗: {e}")
+        gesture_worker = None
+
+# 視頻串流: 所有客戶端共享一個捕獲線程，每幀只讀取和編碼一次
+STREAM_FPS = 30
+STREAM_MAX_DURATION = float(os.environ.get("STREAM_MAX_DURATION", "0")) or None  # 單個串流的最長時間(秒)
+frame_broadcaster = FrameBroadcaster(
+    vision_encoder.capture_frame,
+    on_frame=gesture_worker.submit_frame if gesture_worker is not None else None,
+    draw_overlay=gesture_worker.draw_overlay if gesture_worker is not None else None,
+    fps=STREAM_FPS
+)
+
+# 關閉時釋放資源
+shutdown_event = threading.Event()
+
+# 會話管理: 每個客戶端有獨立的會話狀態，模型實例共享
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "8"))                 # 最大並發會話數
+SESSION_IDLE_TIMEOUT = int(os.environ.get("SESSION_IDLE_TIMEOUT", "1800"))  # 空閒會話淘汰時間(秒)
+session_manager = SessionManager(max_sessions=MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT)
+
+# 回應生成工作池: 模型調用不持有會話鎖，結果按提交順序發布
+RESPONSE_WORKERS = int(os.environ.get("RESPONSE_WORKERS", "4"))
+response_pipeline = ResponsePipeline(max_workers=RESPONSE_WORKERS, max_pending=RESPONSE_WORKERS * 4)
+
+# 語音分發: 共享的語音識別器的轉錄事件分發給所有正在錄製的會話
+speech_dispatch_lock = threading.Lock()
+speech_dispatch_threads = []
+
+# 延遲記錄: 每個請求和每條語音回應記錄各階段耗時
+LATENCY_TRACING = os.environ.get("LATENCY_TRACING", "1") == "1"
+UNTRACED_PATHS = ("/api/video_stream", "/static/")   # 長連接串流和靜態文件不記錄
+
+# 評估數據收集: 保存交互、場景畫面和延遲記錄
+EVALUATION_CAPTURE = os.environ.get("EVALUATION_CAPTURE", "0") == "1"
+evaluation_collector = EvaluationCollector() if EVALUATION_CAPTURE else None
+
+# 性能指標: /api/metrics 以 Prometheus 文本格式輸出
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTP 請求數", ["endpoint", "method", "status"])
+HTTP_SECONDS = REGISTRY.histogram("http_request_seconds", "HTTP 請求處理耗時（串流只計到開始響應）", ["endpoint"])
+
+def register_stats_metrics():
+    """各組件已維護的統計在抓取時讀取，不在熱路徑上重複計數"""
+    REGISTRY.gauge("stream_clients", "正在觀看視頻串流的客戶端數").set_function(
+        lambda: frame_broadcaster.stats()["clients"])
+    stream_frames = REGISTRY.counter("stream_frames_total", "串流畫面統計", ["stage"])
+    for stage in ("captured", "encoded", "sent"):
+        stream_frames.labels(stage=stage).set_function(
+            lambda stage=stage: frame_broadcaster.stats()[f"frames_{stage}"])
+    
+    REGISTRY.gauge("sessions_active", "當前會話數").set_function(lambda: session_manager.stats()["sessions"])
+    REGISTRY.gauge("sessions_recording", "正在錄製的會話數").set_function(
+        lambda: session_manager.stats()["recording"])
+    
+    REGISTRY.gauge("response_pipeline_in_flight", "正在生成的回應數").set_function(
+        lambda: response_pipeline.stats()["in_flight"])
+    responses = REGISTRY.counter("response_pipeline_total", "回應工作池統計", ["result"])
+    for result in ("submitted", "completed", "rejected"):
+        responses.labels(result=result).set_function(lambda result=result: response_pipeline.stats()[result])
+    
+    queue_depth = REGISTRY.gauge("transcription_queue_depth", "轉錄隊列中等待的事件數", ["queue"])
+    queue_events = REGISTRY.counter("transcription_queue_events_total", "轉錄隊列事件統計", ["queue", "result"])
+    for name, queue in (("text", speech_recognizer.text_queue), ("partial", speech_recognizer.partial_queue)):
+        queue_depth.labels(queue=name).set_function(queue.__len__)
+        for result in ("enqueued", "delivered", "dropped"):
+            queue_events.labels(queue=name, result=result).set_function(
+                lambda queue=queue, result=result: queue.stats()[result])
+    
+    if evaluation_collector is not None and evaluation_collector.writer is not None:
+        REGISTRY.gauge("evaluation_write_queue_depth", "評估數據後台寫入隊列深度").set_function(
+            lambda: evaluation_collector.get_writer_stats()["queue_depth"])
+        REGISTRY.counter("evaluation_writes_dropped_total", "隊列已滿而丟棄的評估數據寫入").set_function(
+            lambda: evaluation_collector.get_writer_stats()["dropped"])
+
+register_stats_metrics()
 
-# 全局變量
-current_scene = None
-recording_active = False
-recording_thread = None
-recording_lock = threading.Lock()
 # 防止重複語音處理
-last_processed_text = ""
-last_response_content = ""
-duplicate_count = 0
 MIN_TEXT_LENGTH = 5  # 最小有效文本長度
 MAX_DUPLICATES = 2   # 最多允許的重複次數
-last_process_time = 0
-MIN_PROCESS_INTERVAL = 3  # 最小處理間隔(秒)
+TRANSCRIPTION_WAIT_TIMEOUT = 0.5  # 等待轉錄事件的超時(秒)，用於及時響應停止錄製
 
 # 語言檢測
 FORBIDDEN_CHARACTERS = set("뉴스이덕영")
 
-# 存儲錄製會話的數據
-session_data = {
-    "scenes": [],       # 所有捕獲的場景
-    "transcriptions": [],  # 所有轉錄的語音
-    "timestamps": [],   # 每個場景和轉錄的時間戳
-    "temp_responses": []  # 暫時性分析回應
-}
+def get_client_session(create=True):
+    """獲取當前客戶端的會話，create=False 時不存在則返回None"""
+    session_manager.evict_idle()
+    
+    session_id = flask_session.get("session_id")
+    if session_id is None:
+        if not create:
+            return None
+        session_id = SessionManager.new_session_id()
+        flask_session["session_id"] = session_id
+    
+    if create:
+        return session_manager.get_or_create(session_id)
+    return session_manager.get(session_id)
+
+def record_evaluation(interaction, trace=None):
+    """將一次交互（附帶延遲記錄）交給評估數據收集器"""
+    if evaluation_collector is None:
+        return
+    if trace is not None:
+        interaction["latency"] = trace.spans()
+    try:
+        evaluation_collector.record_interaction(interaction)
+    except Exception as e:
+        print(f"記錄評估數據時出錯: {e}")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # 按路由模板而不是實際路徑分組，避免標籤數量無限增長
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(endpoint=endpoint, method=request.method, status=response.status_code).inc()
+    return response
+
+@app.before_request
+def start_request_trace():
+    if LATENCY_TRACING and not request.path.startswith(UNTRACED_PATHS):
+        g.latency_trace = LatencyTrace(request.path)
+        set_current_trace(g.latency_trace)
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("latency_trace", None)
+    if trace is not None:
+        trace.add_total("http_response", path=request.path, status=response.status_code)
+    # 停用延遲記錄時仍記錄評估數據，只是不附帶延遲
+    interaction = g.pop("evaluation_interaction", None)
+    if interaction is not None:
+        record_evaluation(interaction, trace)
+    return response
+
+@app.teardown_request
+def clear_request_trace(exc):
+    # 工作線程會被重用，請求結束時解除綁定
+    set_current_trace(None)
+
+@app.errorhandler(SessionLimitError)
+def handle_session_limit(e):
+    return jsonify({"error": f"伺服器忙碌: {str(e)}"}), 503
 
 @app.route('/')
 def index():
@@ -76,38 +289,97 @@ def index():
 
 @app.route('/api/start_recording', methods=['POST'])
 def start_recording():
-    global recording_active, recording_thread, session_data
-    
-    # 如果已經在錄製中，返回錯誤
-    if recording_active:
-        return jsonify({"error": "錄製已經在進行中"}), 400
-    
-    # 重置會話數據
-    session_data = {
-        "scenes": [],
-        "transcriptions": [],
-        "timestamps": [],
-        "temp_responses": []
-    }
-    last_processed_text = ""
-    duplicate_count = 0
-    last_process_time = 0
-    # 啟動錄製
-    recording_active = True
-    if hasattr(speech_recognizer, 'cleanup'):
-        speech_recognizer.cleanup()
-
-    speech_recognizer.set_vad_callbacks(
-        on_vad_start=lambda: print("語音活動開始"),
-        on_vad_stop=lambda: print("語音活動結束")
-    )
-    # 開始語音錄製線程
-    recording_thread = threading.Thread(target=continuous_speech_recording)
-    recording_thread.daemon = True
-    recording_thread.start()
+    session = get_client_session()
+    
+    with session.lock:
+        # 如果已經在錄製中，返回錯誤
+        if session.recording_active:
+            return jsonify({"error": "錄製已經在進行中"}), 400
+        
+        # 重置會話數據並啟動錄製
+        session.start()
+        session.speculator = create_speculator()
+        
+        # 開始本會話的語音處理線程
+        session.recording_thread = threading.Thread(target=continuous_speech_recording, args=(session,))
+        session.recording_thread.daemon = True
+        session.recording_thread.start()
+    
+    # 確保共享的語音識別器在錄音（語音識別器保持常駐，無需重新初始化）
+    start_speech_dispatch()
     
     return jsonify({"message": "開始錄製會話"})
 
+def start_speech_dispatch():
+    """開始錄音並啟動轉錄分發線程（線程已啟動時不重複）"""
+    global speech_dispatch_threads
+    with speech_dispatch_lock:
+        if not speech_dispatch_threads:
+            speech_recognizer.set_vad_callbacks(
+                on_vad_start=lambda: print("語音活動開始"),
+                on_vad_stop=lambda: print("語音活動結束")
+            )
+        
+        # 即使分發線程仍在運行也要恢復錄音: 上一次停止可能已暫停錄音器，而線程尚未在超時後退出
+        speech_recognizer.start_recording()
+        if speech_dispatch_threads:
+            return
+        
+        speech_dispatch_threads = [
+            threading.Thread(target=dispatch_speech_events,
+                             args=(speech_recognizer.get_transcription_event, deliver_transcription)),
+        ]
+        if SPECULATIVE_RESOLUTION:
+            speech_dispatch_threads.append(
+                threading.Thread(target=dispatch_speech_events,
+                                 args=(speech_recognizer.get_partial_event, deliver_partial))
+            )
+        for thread in speech_dispatch_threads:
+            thread.daemon = True
+            thread.start()
+
+def stop_speech_dispatch_if_idle():
+    """沒有會話在錄製時停止錄音，返回是否已停止"""
+    with speech_dispatch_lock:
+        if session_manager.recording_sessions():
+            return False
+        speech_recognizer.stop_recording()
+    print(f"轉錄隊列統計: {speech_recognizer.get_queue_stats()}")
+    return True
+
+def dispatch_speech_events(get_event, deliver):
+    """從共享語音識別器取出事件並分發給所有正在錄製的會話"""
+    while True:
+        sessions = session_manager.recording_sessions()
+        if not sessions:
+            # 在鎖內確認並退出，避免與新開始的錄製競爭
+            with speech_dispatch_lock:
+                if not session_manager.recording_sessions():
+                    speech_dispatch_threads.remove(threading.current_thread())
+                    if not speech_dispatch_threads:
+                        speech_recognizer.stop_recording()
+                    return
+            continue
+        
+        event = get_event(timeout=TRANSCRIPTION_WAIT_TIMEOUT)
+        if event is None:
+            continue
+        
+        for session in sessions:
+            if session.recording_active:
+                deliver(session, event)
+
+def deliver_transcription(session, event):
+    """將最終轉錄放入會話的事件隊列"""
+    if session.transcriptions is not None:
+        session.transcriptions.put(event["text"], timestamp=event["timestamp"], speech_end=event["speech_end"])
+
+def deliver_partial(session, event):
+    """將即時部分轉錄交給會話的推測解析器"""
+    session.touch()
+    if session.speculator is not None:
+        session.speculator.on_partial(event["text"])
+
 def is_valid_text(text):
     """檢查文本是否有效"""
     if not text or len(text.strip()) < MIN_TEXT_LENGTH:
@@ -120,82 +392,143 @@ def is_valid_text(text):
         
     return True
 
-def continuous_speech_recording():
-    """持續錄製和轉錄語音的後台線程"""
-    global recording_active, session_data, last_processed_text, duplicate_count, last_response_content, last_process_time
-    speech_recognizer.start_recording()
-    try:
-        while recording_active:
-            current_time = time.time()
+def get_pointed_segment(scene):
+    """根據最近的指向結果找出場景中被指向的區域段"""
+    if gesture_worker is None or scene is None:
+        return None
+    
+    pointing = gesture_worker.get_pointing()
+    if pointing is None:
+        return None
+    
+    return gesture_recognizer.find_pointed_segment(pointing["point"], scene)
+
+def continuous_speech_recording(session):
+    """處理一個會話的轉錄事件的後台線程"""
+    speculator = session.speculator
+    while session.recording_active:
+        # 阻塞等待下一個轉錄事件，無需輪詢
+        event = session.transcriptions.get(timeout=TRANSCRIPTION_WAIT_TIMEOUT)
+        if event is None:
+            continue
+        # 語音活動也算會話活躍，避免只靠HTTP請求刷新而淘汰正在使用的會話
+        session.touch()
+        
+        transcription = event["text"]
+        current_time = event["timestamp"]
+        speech_end = event["speech_end"]
+        trace = LatencyTrace("speech") if LATENCY_TRACING else None
+        if trace is not None:
+            # 語音結束到轉錄入隊（識別）和入隊到開始處理（排隊）
+            trace.add_between("transcribe", speech_end, current_time)
+            trace.add_since("transcription_queue", current_time)
+        
+        # 檢查文本是否有效
+        if not is_valid_text(transcription):
+            if speculator is not None:
+                speculator.reset()
+            continue
+        
+        # 確認或丟棄推測解析的結果（在鎖外等待）
+        speculation = speculator.confirm(transcription) if speculator is not None else None
+        
+        # 在短暫持有的會話鎖內更新狀態並取得快照
+        with session.lock:
+            session_data = session.data
             
-            # 控制處理頻率 - 至少間隔1.5秒
-            if current_time - last_process_time < MIN_PROCESS_INTERVAL:
-                time.sleep(0.1)  # 短暫睡眠以減少CPU使用
-                continue
-                
-            # 直接從 RealtimeSTT 獲取轉錄文本（無需模擬音頻處理）
-            with recording_lock:
-                transcription = speech_recognizer.get_latest_transcription()
-                
-                # 檢查文本是否有效
-                if not is_valid_text(transcription):
+            # 檢查重複
+            if transcription.strip() == session.last_processed_text:
+                session.duplicate_count += 1
+                if session.duplicate_count > MAX_DUPLICATES:
+                    print(f"忽略重複文本 ({session.duplicate_count}): {transcription}")
                     continue
-                
-                # 檢查重複
-                if transcription.strip() == last_processed_text:
-                    duplicate_count += 1
-                    if duplicate_count > MAX_DUPLICATES:
-                        print(f"忽略重複文本 ({duplicate_count}): {transcription}")
-                        continue
-                else:
-                    # 新文本，重置計數器
-                    last_processed_text = transcription.strip()
-                    duplicate_count = 0
-                
-                print(f"\n[用戶] {transcription}")
-                
-                # 更新處理時間戳
-                last_process_time = time.time()
-                
-                # 添加到會話數據
-                session_data["transcriptions"].append(transcription)
-                session_data["timestamps"].append(current_time)
-                
-                # 如果有場景和轉錄，嘗試進行即時分析
-                if len(session_data["scenes"]) > 0:
-                    latest_scene = session_data["scenes"][-1]
-                    try:
-                        # 生成實時回應
-                        response = reference_resolver.generate_response(transcription, latest_scene)
-                        if response:
-                            # 檢查回應是否與上次相同
-                            if response["content"] == last_response_content:
-                                print("忽略重複回應")
-                                continue
-                                
-                            last_response_content = response["content"]
-                            
-                            session_data["temp_responses"].append({
-                                "content": response["content"],
-                                "type": response["type"],
-                                "timestamp": current_time,
-                                "segment": response.get("segment", None)
-                            })
-                    except Exception as e:
-                        print(f"實時分析錯誤: {e}")
+            else:
+                # 新文本，重置計數器
+                session.last_processed_text = transcription.strip()
+                session.duplicate_count = 0
             
-            # 適當休眠以減少CPU使用
-            time.sleep(0.2)
-    finally:
-        # 確保錄音停止
-        speech_recognizer.stop_recording()
+            print(f"\n[用戶 {session.session_id[:8]}] {transcription} (#{event['seq']}, 排隊 {time.time() - current_time:.3f}s)")
+            
+            # 添加到會話數據
+            session_data["transcriptions"].append(transcription)
+            session_data["timestamps"].append(current_time)
+            
+            # 優先使用已確認的推測結果（區域為None時只重用推測捕獲的場景），否則使用最新捕獲的場景
+            latest_scene = None
+            resolved_segment = None
+            if speculation is not None:
+                latest_scene = speculation["scene"]
+                resolved_segment = speculation["segment"]
+                print("使用已確認的推測解析結果" if resolved_segment is not None else "重用推測捕獲的場景")
+            elif len(session_data["scenes"]) > 0:
+                latest_scene = session_data["scenes"][-1]
+            
+            # 如果沒有場景，只記錄轉錄
+            if latest_scene is None:
+                continue
+            ticket = session.reserve_response_seq()
+        
+        # 在工作池中生成實時回應，不阻塞場景捕獲
+        response_pipeline.submit(
+            session,
+            ticket,
+            functools.partial(generate_live_response, transcription, latest_scene, resolved_segment, trace=trace),
+            functools.partial(publish_response, timestamp=current_time, text=transcription,
+                              scene=latest_scene, trace=trace, speech_end=speech_end)
+        )
+
+def generate_live_response(transcription, scene, resolved_segment=None, trace=None):
+    """為一條轉錄生成實時回應（在工作池中執行）"""
+    with activate(trace):
+        return reference_resolver.generate_response(
+            transcription,
+            scene,
+            pointed_segment=get_pointed_segment(scene),
+            resolved_segment=resolved_segment
+        )
+
+def publish_response(session, response, timestamp, text=None, scene=None, trace=None, speech_end=None):
+    """發布一條實時回應（由工作池在持有會話鎖時按順序調用）
+
+    只更新會話狀態；返回的函數在釋放會話鎖後記錄評估數據（事件日誌寫入、特徵追加）
+    """
+    session.touch()
+    if trace is not None:
+        # 從語音結束（錄音器的語音活動結束時間）到回應可供前端讀取的總時間
+        trace.add_since("speech_to_answer", speech_end if speech_end is not None else timestamp)
+    
+    # 檢查回應是否與上次相同
+    if response["content"] == session.last_response_content:
+        print("忽略重複回應")
+        return
+    
+    session.last_response_content = response["content"]
+    session.data["temp_responses"].append({
+        "content": response["content"],
+        "type": response["type"],
+        "timestamp": timestamp,
+        "segment": response.get("segment", None)
+    })
+    
+    segment = response.get("segment")
+    interaction = {
+        "type": "speech",
+        "text": text,
+        "response": response["content"],
+        "response_type": response["type"],
+        "segment_position": segment["position"] if segment else None
+    }
+    if scene is not None:
+        interaction["frame"] = scene["frame"]
+        interaction["scene_segments"] = scene["segments"]
+    return functools.partial(record_evaluation, interaction, trace)
 
 @app.route('/api/capture_and_process', methods=['POST'])
 def capture_and_process():
-    global recording_active, session_data, current_scene
+    session = get_client_session(create=False)
     
     # 如果未處於錄製狀態，返回錯誤
-    if not recording_active:
+    if session is None or not session.recording_active:
         return jsonify({"error": "尚未開始錄製"}), 400
     
     # 捕獲當前場景
@@ -204,36 +537,43 @@ def capture_and_process():
     if current_scene is None:
         return jsonify({"error": "無法捕獲場景"}), 400
     
-    # 將場景添加到會話數據
-    with recording_lock:
-        session_data["scenes"].append(current_scene)
-        session_data["timestamps"].append(time.time())
-    
-    # 將幀編碼為BASE64以便在前端顯示
-    _, buffer = cv2.imencode('.jpg', current_scene["frame"])
-    frame_base64 = base64.b64encode(buffer).decode('utf-8')
-    
-    # 準備分段預覽
-    segments_preview = []
-    for i, segment in enumerate(current_scene["segments"]):
-        _, buffer = cv2.imencode('.jpg', segment["image"])
-        segment_base64 = base64.b64encode(buffer).decode('utf-8')
-        segments_preview.append({
-            "id": i,
-            "position": segment["position"],
-            "image": segment_base64
-        })
+    # 在場景畫面上檢測指向手勢
+    if gesture_worker is not None:
+        gesture_worker.submit_frame(current_scene["frame"], force=True)
     
-    # 獲取最新轉錄（如果有）
-    latest_transcription = None
-    if session_data["transcriptions"]:
-        latest_transcription = session_data["transcriptions"][-1]
+    # 將場景添加到會話數據，並在鎖內取得最新轉錄和回應的快照
+    with session.lock:
+        session.add_scene(current_scene)
+        session_data = session.data
+        latest_transcription = session_data["transcriptions"][-1] if session_data["transcriptions"] else None
+        latest_resp = session_data["temp_responses"][-1] if session_data["temp_responses"] else None
+    
+    with span("jpeg_encode", images=len(current_scene["segments"]) + 1):
+        # 將幀編碼為BASE64以便在前端顯示
+        _, buffer = cv2.imencode('.jpg', current_scene["frame"])
+        frame_base64 = base64.b64encode(buffer).decode('utf-8')
+        
+        # 準備分段預覽
+        segments_preview = []
+        for i, segment in enumerate(current_scene["segments"]):
+            _, buffer = cv2.imencode('.jpg', segment["image"])
+            segment_base64 = base64.b64encode(buffer).decode('utf-8')
+            segments_preview.append({
+                "id": i,
+                "position": segment["position"],
+                "image": segment_base64
+            })
+    
+    g.evaluation_interaction = {
+        "type": "capture",
+        "segments": len(current_scene["segments"]),
+        "scene_segments": current_scene["segments"]
+    }
     
     # 獲取最新臨時響應（如果有）
     latest_temp_response = None
     latest_referenced_segment = None
-    if session_data["temp_responses"]:
-        latest_resp = session_data["temp_responses"][-1]
+    if latest_resp:
         latest_temp_response = latest_resp["content"]
         if latest_resp["segment"]:
             latest_referenced_segment = {"position": latest_resp["segment"]["position"]}
@@ -248,18 +588,26 @@ def capture_and_process():
 
 @app.route('/api/stop_recording', methods=['POST'])
 def stop_recording():
-    global recording_active, recording_thread, session_data
+    session = get_client_session(create=False)
     
     # 如果未在錄製，返回錯誤
-    if not recording_active:
+    if session is None or not session.recording_active:
         return jsonify({"error": "尚未開始錄製"}), 400
     
-    # 停止錄製
-    recording_active = False
-    speech_recognizer.stop_recording()
+    # 停止本會話的錄製，沒有其他會話在錄製時停止錄音
+    recording_thread = session.stop()
+    stop_speech_dispatch_if_idle()
+    
     # 等待錄製線程結束
     if recording_thread and recording_thread.is_alive():
         recording_thread.join(timeout=2)
+    if session.speculator is not None:
+        print(f"推測解析統計: {session.speculator.stats()}")
+    print(f"回應工作池統計: {response_pipeline.stats()}")
+    
+    with session.lock:
+        session_data = session.data
+        scene_count = session.scene_count
     
     # 如果沒有收集到任何數據，返回錯誤
     if not session_data["scenes"]:
@@ -267,7 +615,7 @@ def stop_recording():
     
     # 進行整體分析
     try:
-        final_summary = generate_session_summary(session_data)
+        final_summary = generate_session_summary(session_data, scene_count=scene_count)
         return jsonify({
             "summary": final_summary,
             "message": "錄製已停止並完成分析"
@@ -275,7 +623,7 @@ def stop_recording():
     except Exception as e:
         return jsonify({"error": f"生成分析時出錯: {str(e)}"}), 500
 
-def generate_session_summary(session_data):
+def generate_session_summary(session_data, scene_count=None):
     """生成整個會話的摘要分析"""
     # 如果沒有場景或轉錄，返回簡單消息
     if not session_data["scenes"] or not session_data["transcriptions"]:
@@ -290,7 +638,7 @@ def generate_session_summary(session_data):
     # 向參照解析器提供更豐富的上下文
     context = {
         "full_transcription": all_transcriptions,
-        "scene_count": len(session_data["scenes"]),
+        "scene_count": scene_count if scene_count is not None else len(session_data["scenes"]),
         "duration": session_data["timestamps"][-1] - session_data["timestamps"][0] if len(session_data["timestamps"]) > 1 else 0
     }
     
@@ -307,21 +655,33 @@ def generate_session_summary(session_data):
 @app.route('/api/video_stream')
 def video_stream():
     """即時視頻串流"""
+    # 是否在串流畫面上疊加指向標記
+    show_overlay = request.args.get('pointing', '1') != '0'
+    
     def generate_frames():
-        while True:
-            frame = vision_encoder.capture_frame()
-            if frame is not None:
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            time.sleep(0.033)  # ~30 FPS
-    
-    from flask import Response
+        for data in frame_broadcaster.frames(overlay=show_overlay, max_duration=STREAM_MAX_DURATION):
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + data + b'\r\n')
+    
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/api/stream_stats')
+def stream_stats():
+    """串流與會話統計，用於測量並發觀看時的吞吐量"""
+    return jsonify({
+        "stream": frame_broadcaster.stats(),
+        "sessions": session_manager.stats(),
+        "responses": response_pipeline.stats()
+    })
+
+@app.route('/api/metrics')
+def metrics():
+    """Prometheus 文本格式的性能指標"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/process_text', methods=['POST'])
 def process_text():
-    global current_scene, last_processed_text, last_response_content
+    session = get_client_session()
     
     # 獲取文本輸入
     data = request.get_json()
@@ -330,21 +690,27 @@ def process_text():
     if not text:
         return jsonify({"error": "文本不能為空"}), 400
     
-    if text.strip() == last_processed_text:
-        return jsonify({"error": "請勿重複提交相同文本"}), 400
-    # 如果當前沒有場景，使用最近錄製的場景（如果有）
-    scene_to_use = current_scene
-    if scene_to_use is None and session_data["scenes"]:
-        scene_to_use = session_data["scenes"][-1]
+    with session.lock:
+        if text.strip() == session.last_processed_text:
+            return jsonify({"error": "請勿重複提交相同文本"}), 400
+        # 如果當前沒有場景，使用最近錄製的場景（如果有）
+        scene_to_use = session.current_scene
+        if scene_to_use is None and session.data["scenes"]:
+            scene_to_use = session.data["scenes"][-1]
     
     if scene_to_use is None:
         return jsonify({"error": "請先捕獲場景或開始錄製"}), 400
     
     # 處理參照並生成回應
-    response = reference_resolver.generate_response(text, scene_to_use)
+    response = reference_resolver.generate_response(
+        text,
+        scene_to_use,
+        pointed_segment=get_pointed_segment(scene_to_use)
+    )
 
     if response:
-        last_response_content = response["content"]
+        with session.lock:
+            session.last_response_content = response["content"]
     
     # 準備響應
     result = {
@@ -356,8 +722,9 @@ def process_text():
     # 如果是參照響應，添加參照區域的信息
     if response["type"] == "reference_response" and "segment" in response:
         segment = response["segment"]
-        _, buffer = cv2.imencode('.jpg', segment["image"])
-        segment_base64 = base64.b64encode(buffer).decode('utf-8')
+        with span("jpeg_encode", images=1):
+            _, buffer = cv2.imencode('.jpg', segment["image"])
+            segment_base64 = base64.b64encode(buffer).decode('utf-8')
         
         result["referenced_segment"] = {
             "position": segment["position"],
@@ -365,10 +732,44 @@ def process_text():
             "image": segment_base64
         }
     
+    g.evaluation_interaction = {
+        "type": "text",
+        "text": text,
+        "response": response["content"],
+        "response_type": response["type"],
+        "segment_position": response["segment"]["position"] if "segment" in response else None,
+        "frame": scene_to_use["frame"],
+        "scene_segments": scene_to_use["segments"]
+    }
+    
     return jsonify(result)
 
+def shutdown():
+    """優雅關閉: 停止所有會話和後台線程，釋放攝像頭和錄音器（可重複調用）"""
+    if shutdown_event.is_set():
+        return
+    shutdown_event.set()
+    print("正在關閉服務...")
+    
+    for session in session_manager.sessions():
+        session_manager.remove(session.session_id)
+    frame_broadcaster.stop()
+    response_pipeline.shutdown()
+    if gesture_worker is not None:
+        gesture_worker.stop()
+    speech_recognizer.cleanup()
+    vision_encoder.release()
+    if evaluation_collector is not None:
+        evaluation_collector.close()
+    print("資源已釋放")
+
 if __name__ == '__main__':
-    try:
-        app.run(debug=True)
-    finally:
-        vision_encoder.release()
\ No newline at end of file
+    if "--dev" in sys.argv:
+        # 開發模式: Flask 開發伺服器，不使用重載器以免重複加載模型
+        try:
+            app.run(debug=True, use_reloader=False, threaded=True)
+        finally:
+            shutdown()
+    else:
+        from serve import run_server
+        run_server(app, on_shutdown=shutdown)
@@ -0,0 +1,185 @@
+# embedding_store.py - 評估會話的區域特徵列式存儲
+"""
+每個會話目錄下的 embeddings/ 保存錄製時計算的 CLIP 區域特徵，離線分析無需重新編碼:
+
+- features.f16   float16 特徵矩陣，每行一個區域，按行連續追加 (N, dim)
+- segments.bin   與特徵逐行對應的定長元數據記錄 (SEGMENT_DTYPE)
+- manifest.json  特徵維度和數據類型
+
+兩個文件都是無文件頭的小端數組，記錄時只需追加，讀取時用 np.memmap 按需映射，
+不會把整個會話加載到記憶體；行數由文件大小決定，進程崩潰時末尾寫了一半的行會被忽略。
+交互記錄中的 "embedding_rows": [start, count] 指向該交互場景的區域行。
+"""
+
+import json
+import os
+
+import numpy as np
+
+EMBEDDINGS_DIR = "embeddings"
+FEATURES_FILE = "features.f16"
+METADATA_FILE = "segments.bin"
+MANIFEST_FILE = "manifest.json"
+
+FEATURE_DTYPE = np.dtype("<f2")
+
+# 每個區域的元數據: 所屬場景、首次記錄該場景的交互、時間戳、網格位置和像素坐標
+SEGMENT_DTYPE = np.dtype([
+    ("scene_id", "<u4"),
+    ("interaction_id", "<i4"),
+    ("timestamp", "<f8"),
+    ("row", "<i2"),
+    ("col", "<i2"),
+    ("x1", "<u2"),
+    ("y1", "<u2"),
+    ("x2", "<u2"),
+    ("y2", "<u2")
+])
+
+
+class EmbeddingWriter:
+    """向會話的 embeddings/ 追加場景的區域特徵（調用方負責加鎖）"""
+
+    def __init__(self, session_dir):
+        self.directory = os.path.join(session_dir, EMBEDDINGS_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.dim = None
+        self.rows = 0
+        self.scenes = 0
+        self._features = open(os.path.join(self.directory, FEATURES_FILE), 'ab')
+        self._metadata = open(os.path.join(self.directory, METADATA_FILE), 'ab')
+        self._last_segments = None
+        self._last_rows = None
+
+    def append_scene(self, segments, timestamp, interaction_id=-1):
+        """追加一個場景的所有區域，返回 [起始行, 行數]
+
+        同一個場景（同一個 segments 列表）連續記錄多次時只保存一次，返回相同的行
+        """
+        if segments is self._last_segments:
+            return self._last_rows
+        if not segments:
+            return None
+
+        features = np.concatenate([np.asarray(s["features"]).reshape(1, -1) for s in segments])
+        if self.dim is None:
+            self.dim = features.shape[1]
+            self._write_manifest()
+        elif features.shape[1] != self.dim:
+            raise ValueError(f"特徵維度 {features.shape[1]} 與已保存的 {self.dim} 不一致")
+
+        metadata = np.zeros(len(segments), dtype=SEGMENT_DTYPE)
+        metadata["scene_id"] = self.scenes
+        metadata["interaction_id"] = interaction_id
+        metadata["timestamp"] = timestamp
+        for k, segment in enumerate(segments):
+            metadata["row"][k], metadata["col"][k] = segment["position"]
+            metadata["x1"][k], metadata["y1"][k], metadata["x2"][k], metadata["y2"][k] = segment["coordinates"]
+
+        self._features.write(features.astype(FEATURE_DTYPE).tobytes())
+        self._metadata.write(metadata.tobytes())
+
+        rows = [self.rows, len(segments)]
+        self.rows += len(segments)
+        self.scenes += 1
+        self._last_segments = segments
+        self._last_rows = rows
+        return rows
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({
+                "dim": self.dim,
+                "feature_dtype": FEATURE_DTYPE.str,
+                "segment_dtype": SEGMENT_DTYPE.descr
+            }, f)
+        os.replace(path + ".tmp", path)
+
+    def flush(self, fsync=False):
+        for f in (self._features, self._metadata):
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+    def close(self):
+        if self._features.closed:
+            return
+        self.flush(fsync=True)
+        self._features.close()
+        self._metadata.close()
+        self._last_segments = None
+
+
+class SessionEmbeddings:
+    """一個會話的區域特徵和元數據（記憶體映射，只讀）"""
+
+    def __init__(self, session_dir):
+        self.directory = os.path.join(session_dir, EMBEDDINGS_DIR)
+        with open(os.path.join(self.directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.dim = manifest["dim"]
+        feature_dtype = np.dtype(manifest["feature_dtype"])
+
+        features_path = os.path.join(self.directory, FEATURES_FILE)
+        metadata_path = os.path.join(self.directory, METADATA_FILE)
+        self.count = min(os.path.getsize(features_path) // (feature_dtype.itemsize * self.dim),
+                         os.path.getsize(metadata_path) // SEGMENT_DTYPE.itemsize)
+
+        # 空文件不能映射
+        if self.count:
+            self.features = np.memmap(features_path, dtype=feature_dtype, mode='r', shape=(self.count, self.dim))
+            self.metadata = np.memmap(metadata_path, dtype=SEGMENT_DTYPE, mode='r', shape=(self.count,))
+        else:
+            self.features = np.empty((0, self.dim), dtype=feature_dtype)
+            self.metadata = np.empty(0, dtype=SEGMENT_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    def scene_rows(self, scene_id):
+        """某個場景的行範圍（場景按追加順序編號，元數據按 scene_id 有序）"""
+        scene_ids = self.metadata["scene_id"]
+        start = int(np.searchsorted(scene_ids, scene_id, side="left"))
+        end = int(np.searchsorted(scene_ids, scene_id, side="right"))
+        return start, end - start
+
+    def segments(self, rows, frame=None):
+        """將 [起始行, 行數] 還原為 VisionEncoder.describe_frame 格式的區域列表
+
+        特徵轉為 float32，形狀 (1, dim)；提供 frame 時附帶裁剪出的區域圖像
+        """
+        start, count = rows
+        features = np.asarray(self.features[start:start + count], dtype=np.float32)
+        segments = []
+        for k, record in enumerate(self.metadata[start:start + count]):
+            coordinates = (int(record["x1"]), int(record["y1"]), int(record["x2"]), int(record["y2"]))
+            segment = {
+                "features": features[k:k + 1],
+                "position": (int(record["row"]), int(record["col"])),
+                "coordinates": coordinates
+            }
+            if frame is not None:
+                x1, y1, x2, y2 = coordinates
+                segment["image"] = frame[y1:y2, x1:x2]
+            segments.append(segment)
+        return segments
+
+
+def load_session_embeddings(session_dir):
+    """加載一個會話的區域特徵，沒有保存特徵時返回None"""
+    if not os.path.exists(os.path.join(session_dir, EMBEDDINGS_DIR, MANIFEST_FILE)):
+        return None
+    return SessionEmbeddings(session_dir)
+
+
+def iter_session_embeddings(base_dir="evaluation_data"):
+    """依次產生 (會話目錄, SessionEmbeddings)，每次只映射一個會話"""
+    if not os.path.isdir(base_dir):
+        return
+    with os.scandir(base_dir) as entries:
+        paths = sorted(entry.path for entry in entries if entry.is_dir())
+    for path in paths:
+        embeddings = load_session_embeddings(path)
+        if embeddings is not None and len(embeddings):
+            yield path, embeddings
@@ -1,98 +1,503 @@
+import argparse
 import json
+import math
 import os
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from evaluation_collector import load_session_data, EVENT_LOG_NAME, DATA_FILE_NAME
+from latency_trace import stage_key
+
+# 增量摘要索引: 每個會話的聚合結果，以數據文件的 mtime/size 為鍵
+INDEX_FILE_NAME = "summary_index.json"
+# 聚合格式變化時遞增，使舊索引失效
+INDEX_VERSION = 2
+# 延遲直方圖: 對數分桶（約 5% 誤差），可跨會話合併
+LATENCY_BUCKET_BASE = 1e-4   # 第 0 桶的上界(秒)
+LATENCY_BUCKET_RATIO = 1.05
+LATENCY_PERCENTILES = (50, 95, 99)
+# 待處理會話少於此數時不啟動進程池
+MIN_PARALLEL_SESSIONS = 16
+
+def iter_session_dirs(base_dir="evaluation_data"):
+    """逐個產出會話目錄路徑"""
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                yield entry.path
+
+def iter_evaluation_data(base_dir="evaluation_data"):
+    """逐個產出會話數據，不一次性加載全部會話"""
+    for session_path in iter_session_dirs(base_dir):
+        # 事件日誌比 data.json 新時從日誌重建
+        data = load_session_data(session_path)
+        if data is not None:
+            yield data
 
 def load_evaluation_data(base_dir="evaluation_data"):
     """加載所有評估數據"""
-    all_data = []
+    return list(iter_evaluation_data(base_dir))
+
+def classify_reference(ref_text):
+    """根據參照文本判斷參照類型"""
+    ref_text = ref_text.lower()
+    if "左" in ref_text or "右" in ref_text or "上" in ref_text or "下" in ref_text:
+        return "位置參照"
+    elif "紅" in ref_text or "藍" in ref_text or "綠" in ref_text or "黃" in ref_text:
+        return "特性參照"
+    elif "這" in ref_text or "那" in ref_text:
+        return "簡單指示詞"
+    return "其他參照"
+
+def latency_bucket(duration):
+    """延遲所在的直方圖桶"""
+    if duration <= LATENCY_BUCKET_BASE:
+        return 0
+    return math.ceil(math.log(duration / LATENCY_BUCKET_BASE) / math.log(LATENCY_BUCKET_RATIO))
+
+def histogram_percentile(histogram, percentile):
+    """從直方圖估算百分位數（返回所在桶的上界，秒）"""
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    target = total * percentile / 100
+    cumulative = 0
+    for bucket in sorted(histogram):
+        cumulative += histogram[bucket]
+        if cumulative >= target:
+            return LATENCY_BUCKET_BASE * LATENCY_BUCKET_RATIO ** bucket
+    return None
+
+def summarize_session(session_data):
+    """將一個會話聚合為可合併的摘要（可 JSON 序列化）"""
+    references = 0
+    successes = 0
+    reference_types = Counter()
+    satisfaction = Counter()
+    latency = {}
     
-    # 遍歷所有會話目錄
-    for session_dir in os.listdir(base_dir):
-        session_path = os.path.join(base_dir, session_dir)
-        if not os.path.isdir(session_path):
-            continue
+    for interaction in session_data["interactions"]:
+        for record in interaction.get("latency", []):
+            histogram = latency.setdefault(stage_key(record), Counter())
+            histogram[latency_bucket(record["duration"])] += 1
         
-        # 加載數據
-        data_path = os.path.join(session_path, "data.json")
-        if not os.path.exists(data_path):
-            continue
+        for resolution in interaction.get("reference_resolution", []):
+            references += 1
+            successes += 1 if resolution["success"] else 0
+            reference_types[classify_reference(resolution["reference_text"])] += 1
         
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            all_data.append(data)
+        if "user_feedback" in interaction:
+            satisfaction[interaction["user_feedback"]["satisfaction_score"]] += 1
     
-    return all_data
+    return {
+        "interactions": len(session_data["interactions"]),
+        "references": references,
+        "successes": successes,
+        "reference_types": dict(reference_types),
+        # 評分可能是整數或浮點數，保存為 [評分, 數量] 對以保留類型
+        "satisfaction": [[score, count] for score, count in satisfaction.items()],
+        # JSON 的鍵只能是字符串，桶號保存為 [桶, 數量] 對
+        "latency": {stage: sorted(histogram.items()) for stage, histogram in latency.items()}
+    }
+
+def merge_summaries(summaries):
+    """合併多個會話摘要"""
+    total = {
+        "sessions": 0,
+        "interactions": 0,
+        "references": 0,
+        "successes": 0,
+        "reference_types": Counter(),
+        "satisfaction": Counter(),
+        "latency": {}
+    }
+    for summary in summaries:
+        total["sessions"] += 1
+        total["interactions"] += summary["interactions"]
+        total["references"] += summary["references"]
+        total["successes"] += summary["successes"]
+        total["reference_types"].update(summary["reference_types"])
+        for score, count in summary["satisfaction"]:
+            total["satisfaction"][score] += count
+        for stage, buckets in summary["latency"].items():
+            histogram = total["latency"].setdefault(stage, Counter())
+            for bucket, count in buckets:
+                histogram[bucket] += count
+    return total
 
 def analyze_reference_resolution(all_data):
-    """分析參照解析性能"""
-    resolution_results = []
-    reference_types = Counter()
-    
-    for session_data in all_data:
-        for interaction in session_data["interactions"]:
-            if "reference_resolution" not in interaction:
-                continue
-            
-            for resolution in interaction["reference_resolution"]:
-                resolution_results.append(resolution["success"])
-                
-                # 提取參照類型（假設參照文本包含類型信息）
-                ref_text = resolution["reference_text"].lower()
-                if "左" in ref_text or "右" in ref_text or "上" in ref_text or "下" in ref_text:
-                    reference_types["位置參照"] += 1
-                elif "紅" in ref_text or "藍" in ref_text or "綠" in ref_text or "黃" in ref_text:
-                    reference_types["特性參照"] += 1
-                elif "這" in ref_text or "那" in ref_text:
-                    reference_types["簡單指示詞"] += 1
-                else:
-                    reference_types["其他參照"] += 1
-    
+    """分析參照解析性能（all_data 可以是任意會話數據的迭代器）"""
+    return reference_report(merge_summaries(summarize_session(data) for data in all_data))
+
+def analyze_user_satisfaction(all_data):
+    """分析用戶滿意度（all_data 可以是任意會話數據的迭代器）"""
+    return satisfaction_report(merge_summaries(summarize_session(data) for data in all_data))
+
+def reference_report(total):
+    """從合併摘要計算參照解析指標"""
     # 計算總體成功率
-    success_rate = np.mean(resolution_results) if resolution_results else 0
+    success_rate = total["successes"] / total["references"] if total["references"] else 0
     
     return {
         "success_rate": success_rate,
-        "total_references": len(resolution_results),
-        "reference_types": dict(reference_types)
+        "total_references": total["references"],
+        "reference_types": dict(total["reference_types"])
     }
 
-def analyze_user_satisfaction(all_data):
-    """分析用戶滿意度"""
-    satisfaction_scores = []
-    
-    for session_data in all_data:
-        for interaction in session_data["interactions"]:
-            if "user_feedback" not in interaction:
-                continue
-            
-            feedback = interaction["user_feedback"]
-            satisfaction_scores.append(feedback["satisfaction_score"])
+def satisfaction_report(total):
+    """從合併摘要計算用戶滿意度指標"""
+    score_distribution = total["satisfaction"]
+    total_feedbacks = sum(score_distribution.values())
     
     # 計算平均滿意度
-    avg_satisfaction = np.mean(satisfaction_scores) if satisfaction_scores else 0
+    avg_satisfaction = (sum(score * count for score, count in score_distribution.items()) / total_feedbacks
+                        if total_feedbacks else 0)
     
     return {
         "average_satisfaction": avg_satisfaction,
-        "total_feedbacks": len(satisfaction_scores),
-        "score_distribution": Counter(satisfaction_scores)
+        "total_feedbacks": total_feedbacks,
+        "score_distribution": score_distribution
     }
 
-def generate_evaluation_report():
+def latency_report(total):
+    """從合併摘要計算各階段的延遲百分位數(秒)"""
+    report = {}
+    for stage, histogram in sorted(total["latency"].items()):
+        stage_report = {"count": sum(histogram.values())}
+        for percentile in LATENCY_PERCENTILES:
+            stage_report[f"p{percentile}"] = histogram_percentile(histogram, percentile)
+        report[stage] = stage_report
+    return report
+
+def analyze_latency(all_data):
+    """分析各階段延遲（all_data 可以是任意會話數據的迭代器）"""
+    return latency_report(merge_summaries(summarize_session(data) for data in all_data))
+
+def session_signature(session_path):
+    """會話數據文件的 (文件名, mtime, size) 列表，文件變化時簽名隨之變化"""
+    signature = []
+    for name in (DATA_FILE_NAME, EVENT_LOG_NAME):
+        try:
+            stat = os.stat(os.path.join(session_path, name))
+        except FileNotFoundError:
+            continue
+        signature.append([name, stat.st_mtime_ns, stat.st_size])
+    return signature
+
+def _summarize_session_path(session_path):
+    """進程池工作函數: 加載並聚合一個會話"""
+    data = load_session_data(session_path)
+    return summarize_session(data) if data is not None else None
+
+def load_summary_index(index_path):
+    """加載摘要索引，版本不符或損壞時返回空索引"""
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("sessions", {})
+
+def save_summary_index(index_path, sessions):
+    """原子地保存摘要索引"""
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": INDEX_VERSION, "sessions": sessions}, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+def build_session_summaries(base_dir="evaluation_data", workers=None, rebuild=False):
+    """更新增量摘要索引並返回所有會話的摘要
+
+    只有新增或數據文件變化的會話會被重新加載，並在進程池中並行聚合；
+    已刪除的會話從索引中移除
+    """
+    index_path = os.path.join(base_dir, INDEX_FILE_NAME)
+    cached = {} if rebuild else load_summary_index(index_path)
+    
+    sessions = {}
+    stale = []
+    for session_path in iter_session_dirs(base_dir):
+        name = os.path.basename(session_path)
+        signature = session_signature(session_path)
+        if not signature:
+            continue
+        entry = cached.get(name)
+        if entry is not None and entry["signature"] == signature:
+            sessions[name] = entry
+        else:
+            stale.append((name, session_path, signature))
+    
+    if stale:
+        paths = [session_path for _, session_path, _ in stale]
+        if len(stale) < MIN_PARALLEL_SESSIONS or workers == 1:
+            results = list(map(_summarize_session_path, paths))
+        else:
+            chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_summarize_session_path, paths, chunksize=chunksize))
+        
+        for (name, _, signature), summary in zip(stale, results):
+            if summary is not None:
+                sessions[name] = {"signature": signature, "summary": summary}
+    
+    if stale or len(sessions) != len(cached):
+        save_summary_index(index_path, sessions)
+    
+    print(f"會話: {len(sessions)} 個 (重新聚合 {len(stale)} 個)")
+    return [entry["summary"] for entry in sessions.values()]
+
+STRATEGIES = ("remote", "fused", "clip", "clip_refined", "tags", "colour", "cue", "pointing")
+
+def collect_reference_cases(base_dir="evaluation_data", include_unverified=False, limit=None):
+    """收集有畫面的參照案例，按畫面分組: [(畫面路徑, [案例...]), ...]
+
+    默認只使用錄製時標記為成功的參照解析記錄（其位置作為標準答案）；
+    include_unverified 時也使用未標記的記錄和 app 記錄的文本/語音交互（衡量與錄製結果的一致性）
+    """
+    from session_replay import frame_path
+    
+    groups = []
+    count = 0
+    for session_path in iter_session_dirs(base_dir):
+        data = load_session_data(session_path)
+        if data is None:
+            continue
+        for interaction in data["interactions"]:
+            if not interaction.get("frame"):
+                continue
+            cases = []
+            for record in interaction.get("reference_resolution", []):
+                if record["segment_position"] is None:
+                    continue
+                if record.get("success") or include_unverified:
+                    cases.append({"text": record["reference_text"], "expected": list(record["segment_position"])})
+            if include_unverified and interaction.get("text") and interaction.get("segment_position"):
+                cases.append({"text": interaction["text"], "expected": list(interaction["segment_position"])})
+            if not cases:
+                continue
+            if limit is not None and count + len(cases) > limit:
+                cases = cases[:limit - count]
+            groups.append((frame_path(session_path, interaction), cases))
+            count += len(cases)
+            if limit is not None and count >= limit:
+                return groups
+    return groups
+
+def create_strategies(names, encoder):
+    """創建參照解析策略，每個策略為 f(場景, 畫面, 文本) -> 區域段或None（None 表示放棄）"""
+    from reference_resolver import (ReferenceResolver, CueReferenceResolver, ClipReferenceResolver,
+                                    HierarchicalRefiner, TagReferenceResolver, extract_reference_cues,
+                                    parse_reference_text)
+    strategies = {}
+    
+    # 詞彙: tags 直接使用其文本特徵，clip/clip_refined 用它把中文參照轉為英文提示後編碼
+    # （CLIP 文本編碼器只理解英文）；三者在參照中沒有詞彙中的詞時都放棄，覆蓋率相同，準確率可直接比較
+    vocabulary = None
+    if "clip" in names or "clip_refined" in names or "tags" in names:
+        from text_vocabulary import load_vocabulary
+        vocabulary = load_vocabulary(dim=encoder.model.config.projection_dim)
+        if vocabulary is None:
+            raise SystemExit("clip/clip_refined/tags 策略需要先運行 'python text_vocabulary.py' 生成詞彙")
+    
+    if "remote" in names or "fused" in names:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise SystemExit("remote/fused 策略需要設置 OPENAI_API_KEY")
+        resolver = ReferenceResolver(api_key, timeout=float(os.environ.get("OPENAI_TIMEOUT", "30")))
+        
+        def remote(scene, frame, text):
+            # 與 generate_response 相同: 先提取引用，再解析到區域（兩次調用）
+            ref_text = parse_reference_text(resolver.extract_references(text))
+            return resolver.resolve_reference(scene, ref_text) if ref_text is not None else None
+        
+        def fused(scene, frame, text):
+            # 跳過引用提取，直接用完整文本解析（一次調用）
+            return resolver.resolve_reference(scene, text)
+        
+        strategies["remote"] = remote
+        strategies["fused"] = fused
+    
+    if "clip" in names:
+        clip_resolver = ClipReferenceResolver(encoder, vocabulary)
+        strategies["clip"] = lambda scene, frame, text: clip_resolver.resolve_reference(scene, text)
+    
+    if "clip_refined" in names:
+        # 與 clip 相同的網格位置，另在單元內由粗到細定位（衡量細分的額外延遲）
+        refined_resolver = ClipReferenceResolver(encoder, vocabulary, refiner=HierarchicalRefiner(encoder, vocabulary))
+        strategies["clip_refined"] = lambda scene, frame, text: refined_resolver.resolve_reference(scene, text)
+    
+    if "tags" in names:
+        # 預計算的詞彙文本特徵，不運行文本編碼器；文本中沒有詞彙中的詞時放棄
+        tag_resolver = TagReferenceResolver(vocabulary)
+        
+        def tags(scene, frame, text):
+            if not vocabulary.match_terms(text):
+                return None
+            return tag_resolver.resolve_reference(scene, text)
+        strategies["tags"] = tags
+    
+    if "colour" in names:
+        def colour(scene, frame, text):
+            # 只用顏色索引，沒有顏色詞時放棄
+            cues = extract_reference_cues(text)
+            if cues is None or not cues["colors"]:
+                return None
+            return max(scene["segments"], key=lambda s: CueReferenceResolver.color_score(s["image"], cues["colors"]))
+        strategies["colour"] = colour
+    
+    if "cue" in names:
+        cue_resolver = CueReferenceResolver()
+        strategies["cue"] = lambda scene, frame, text: cue_resolver.resolve_reference(scene, text)
+    
+    if "pointing" in names:
+        from gesture_recognizer import GestureRecognizer
+        # 評估幀來自不同的交互，互不連續，不能沿用上一幀的手部跟蹤
+        recognizer = GestureRecognizer(static_image_mode=True)
+        
+        def pointing(scene, frame, text):
+            located = recognizer.locate_pointing(frame)
+            if located is None:
+                return None
+            return recognizer.find_pointed_segment(located[1], scene)
+        strategies["pointing"] = pointing
+    
+    return {name: strategies[name] for name in names if name in strategies}
+
+def evaluate_strategies(groups, strategies, encoder):
+    """在所有案例上運行每個策略，記錄結果和耗時"""
+    import cv2
+    
+    outcomes = []
+    for path, cases in groups:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        # 所有策略共用同一次場景編碼（與線上流程一致），編碼時間不計入策略延遲
+        scene = encoder.describe_frame(frame)
+        for case in cases:
+            for name, strategy in strategies.items():
+                started = time.perf_counter()
+                try:
+                    segment = strategy(scene, frame, case["text"])
+                    error = None
+                except Exception as e:
+                    segment = None
+                    error = str(e)
+                latency = time.perf_counter() - started
+                predicted = list(segment["position"]) if segment is not None else None
+                outcomes.append({
+                    "strategy": name,
+                    "text": case["text"],
+                    "reference_type": classify_reference(case["text"]),
+                    "expected": case["expected"],
+                    "predicted": predicted,
+                    "correct": predicted == case["expected"],
+                    "latency": latency,
+                    "error": error
+                })
+    return outcomes
+
+def strategy_report(outcomes):
+    """按策略和參照類型匯總準確率、覆蓋率和延遲"""
+    groups = {}
+    for outcome in outcomes:
+        for reference_type in (outcome["reference_type"], "全部"):
+            groups.setdefault((outcome["strategy"], reference_type), []).append(outcome)
+    
+    report = []
+    for (strategy, reference_type), items in sorted(groups.items()):
+        answered = [o for o in items if o["predicted"] is not None]
+        correct = sum(1 for o in items if o["correct"])
+        latencies = np.array([o["latency"] for o in items]) * 1000
+        report.append({
+            "strategy": strategy,
+            "reference_type": reference_type,
+            "cases": len(items),
+            "coverage": len(answered) / len(items),
+            "accuracy": correct / len(items),
+            "precision": correct / len(answered) if answered else None,
+            "latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p95_ms": float(np.percentile(latencies, 95)),
+            "errors": sum(1 for o in items if o["error"])
+        })
+    return report
+
+def plot_strategy_comparison(report, output_path="strategy_comparison.png"):
+    """每種參照類型一個子圖: 橫軸為 p50 延遲（對數），縱軸為準確率"""
+    reference_types = sorted({r["reference_type"] for r in report})
+    plt.figure(figsize=(5 * len(reference_types), 4.5))
+    for index, reference_type in enumerate(reference_types, start=1):
+        plt.subplot(1, len(reference_types), index)
+        for row in (r for r in report if r["reference_type"] == reference_type):
+            plt.scatter(row["latency_p50_ms"], row["accuracy"], s=40 + row["coverage"] * 120)
+            plt.annotate(row["strategy"], (row["latency_p50_ms"], row["accuracy"]),
+                         textcoords="offset points", xytext=(5, 5))
+        plt.xscale('log')
+        plt.ylim(0, 1.05)
+        plt.xlabel('p50 延遲 (毫秒)')
+        plt.ylabel('準確率')
+        plt.title(reference_type)
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+    print(f"策略比較圖已保存為 '{output_path}'")
+
+def compare_strategies(base_dir="evaluation_data", names=STRATEGIES, include_unverified=False, limit=None,
+                       output=None, plot_path="strategy_comparison.png"):
+    """參照解析策略的準確率與延遲比較"""
+    groups = collect_reference_cases(base_dir, include_unverified=include_unverified, limit=limit)
+    if not groups:
+        print("未找到帶畫面的參照案例")
+        return None
+    print(f"參照案例: {sum(len(cases) for _, cases in groups)} 個，畫面: {len(groups)} 張")
+    
+    from vision_encoder import VisionEncoder
+    encoder = VisionEncoder(camera_index=None)
+    strategies = create_strategies(names, encoder)
+    outcomes = evaluate_strategies(groups, strategies, encoder)
+    report = strategy_report(outcomes)
+    
+    print("\n=== 參照解析策略比較 ===")
+    print(f"{'策略':<10}{'參照類型':<10}{'案例':>6}{'覆蓋率':>8}{'準確率':>8}{'精確率':>8}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for row in report:
+        precision = f"{row['precision']:.2%}" if row["precision"] is not None else "-"
+        print(f"{row['strategy']:<10}{row['reference_type']:<10}{row['cases']:>6}{row['coverage']:>8.2%}"
+              f"{row['accuracy']:>8.2%}{precision:>8}{row['latency_p50_ms']:>10.1f}{row['latency_p95_ms']:>10.1f}")
+    
+    plot_strategy_comparison(report, plot_path)
+    
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({"report": report, "outcomes": outcomes}, f, ensure_ascii=False, indent=2)
+        print(f"結果已保存到: {output}")
+    return report
+
+def generate_evaluation_report(base_dir="evaluation_data", workers=None, rebuild=False):
     """生成評估報告"""
-    # 加載數據
-    all_data = load_evaluation_data()
+    # 加載各會話摘要（增量）
+    started = time.time()
+    summaries = build_session_summaries(base_dir, workers=workers, rebuild=rebuild)
     
-    if not all_data:
+    if not summaries:
         print("未找到評估數據")
         return
     
+    total = merge_summaries(summaries)
+    print(f"聚合耗時: {time.time() - started:.2f}s\n")
+    
     # 分析參照解析
-    resolution_analysis = analyze_reference_resolution(all_data)
+    resolution_analysis = reference_report(total)
     
     # 分析用戶滿意度
-    satisfaction_analysis = analyze_user_satisfaction(all_data)
+    satisfaction_analysis = satisfaction_report(total)
+    
+    # 分析各階段延遲
+    latency_analysis = latency_report(total)
     
     # 打印報告
     print("=== 系統評估報告 ===\n")
@@ -113,6 +518,13 @@ def generate_evaluation_report():
         percentage = count / satisfaction_analysis['total_feedbacks'] if satisfaction_analysis['total_feedbacks'] > 0 else 0
         print(f"  - {score}分: {count} ({percentage:.2%})")
     
+    if latency_analysis:
+        print("\n各階段延遲 (毫秒):")
+        print(f"  {'階段':<40}{'次數':>8}" + "".join(f"{f'p{p}':>10}" for p in LATENCY_PERCENTILES))
+        for stage, stage_report in latency_analysis.items():
+            values = "".join(f"{stage_report[f'p{p}'] * 1000:>10.1f}" for p in LATENCY_PERCENTILES)
+            print(f"  {stage:<40}{stage_report['count']:>8}{values}")
+    
     # 生成圖表
     plt.figure(figsize=(12, 5))
     
@@ -138,4 +550,19 @@ def generate_evaluation_report():
     print("\n評估報告圖表已保存為 'evaluation_report.png'")
 
 if __name__ == "__main__":
-    generate_evaluation_report()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="生成系統評估報告")
+    parser.add_argument("--base-dir", default="evaluation_data")
+    parser.add_argument("--workers", type=int, default=None, help="並行進程數，默認為 CPU 核數")
+    parser.add_argument("--rebuild", action="store_true", help="忽略摘要索引，重新聚合所有會話")
+    parser.add_argument("--strategies", nargs="*", choices=STRATEGIES, default=None,
+                        help="比較參照解析策略的準確率與延遲（不指定名稱時比較全部）")
+    parser.add_argument("--include-unverified", action="store_true",
+                        help="策略比較時也使用未標記成功的記錄（以錄製結果為參照）")
+    parser.add_argument("--limit", type=int, default=None, help="策略比較的最多案例數")
+    parser.add_argument("--output", default=None, help="將策略比較結果保存為 JSON")
+    args = parser.parse_args()
+    if args.strategies is not None:
+        compare_strategies(args.base_dir, names=args.strategies or STRATEGIES,
+                           include_unverified=args.include_unverified, limit=args.limit, output=args.output)
+    else:
+        generate_evaluation_report(args.base_dir, workers=args.workers, rebuild=args.rebuild)
\ No newline at end of file
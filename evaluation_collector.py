@@ -1,11 +1,114 @@
 import json
 import os
+import queue
+import threading
 import time
 import cv2
 import numpy as np
 
+from embedding_store import EmbeddingWriter
+
+# 事件日誌文件名；data.json 為壓縮後的完整快照
+EVENT_LOG_NAME = "events.jsonl"
+DATA_FILE_NAME = "data.json"
+
+FSYNC_POLICIES = ("always", "interval", "close")
+
+class AsyncFileWriter:
+    """後台寫文件線程
+
+    調用方只需入隊，圖像編碼和文件寫入在工作線程中完成；隊列有界，
+    已滿時丟棄新項目並計數，close() 前會寫完隊列中的所有項目
+    """
+    
+    def __init__(self, max_queue=64):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        
+        self._thread = threading.Thread(target=self._run, name="evaluation-writer", daemon=True)
+        self._thread.start()
+    
+    def write_image(self, path, frame):
+        """排隊保存圖像（入隊後調用方不應再修改 frame），隊列已滿返回False"""
+        return self._enqueue(("image", path, frame))
+    
+    def write_bytes(self, path, payload):
+        """排隊寫入二進制數據，隊列已滿返回False"""
+        return self._enqueue(("bytes", path, payload))
+    
+    def _enqueue(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            print(f"評估數據寫入隊列已滿，丟棄: {item[1]}")
+            return False
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                kind, path, payload = item
+                if kind == "image":
+                    if not cv2.imwrite(path, payload):
+                        raise IOError("圖像編碼失敗")
+                else:
+                    with open(path, 'wb') as f:
+                        f.write(payload)
+                with self._stats_lock:
+                    self.written += 1
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                print(f"寫入評估數據錯誤 ({item[1]}): {e}")
+            finally:
+                self._queue.task_done()
+    
+    def flush(self):
+        """等待隊列中的所有項目寫完"""
+        self._queue.join()
+    
+    def close(self):
+        """寫完剩餘項目並停止線程"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+    
+    def stats(self):
+        """寫入統計"""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors
+            }
+
 class EvaluationCollector:
-    def __init__(self, output_dir="evaluation_data"):
+    def __init__(self, output_dir="evaluation_data", fsync_policy="interval", fsync_interval=1.0,
+                 async_writes=True, write_queue_size=64, store_embeddings=True):
+        """初始化評估數據收集器
+
+        每次記錄只向 events.jsonl 追加一行，記錄成本與會話長度無關；
+        只在 flush() 和 close() 時把當前狀態壓縮為 data.json，記錄調用中不做與會話長度成正比的寫入。
+        fsync_policy: "always" 每個事件都落盤，"interval" 最多每 fsync_interval 秒落盤一次，
+        "close" 只在關閉時落盤
+        async_writes: 在後台線程中保存幀和音頻，記錄調用只需入隊；
+        寫入隊列已滿時該文件被丟棄，對應字段記為None
+        store_embeddings: 將交互中 "scene_segments" 的 CLIP 區域特徵追加到 embeddings/
+        （見 embedding_store），交互記錄中只保存行範圍 "embedding_rows"
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync_policy}")
+        
         self.output_dir = output_dir
         self.session_id = f"session_{int(time.time())}"
         self.session_dir = os.path.join(output_dir, self.session_id)
@@ -21,84 +124,244 @@ class EvaluationCollector:
             "timestamp": time.time(),
             "interactions": []
         }
-    
-    def record_interaction(self, interaction_data):
-        """記錄一次交互"""
-        interaction_id = len(self.data["interactions"])
-        
-        # 保存場景圖像
-        if "frame" in interaction_data:
-            frame = interaction_data["frame"]
-            frame_path = os.path.join(self.session_dir, "scenes", f"frame_{interaction_id}.jpg")
-            cv2.imwrite(frame_path, frame)
-            interaction_data["frame"] = frame_path
         
-        # 保存音頻
-        if "audio" in interaction_data:
-            audio = interaction_data["audio"]
-            audio_path = os.path.join(self.session_dir, "audio", f"audio_{interaction_id}.wav")
-            with open(audio_path, 'wb') as f:
-                f.write(audio)
-            interaction_data["audio"] = audio_path
+        # 幀和音頻的後台寫入
+        self.writer = AsyncFileWriter(max_queue=write_queue_size) if async_writes else None
         
-        # 添加時間戳
-        interaction_data["timestamp"] = time.time()
-        interaction_data["interaction_id"] = interaction_id
+        # 區域特徵的列式存儲
+        self.embeddings = EmbeddingWriter(self.session_dir) if store_embeddings else None
         
-        # 添加到數據中
-        self.data["interactions"].append(interaction_data)
+        # 多個線程可同時記錄
+        self._lock = threading.RLock()
         
-        # 保存更新的數據
-        self._save_data()
-        
-        return interaction_id
+        # 事件日誌
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._last_fsync = time.time()
+        self._log = open(os.path.join(self.session_dir, EVENT_LOG_NAME), 'a', encoding='utf-8')
+        self._append_event({
+            "type": "session",
+            "session_id": self.session_id,
+            "timestamp": self.data["timestamp"]
+        })
+    
+    def record_interaction(self, interaction_data):
+        """記錄一次交互"""
+        with self._lock:
+            interaction_id = len(self.data["interactions"])
+            
+            # 保存場景圖像
+            if "frame" in interaction_data:
+                frame = interaction_data["frame"]
+                frame_path = os.path.join(self.session_dir, "scenes", f"frame_{interaction_id}.jpg")
+                if self.writer is None:
+                    cv2.imwrite(frame_path, frame)
+                elif not self.writer.write_image(frame_path, frame):
+                    frame_path = None
+                interaction_data["frame"] = frame_path
+            
+            # 保存音頻
+            if "audio" in interaction_data:
+                audio = interaction_data["audio"]
+                audio_path = os.path.join(self.session_dir, "audio", f"audio_{interaction_id}.wav")
+                if self.writer is None:
+                    with open(audio_path, 'wb') as f:
+                        f.write(audio)
+                elif not self.writer.write_bytes(audio_path, audio):
+                    audio_path = None
+                interaction_data["audio"] = audio_path
+            
+            # 保存場景的區域特徵（特徵數組不寫入 JSON）
+            segments = interaction_data.pop("scene_segments", None)
+            if segments is not None and self.embeddings is not None:
+                try:
+                    interaction_data["embedding_rows"] = self.embeddings.append_scene(
+                        segments, time.time(), interaction_id)
+                except Exception as e:
+                    print(f"保存區域特徵錯誤: {e}")
+            
+            # 添加時間戳
+            interaction_data["timestamp"] = time.time()
+            interaction_data["interaction_id"] = interaction_id
+            
+            # 添加到數據中
+            self.data["interactions"].append(interaction_data)
+            
+            # 追加到事件日誌
+            self._append_event({"type": "interaction", "data": interaction_data})
+            
+            return interaction_id
     
     def record_reference_resolution(self, interaction_id, reference_text, resolved_segment, success):
         """記錄參照解析結果"""
-        if interaction_id >= len(self.data["interactions"]):
-            return False
-        
-        interaction = self.data["interactions"][interaction_id]
-        
-        # 添加參照解析數據
-        if "reference_resolution" not in interaction:
-            interaction["reference_resolution"] = []
-        
-        resolution_data = {
-            "reference_text": reference_text,
-            "segment_position": resolved_segment["position"] if resolved_segment else None,
-            "success": success,
-            "timestamp": time.time()
-        }
-        
-        interaction["reference_resolution"].append(resolution_data)
-        
-        # 保存更新的數據
-        self._save_data()
-        
-        return True
+        with self._lock:
+            if interaction_id >= len(self.data["interactions"]):
+                return False
+            
+            interaction = self.data["interactions"][interaction_id]
+            
+            # 添加參照解析數據
+            if "reference_resolution" not in interaction:
+                interaction["reference_resolution"] = []
+            
+            resolution_data = {
+                "reference_text": reference_text,
+                "segment_position": resolved_segment["position"] if resolved_segment else None,
+                "success": success,
+                "timestamp": time.time()
+            }
+            
+            interaction["reference_resolution"].append(resolution_data)
+            
+            # 追加到事件日誌
+            self._append_event({
+                "type": "reference_resolution",
+                "interaction_id": interaction_id,
+                "data": resolution_data
+            })
+            
+            return True
     
     def record_user_feedback(self, interaction_id, satisfaction_score, comments):
         """記錄用戶反饋"""
-        if interaction_id >= len(self.data["interactions"]):
-            return False
-        
-        interaction = self.data["interactions"][interaction_id]
-        
-        # 添加用戶反饋
-        interaction["user_feedback"] = {
-            "satisfaction_score": satisfaction_score,  # 1-5
-            "comments": comments,
-            "timestamp": time.time()
-        }
-        
-        # 保存更新的數據
-        self._save_data()
+        with self._lock:
+            if interaction_id >= len(self.data["interactions"]):
+                return False
+            
+            interaction = self.data["interactions"][interaction_id]
+            
+            # 添加用戶反饋
+            interaction["user_feedback"] = {
+                "satisfaction_score": satisfaction_score,  # 1-5
+                "comments": comments,
+                "timestamp": time.time()
+            }
+            
+            # 追加到事件日誌
+            self._append_event({
+                "type": "user_feedback",
+                "interaction_id": interaction_id,
+                "data": interaction["user_feedback"]
+            })
+            
+            return True
+    
+    def _append_event(self, event):
+        """向事件日誌追加一行，並按策略落盤"""
+        self._log.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + "\n")
         
-        return True
+        now = time.time()
+        if self.fsync_policy == "always" or (
+                self.fsync_policy == "interval" and now - self._last_fsync >= self.fsync_interval):
+            self._sync()
+    
+    def _sync(self):
+        """將緩衝寫入磁盤（先寫特徵，日誌中引用的行總是已落盤）"""
+        if self.embeddings is not None:
+            self.embeddings.flush(fsync=True)
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._last_fsync = time.time()
+    
+    def compact(self):
+        """將當前狀態壓縮為 data.json（原子替換）"""
+        with self._lock:
+            self._save_data()
+    
+    def flush(self):
+        """等待後台寫入完成，將事件日誌落盤並壓縮為 data.json"""
+        if self.writer is not None:
+            self.writer.flush()
+        with self._lock:
+            self._sync()
+            self.compact()
+    
+    def get_writer_stats(self):
+        """後台寫入的隊列深度和丟棄統計"""
+        if self.writer is None:
+            return None
+        return self.writer.stats()
+    
+    def close(self):
+        """寫完排隊的文件，落盤、壓縮並關閉事件日誌"""
+        with self._lock:
+            if self._log.closed:
+                return
+            if self.writer is not None:
+                self.writer.close()
+            self._sync()
+            self.compact()
+            self._log.close()
+            if self.embeddings is not None:
+                self.embeddings.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def _save_data(self):
         """保存數據到JSON文件"""
-        data_path = os.path.join(self.session_dir, "data.json")
-        with open(data_path, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        data_path = os.path.join(self.session_dir, DATA_FILE_NAME)
+        tmp_path = data_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, data_path)
+
+def replay_event_log(log_path):
+    """從事件日誌重建會話數據（與 data.json 格式相同）
+
+    末尾未寫完的行（例如進程崩潰時）會被忽略
+    """
+    data = None
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"跳過損壞的事件行: {log_path}")
+                continue
+            
+            event_type = event.get("type")
+            if event_type == "session":
+                data = {
+                    "session_id": event["session_id"],
+                    "timestamp": event["timestamp"],
+                    "interactions": []
+                }
+            elif data is None:
+                continue
+            elif event_type == "interaction":
+                data["interactions"].append(event["data"])
+            elif event_type == "reference_resolution":
+                interaction = data["interactions"][event["interaction_id"]]
+                interaction.setdefault("reference_resolution", []).append(event["data"])
+            elif event_type == "user_feedback":
+                data["interactions"][event["interaction_id"]]["user_feedback"] = event["data"]
+    
+    return data
+
+def load_session_data(session_dir):
+    """加載一個會話的數據
+
+    事件日誌比 data.json 新（或 data.json 不存在）時從日誌重建，否則讀取 data.json；
+    都不存在時返回None
+    """
+    data_path = os.path.join(session_dir, DATA_FILE_NAME)
+    log_path = os.path.join(session_dir, EVENT_LOG_NAME)
+    
+    has_data = os.path.exists(data_path)
+    has_log = os.path.exists(log_path)
+    
+    if has_log and (not has_data or os.path.getmtime(log_path) > os.path.getmtime(data_path)):
+        return replay_event_log(log_path)
+    
+    if has_data:
+        with open(data_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    return None
@@ -1,12 +1,15 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+import threading
+import time
 
 class GestureRecognizer:
-    def __init__(self):
+    def __init__(self, static_image_mode=False):
+        """static_image_mode: 每幀獨立檢測而不跟蹤上一幀的手（用於互不相關的離線圖像）"""
         self.mp_hands = mp.solutions.hands
         self.hands = self.mp_hands.Hands(
-            static_image_mode=False,
+            static_image_mode=static_image_mode,
             max_num_hands=1,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
@@ -36,12 +39,44 @@ class GestureRecognizer:
             self.mp_hands.HAND_CONNECTIONS
         )
         
+        h, w, _ = frame.shape
+        pointing = self._pointing_from_landmarks(hand_landmarks, w, h)
+        if pointing is None:
+            return None, annotated_frame
+        
+        (tip_x, tip_y), (pointing_x, pointing_y) = pointing
+        
+        # 繪製指向的線
+        cv2.line(annotated_frame, (tip_x, tip_y), (pointing_x, pointing_y), (0, 255, 0), 2)
+        cv2.circle(annotated_frame, (pointing_x, pointing_y), 5, (0, 0, 255), -1)
+        
+        return (pointing_x, pointing_y), annotated_frame
+    
+    def locate_pointing(self, frame, output_size=None):
+        """檢測指向手勢但不繪製，返回(食指尖坐標, 指向坐標)
+
+        output_size 為 (寬, 高)，用於在縮小的畫面上檢測並返回原始解析度的坐標
+        """
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        results = self.hands.process(rgb_frame)
+        
+        if not results.multi_hand_landmarks:
+            return None
+        
+        if output_size is None:
+            h, w = frame.shape[:2]
+        else:
+            w, h = output_size
+        
+        return self._pointing_from_landmarks(results.multi_hand_landmarks[0], w, h)
+    
+    def _pointing_from_landmarks(self, hand_landmarks, w, h):
+        """根據食指關鍵點計算指向的點"""
         # 獲取食指尖端和指關節的位置
         index_tip = hand_landmarks.landmark[self.mp_hands.HandLandmark.INDEX_FINGER_TIP]
         index_pip = hand_landmarks.landmark[self.mp_hands.HandLandmark.INDEX_FINGER_PIP]
         
         # 計算畫面中的坐標
-        h, w, _ = frame.shape
         tip_x, tip_y = int(index_tip.x * w), int(index_tip.y * h)
         pip_x, pip_y = int(index_pip.x * w), int(index_pip.y * h)
         
@@ -52,7 +87,7 @@ class GestureRecognizer:
         # 延長線段以找到指向的點
         magnitude = np.sqrt(dx*dx + dy*dy)
         if magnitude < 1e-6:  # 避免除以零
-            return None, annotated_frame
+            return None
         
         # 標準化並延長
         scale = 50.0  # 延長倍數
@@ -63,22 +98,220 @@ class GestureRecognizer:
         pointing_x = int(tip_x + dx)
         pointing_y = int(tip_y + dy)
         
-        # 繪製指向的線
-        cv2.line(annotated_frame, (tip_x, tip_y), (pointing_x, pointing_y), (0, 255, 0), 2)
-        cv2.circle(annotated_frame, (pointing_x, pointing_y), 5, (0, 0, 255), -1)
+        return (tip_x, tip_y), (pointing_x, pointing_y)
+    
+    def build_segment_grid(self, segments):
+        """為規則網格的區域段建立索引，使指向查找為O(1)
+
+        若區域段不構成規則網格，返回None
+        """
+        if not segments:
+            return None
         
-        return (pointing_x, pointing_y), annotated_frame
+        x1, y1, x2, y2 = segments[0]["coordinates"]
+        cell_w, cell_h = x2 - x1, y2 - y1
+        if cell_w <= 0 or cell_h <= 0:
+            return None
+        
+        cells = {}
+        for segment in segments:
+            position = segment.get("position")
+            if position is None or len(position) != 2:
+                return None
+            i, j = position
+            if segment["coordinates"] != (j * cell_w, i * cell_h, (j + 1) * cell_w, (i + 1) * cell_h):
+                return None
+            cells[(i, j)] = segment
+        
+        rows = max(i for i, _ in cells) + 1
+        cols = max(j for _, j in cells) + 1
+        return {
+            "cells": cells,
+            "cell_size": (cell_w, cell_h),
+            "grid_size": (rows, cols)
+        }
     
-    def find_pointed_segment(self, pointing_coords, segments):
-        """找出被指向的區域段"""
-        if pointing_coords is None:
+    def find_pointed_segment(self, pointing_coords, scene):
+        """找出場景中被指向的區域段"""
+        segments = scene.get("segments") if scene is not None else None
+        if pointing_coords is None or not segments:
             return None
         
         pointing_x, pointing_y = pointing_coords
         
+        # 網格索引隨場景保存，每個場景只建立一次；並發時重複建立的結果相同
+        if "segment_grid" not in scene:
+            scene["segment_grid"] = self.build_segment_grid(segments)
+        grid = scene["segment_grid"]
+        
+        if grid is not None:
+            cell_w, cell_h = grid["cell_size"]
+            rows, cols = grid["grid_size"]
+            if not (0 <= pointing_x <= cols * cell_w and 0 <= pointing_y <= rows * cell_h):
+                return None
+            i = min(pointing_y // cell_h, rows - 1)
+            j = min(pointing_x // cell_w, cols - 1)
+            return grid["cells"].get((i, j))
+        
+        # 非規則網格時退回線性搜索
         for segment in segments:
             x1, y1, x2, y2 = segment["coordinates"]
             if (x1 <= pointing_x <= x2) and (y1 <= pointing_y <= y2):
                 return segment
         
-        return None
\ No newline at end of file
+        return None
+
+
+class GestureWorker(threading.Thread):
+    """在獨立線程中以限定頻率、縮小解析度運行手勢檢測
+
+    畫面由調用方通過 submit_frame 推送，工作線程只處理最新一幀；
+    最新的指向結果帶時間戳發布，並在兩次檢測之間進行平滑與插值
+    """
+    
+    def __init__(self, recognizer, detection_fps=10, detection_width=320, smoothing=0.5, max_age=1.0):
+        super().__init__()
+        self.daemon = True
+        
+        self.recognizer = recognizer
+        self.detection_interval = 1.0 / detection_fps
+        self.detection_width = detection_width
+        self.smoothing = smoothing   # 指數平滑係數，越大越跟隨最新檢測
+        self.max_age = max_age       # 指向結果的有效期(秒)
+        
+        self._frame = None
+        self._last_submit = 0
+        self._frame_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        
+        # 最新發布的指向結果及用於插值的速度
+        self._pointing = None
+        self._velocity = (0.0, 0.0)
+        
+        self.detections = 0
+    
+    def submit_frame(self, frame, force=False):
+        """提交最新畫面
+
+        按檢測頻率取樣（force=True 時不取樣），並立即縮小為檢測解析度，
+        之後調用方可以在原畫面上繪製而不影響檢測
+        """
+        if frame is None:
+            return
+        
+        now = time.time()
+        if not force and now - self._last_submit < self.detection_interval:
+            return
+        self._last_submit = now
+        
+        h, w = frame.shape[:2]
+        if w > self.detection_width:
+            small_h = int(h * self.detection_width / w)
+            small_frame = cv2.resize(frame, (self.detection_width, small_h), interpolation=cv2.INTER_AREA)
+        else:
+            small_frame = frame.copy()
+        
+        self._frame = (small_frame, (w, h))
+        self._frame_event.set()
+    
+    def stop(self):
+        """停止工作線程"""
+        self._stop_event.set()
+        self._frame_event.set()
+    
+    def run(self):
+        """工作線程主循環"""
+        print("手勢檢測線程已啟動")
+        
+        while not self._stop_event.is_set():
+            # 等待新畫面
+            if not self._frame_event.wait(timeout=self.max_age):
+                continue
+            self._frame_event.clear()
+            
+            frame = self._frame
+            if frame is None or self._stop_event.is_set():
+                continue
+            
+            started = time.time()
+            try:
+                self._detect(frame)
+            except Exception as e:
+                print(f"手勢檢測錯誤: {e}")
+            
+            # 限制檢測頻率
+            remaining = self.detection_interval - (time.time() - started)
+            if remaining > 0:
+                self._stop_event.wait(remaining)
+    
+    def _detect(self, frame):
+        """在縮小的畫面上檢測並更新指向結果"""
+        small_frame, output_size = frame
+        result = self.recognizer.locate_pointing(small_frame, output_size=output_size)
+        self.detections += 1
+        now = time.time()
+        
+        if result is None:
+            return
+        
+        tip, point = result
+        with self._lock:
+            previous = self._pointing
+            if previous is None or now - previous["timestamp"] > self.max_age:
+                # 重新開始跟蹤
+                smoothed = (float(point[0]), float(point[1]))
+                self._velocity = (0.0, 0.0)
+            else:
+                a = self.smoothing
+                px, py = previous["point"]
+                smoothed = (a * point[0] + (1 - a) * px, a * point[1] + (1 - a) * py)
+                dt = now - previous["timestamp"]
+                if dt > 0:
+                    self._velocity = ((smoothed[0] - px) / dt, (smoothed[1] - py) / dt)
+            
+            self._pointing = {
+                "point": smoothed,
+                "tip": tip,
+                "raw_point": point,
+                "timestamp": now
+            }
+    
+    def get_pointing(self, now=None):
+        """獲取最新指向結果，坐標按速度外推到當前時間
+
+        返回 {"point", "tip", "timestamp"}，結果過期時返回None
+        """
+        if now is None:
+            now = time.time()
+        
+        with self._lock:
+            pointing = self._pointing
+            vx, vy = self._velocity
+        
+        if pointing is None:
+            return None
+        
+        age = now - pointing["timestamp"]
+        if age > self.max_age:
+            return None
+        
+        # 最多外推一個檢測間隔，避免過沖
+        dt = min(max(age, 0.0), self.detection_interval)
+        x, y = pointing["point"]
+        return {
+            "point": (int(x + vx * dt), int(y + vy * dt)),
+            "tip": pointing["tip"],
+            "timestamp": pointing["timestamp"]
+        }
+    
+    def draw_overlay(self, frame, pointing=None):
+        """在畫面上直接繪製指向標記（不複製畫面）"""
+        if pointing is None:
+            pointing = self.get_pointing()
+        if pointing is None or frame is None:
+            return frame
+        
+        cv2.line(frame, pointing["tip"], pointing["point"], (0, 255, 0), 2)
+        cv2.circle(frame, pointing["point"], 5, (0, 0, 255), -1)
+        return frame
@@ -0,0 +1,121 @@
+# latency_trace.py - 從捕獲到回答的各階段延遲記錄
+"""
+記錄一次交互中各階段的耗時: 捕獲、預處理、CLIP 推理、每次 OpenAI 調用（含模型名稱和請求大小）、
+JPEG 編碼和 HTTP 響應。
+
+請求或後台任務用 activate(trace) 將一個 LatencyTrace 綁定到當前線程，代碼中用
+span("stage") 記錄耗時；當前線程沒有綁定追蹤時 span 只做一次線程局部變量查找，可在生產環境中常開。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class LatencyTrace:
+    """一次交互的延遲記錄，可在多個線程中依次使用"""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, duration, **attrs):
+        """添加一個階段，start 為 time.perf_counter() 的值"""
+        record = {"stage": stage, "offset": start - self._origin, "duration": duration}
+        record.update(attrs)
+        with self._lock:
+            self._spans.append(record)
+
+    def add_since(self, stage, wall_time, **attrs):
+        """添加從某個 time.time() 時間點到現在的階段（例如語音結束到開始處理）"""
+        now = time.perf_counter()
+        duration = max(0.0, time.time() - wall_time)
+        self.add(stage, now - duration, duration, **attrs)
+
+    def add_between(self, stage, start_wall, end_wall, **attrs):
+        """添加兩個 time.time() 時間點之間的階段（例如語音結束到轉錄完成）"""
+        start = time.perf_counter() - (time.time() - start_wall)
+        self.add(stage, start, max(0.0, end_wall - start_wall), **attrs)
+
+    def add_total(self, stage, **attrs):
+        """添加從追蹤創建到現在的階段（例如整個 HTTP 請求）"""
+        self.add(stage, self._origin, time.perf_counter() - self._origin, **attrs)
+
+    def spans(self):
+        """所有階段的副本，按開始時間排序"""
+        with self._lock:
+            return sorted((dict(s) for s in self._spans), key=lambda s: s["offset"])
+
+    def total(self):
+        """從追蹤創建到現在的時間(秒)"""
+        return time.perf_counter() - self._origin
+
+
+class _Span:
+    __slots__ = ("stage", "attrs", "trace", "start")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self.trace = getattr(_local, "trace", None)
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.trace is not None:
+            duration = time.perf_counter() - self.start
+            if exc_type is not None:
+                self.attrs["error"] = exc_type.__name__
+            self.trace.add(self.stage, self.start, duration, **self.attrs)
+        return False
+
+
+def span(stage, **attrs):
+    """記錄一個階段的上下文管理器，返回的字典可在階段內補充屬性"""
+    return _Span(stage, attrs)
+
+
+def add_span(stage, start, duration, **attrs):
+    """向當前線程的追蹤直接添加一個階段（用於累計多次循環的耗時）"""
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.add(stage, start, duration, **attrs)
+
+
+def current_trace():
+    """當前線程綁定的追蹤，沒有時返回None"""
+    return getattr(_local, "trace", None)
+
+
+def set_current_trace(trace):
+    """將追蹤綁定到當前線程（None 表示解除），返回之前綁定的追蹤"""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    return previous
+
+
+@contextmanager
+def activate(trace):
+    """在 with 塊內將追蹤綁定到當前線程"""
+    previous = set_current_trace(trace)
+    try:
+        yield trace
+    finally:
+        set_current_trace(previous)
+
+
+def stage_key(record):
+    """報告中使用的階段名稱，OpenAI 調用按模型、HTTP 響應按路徑區分"""
+    if "model" in record:
+        return f"{record['stage']}[{record['model']}]"
+    if "path" in record:
+        return f"{record['stage']}[{record['path']}]"
+    return record["stage"]
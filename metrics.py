@@ -0,0 +1,206 @@
+# metrics.py - 即時性能計數器，以 Prometheus 文本格式輸出
+"""
+各模組在導入時向全局 REGISTRY 註冊指標，運行中直接更新:
+
+    FRAMES = REGISTRY.counter("vision_frames_captured_total", "攝像頭成功讀取的畫面數")
+    FRAMES.inc()
+    OPENAI = REGISTRY.counter("openai_requests_total", "OpenAI 請求數", ["model", "outcome"])
+    OPENAI.labels(model="gpt-4.1-mini", outcome="ok").inc()
+
+記錄只在該指標自己的小鎖內做一次加法（直方圖多一次 bisect），不同指標之間互不競爭；
+已存在於其他對象中的統計（隊列深度、串流客戶端數）用 set_function 在抓取時讀取，不增加熱路徑開銷。
+app.py 在 /api/metrics 輸出 REGISTRY.render()。
+"""
+
+import math
+import threading
+from bisect import bisect_left
+
+# 延遲直方圖的默認桶上限(秒)，覆蓋從 JPEG 編碼到 OpenAI 調用的範圍
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value, quotes=True):
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class _Value:
+    """計數器或儀表的一個標籤組合"""
+
+    __slots__ = ("_value", "_lock", "_function")
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function):
+        """抓取時調用 function 取值（用於其他對象已維護的統計）"""
+        self._function = function
+        return self
+
+    def get(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return math.nan
+        with self._lock:
+            return self._value
+
+    def samples(self, name, labels):
+        return [(name, labels, self.get())]
+
+
+class _HistogramValue:
+    """直方圖的一個標籤組合，桶計數在輸出時才累加"""
+
+    __slots__ = ("_buckets", "_counts", "_sum", "_lock")
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels + (("le", _format_value(float(bound))),), cumulative))
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, cumulative))
+        return samples
+
+
+class Metric:
+    """一個指標及其所有標籤組合；沒有標籤時可直接調用 inc/set/observe"""
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) if buckets is not None else None
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets) if self.kind == "histogram" else _Value()
+
+    def labels(self, **labels):
+        """取得一個標籤組合，首次使用時創建"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        return self._default.set_function(function)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape(self.documentation, quotes=False)}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, key))):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """指標註冊表，同名指標重複註冊時返回已有的指標"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, kind, name, documentation, labelnames, buckets=None):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, documentation, labelnames, buckets)
+            elif metric.kind != kind or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"指標 {name} 已註冊為不同的類型或標籤")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create("counter", name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create("gauge", name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create("histogram", name, documentation, labelnames, buckets)
+
+    def render(self):
+        """所有指標的 Prometheus 文本格式 (0.0.4)"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
@@ -4,12 +4,54 @@
 支持邊緣設備上的 AI 推理
 """
 
+import argparse
+import copy
+import inspect
+import os
+import shutil
+import time
 import torch
 import cv2
 import numpy as np
 from pathlib import Path
 import json
 
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+
+# 低解析度模式的 CLIP 輸入大小（需為圖塊大小 32 的倍數），segment_image_optimized 的區域直接縮放到此大小
+LOW_RESOLUTION_SIZE = 128
+
+# 導出圖的輸入輸出名稱
+EXPORT_INPUT_NAME = "pixel_values"
+EXPORT_OUTPUT_NAME = "image_embeds"
+EXPORT_FORMATS = ("torchscript", "onnx")
+ONNX_OPSET = 17
+
+# 導出結果與 CLIPModel.get_image_features 的最低餘弦相似度: 浮點版本應與原模型一致，量化版本允許少量漂移
+FP32_MIN_COSINE = 0.9999
+INT8_MIN_COSINE = 0.98
+
+# 靜態量化的校準區域數，以及 ONNX Runtime 的校準方法
+CALIBRATION_SEGMENTS = 128
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+
+class ImageEmbeddingModel(torch.nn.Module):
+    """視覺塔 + 投影層，輸出與 CLIPModel.get_image_features 相同的 (batch, 512) 圖像特徵"""
+    
+    def __init__(self, clip_model):
+        super().__init__()
+        self.vision_model = clip_model.vision_model
+        self.visual_projection = clip_model.visual_projection
+    
+    def forward(self, pixel_values):
+        pooled_output = self.vision_model(pixel_values=pixel_values, return_dict=False)[1]
+        return self.visual_projection(pooled_output)
+
 class QualcommVisionEncoder:
     """針對 Qualcomm 設備優化的視覺編碼器"""
     
@@ -35,36 +77,17 @@ class QualcommVisionEncoder:
         self.cache_timestamp = None
         self.cache_duration = 5
     
-    def export_for_qualcomm(self, export_path="qualcomm_vision_model"):
-        """將模型導出為 Qualcomm 相容格式"""
-        
-        # 創建示例輸入
-        dummy_input = torch.randn(1, 3, 224, 224)
-        
-        # 追蹤模型
-        traced_model = torch.jit.trace(self.model.vision_model, dummy_input)
-        
-        # 保存為 TorchScript
-        traced_model.save(f"{export_path}.pt")
-        
-        # 創建模型配置文件
-        config = {
-            "model_name": "visual_reference_clip",
-            "input_shape": [1, 3, 224, 224],
-            "output_shape": [1, 512],
-            "precision": "INT8",
-            "framework": "PyTorch",
-            "description": "CLIP vision encoder for visual reference understanding"
-        }
-        
-        with open(f"{export_path}_config.json", "w") as f:
-            json.dump(config, f, indent=2)
-        
-        print(f"模型已導出到: {export_path}.pt")
-        return f"{export_path}.pt"
+    def export_for_qualcomm(self, export_path="qualcomm_vision_model", **options):
+        """將模型導出為 Qualcomm 相容格式（見 export_image_encoder），返回選中的模型文件"""
+        config = export_image_encoder(export_path, **options)
+        return config["model_file"]
     
-    def segment_image_optimized(self, frame, grid_size=(2, 2)):
-        """優化的圖像分割 - 減少計算量"""
+    @staticmethod
+    def segment_image_optimized(frame, grid_size=(2, 2), size=LOW_RESOLUTION_SIZE):
+        """優化的圖像分割 - 減少計算量
+
+        區域縮放到 size x size，配合以相同輸入大小導出的模型（--image-size）使用時不會被放大回 224
+        """
         height, width = frame.shape[:2]
         segments = []
         
@@ -80,7 +103,7 @@ class QualcommVisionEncoder:
                 
                 # 縮小圖像以節省計算資源
                 segment = frame[y1:y2, x1:x2]
-                segment_resized = cv2.resize(segment, (112, 112))
+                segment_resized = cv2.resize(segment, (size, size))
                 
                 segments.append({
                     "image": segment_resized,
@@ -114,25 +137,434 @@ class QualcommSpeechRecognizer:
             return self.transcription_buffer.pop(0)
         return ""
 
-def prepare_for_qualcomm_deployment():
+def load_clip(model_name=CLIP_MODEL_NAME):
+    """加載浮點 CLIP 模型和處理器（導出和量化都從浮點模型開始）"""
+    from transformers import CLIPProcessor, CLIPModel
+    model = CLIPModel.from_pretrained(model_name).eval()
+    processor = CLIPProcessor.from_pretrained(model_name)
+    return model, processor
+
+def sample_crops(frames_dir=None, count=16, offset=0):
+    """驗證、校準和測速用的區域: 畫面（frames_dir 中的圖像，默認為合成畫面）按 3x3 網格分割
+
+    offset 跳過前面的區域，使校準數據與驗證數據不重疊
+    """
+    from vision_benchmark import load_frames
+    from vision_encoder import VisionEncoder
+    
+    crops = []
+    for frame in load_frames(frames_dir, (offset + count) // 9 + 1):
+        crops.extend(segment["image"] for segment in VisionEncoder.segment_image(frame))
+    return crops[offset:offset + count]
+
+def preprocess(processor, crops, image_size=None):
+    """將區域預處理為 pixel_values，image_size 指定時縮放/裁剪到該大小而不是 224"""
+    options = {}
+    if image_size:
+        options = {"size": {"shortest_edge": image_size}, "crop_size": {"height": image_size, "width": image_size}}
+    return processor.image_processor(images=crops, return_tensors="pt", **options)["pixel_values"]
+
+def sample_pixel_values(processor, frames_dir=None, count=16, offset=0, image_size=None):
+    """sample_crops 的區域經過預處理"""
+    return preprocess(processor, sample_crops(frames_dir, count, offset), image_size)
+
+def native_image_size(clip_model):
+    return clip_model.vision_model.embeddings.image_size
+
+def low_resolution_model(clip_model, image_size):
+    """以 image_size 輸入直接推理的模型副本（插值位置編碼，見 vision_encoder.set_clip_resolution）"""
+    from vision_encoder import set_clip_resolution
+    if image_size == native_image_size(clip_model):
+        return clip_model
+    return set_clip_resolution(copy.deepcopy(clip_model), None, image_size).eval()
+
+def image_features(model, pixel_values):
+    with torch.no_grad():
+        return model.get_image_features(pixel_values=pixel_values).numpy()
+
+def evaluate_resolutions(sizes, frames_dir=None, count=64, batch_size=9, iterations=10, warmup=2):
+    """比較不同 CLIP 輸入大小的特徵質量和推理成本
+
+    質量以原生 224 輸入的特徵為參考（同一批區域），包括餘弦相似度和區域間最近鄰一致率；
+    成本為本地 CPU 上一批 batch_size 個區域的 fp32 推理延遲
+    """
+    clip_model, processor = load_clip()
+    crops = sample_crops(frames_dir, count)
+    native_size = native_image_size(clip_model)
+    reference = image_features(clip_model, preprocess(processor, crops))
+    
+    results = []
+    for size in sizes:
+        model = low_resolution_model(clip_model, size)
+        pixel_values = preprocess(processor, crops, size)
+        latency = time_runner(lambda batch: image_features(model, batch), pixel_values, batch_size, iterations, warmup)
+        results.append({
+            "image_size": size,
+            "patches": model.vision_model.embeddings.num_patches,
+            "latency": latency,
+            "quality": compare_features(reference, image_features(model, pixel_values))
+        })
+    
+    native = next((r for r in results if r["image_size"] == native_size), None)
+    print(f"\n{'輸入大小':<10}{'圖塊':>6}{'p50':>11}{'每區域':>10}{'相對成本':>10}{'平均餘弦':>10}{'近鄰一致':>10}")
+    for result in results:
+        relative = result["latency"]["p50_ms"] / native["latency"]["p50_ms"] if native else float("nan")
+        quality = result["quality"]
+        print(f"{result['image_size']:<12}{result['patches']:>6}{result['latency']['p50_ms']:9.2f}ms"
+              f"{result['latency']['per_image_ms']:8.2f}ms{relative:10.2f}{quality['mean_cosine']:12.4f}"
+              f"{quality.get('neighbour_agreement', float('nan')):11.1%}")
+    return results
+
+def export_torchscript(module, path, example):
+    """追蹤並保存為 TorchScript"""
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example)
+    traced.save(path)
+    return path
+
+def export_onnx(module, path, example):
+    """導出為 ONNX（批大小可變）"""
+    options = {}
+    # 新版 torch 默認使用 dynamo 導出器，其輸出與 onnxruntime 量化工具不相容，可用時改用 TorchScript 導出器
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        options["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            module, (example,), path,
+            input_names=[EXPORT_INPUT_NAME],
+            output_names=[EXPORT_OUTPUT_NAME],
+            dynamic_axes={EXPORT_INPUT_NAME: {0: "batch"}, EXPORT_OUTPUT_NAME: {0: "batch"}},
+            opset_version=ONNX_OPSET,
+            **options
+        )
+    return path
+
+def model_size_mb(path):
+    """模型文件大小，包括 ONNX 的外部權重文件"""
+    size = os.path.getsize(path)
+    if os.path.exists(path + ".data"):
+        size += os.path.getsize(path + ".data")
+    return size / 2 ** 20
+
+def quantize_onnx_dynamic(path, output_path):
+    """ONNX Runtime 動態量化（權重 int8）"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+def quantize_onnx_static(path, output_path, calibration, method="minmax", per_channel=True):
+    """ONNX Runtime 靜態量化: 用 calibration（預處理後的區域）校準激活範圍，整個圖的權重和激活都量化為 int8
+
+    使用 QDQ 格式，注意力、LayerNorm 之外的矩陣乘法和卷積都以 int8 執行；
+    PyTorch 的 eager/FX 靜態量化不支持 CLIP 視覺塔中的這些算子，因此在 ONNX 圖上量化
+    """
+    from onnxruntime.quantization import (quantize_static, CalibrationDataReader, CalibrationMethod,
+                                          QuantFormat, QuantType)
+    
+    class SegmentReader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(calibration.split(1))
+        
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {EXPORT_INPUT_NAME: batch.numpy()}
+    
+    # 量化前先做形狀推斷和圖優化（新版 onnxruntime 建議），失敗時直接量化原圖
+    source = path
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        source = output_path + ".pre.onnx"
+        quant_pre_process(path, source)
+    except Exception as e:
+        print(f"量化預處理失敗，直接量化: {e}")
+        source = path
+    
+    quantize_static(
+        source, output_path, SegmentReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+        calibrate_method={
+            "minmax": CalibrationMethod.MinMax,
+            "entropy": CalibrationMethod.Entropy,
+            "percentile": CalibrationMethod.Percentile
+        }[method]
+    )
+    if source != path and os.path.exists(source):
+        os.remove(source)
+    return output_path
+
+def load_runner(variant, threads=None):
+    """加載導出的模型，返回 f(pixel_values 張量) -> 特徵 numpy 數組；無法在本地運行時返回None
+
+    threads 設置 ONNX Runtime 的線程數（TorchScript 使用 torch.set_num_threads）
+    """
+    if variant["format"] == "torchscript":
+        model = torch.jit.load(variant["path"], map_location="cpu").eval()
+        
+        def run(pixel_values):
+            with torch.no_grad():
+                return model(pixel_values).numpy()
+        return run
+    
+    if ort is None:
+        return None
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(variant["path"], options, providers=["CPUExecutionProvider"])
+    return lambda pixel_values: session.run(None, {EXPORT_INPUT_NAME: pixel_values.numpy()})[0]
+
+def compare_features(reference, output):
+    """與參考特徵的最大絕對誤差、餘弦相似度，以及區域間最近鄰的一致率
+
+    最近鄰一致率: 每個區域在其他區域中最相似的一個是否與參考特徵相同，反映量化對區域匹配的影響
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    output = np.asarray(output, dtype=np.float32)
+    reference_unit = reference / np.linalg.norm(reference, axis=-1, keepdims=True)
+    output_unit = output / np.linalg.norm(output, axis=-1, keepdims=True)
+    cosine = (reference_unit * output_unit).sum(-1)
+    
+    result = {
+        "max_abs_diff": float(np.abs(reference - output).max()),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean())
+    }
+    if len(reference) > 2:
+        similarity = [unit @ unit.T for unit in (reference_unit, output_unit)]
+        for matrix in similarity:
+            np.fill_diagonal(matrix, -np.inf)
+        result["neighbour_agreement"] = float((similarity[0].argmax(1) == similarity[1].argmax(1)).mean())
+    return result
+
+def time_runner(run, pixel_values, batch_size=1, iterations=20, warmup=3):
+    """單線程重複推理一批輸入，返回延遲分布(毫秒)"""
+    batch = pixel_values[:batch_size]
+    for _ in range(warmup):
+        run(batch)
+    
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run(batch)
+        latencies.append((time.perf_counter() - started) * 1000)
+    
+    latencies = np.array(latencies)
+    return {
+        "batch_size": len(batch),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(latencies.mean()),
+        "per_image_ms": float(latencies.mean() / len(batch))
+    }
+
+def export_variants(clip_model, example, export_path="qualcomm_vision_model", formats=EXPORT_FORMATS,
+                    calibration=None, calibration_method="minmax"):
+    """導出浮點和 int8 版本的圖像特徵圖，返回 [{name, format, precision, quantization, path}, ...]
+
+    提供 calibration（預處理後的區域）時另外導出靜態量化的 ONNX 版本，無法導出時拋出 RuntimeError；
+    未安裝 onnxruntime 時 ONNX 的動態 int8 版本無法導出，打印警告
+    """
+    module = ImageEmbeddingModel(clip_model).eval()
+    variants = []
+    
+    def add(export_format, precision, export, quantization=None):
+        name = f"{export_format}_{precision}" + (f"_{quantization}" if quantization == "static" else "")
+        extension = ".pt" if export_format == "torchscript" else ".onnx"
+        path = f"{export_path}{name[len(export_format):]}{extension}"
+        try:
+            export(path)
+        except Exception as e:
+            print(f"導出 {name} 失敗: {e}")
+            return
+        variants.append({"name": name, "format": export_format, "precision": precision,
+                         "quantization": quantization, "path": path})
+        print(f"已導出 {path}")
+    
+    if "torchscript" in formats:
+        add("torchscript", "fp32", lambda path: export_torchscript(module, path, example))
+        quantized = torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        add("torchscript", "int8", lambda path: export_torchscript(quantized, path, example), "dynamic")
+    
+    if "onnx" in formats:
+        onnx_path = f"{export_path}_fp32.onnx"
+        add("onnx", "fp32", lambda path: export_onnx(module, path, example))
+        if ort is None:
+            print("⚠️ 未安裝 onnxruntime，無法導出 ONNX int8 版本")
+        elif os.path.exists(onnx_path):
+            add("onnx", "int8", lambda path: quantize_onnx_dynamic(onnx_path, path), "dynamic")
+            if calibration is not None:
+                add("onnx", "int8", lambda path: quantize_onnx_static(onnx_path, path, calibration, calibration_method),
+                    "static")
+        
+        # 明確要求了靜態量化（提供了校準數據）時，不能在報告中靜默缺少該版本
+        if calibration is not None and not any(v["quantization"] == "static" for v in variants):
+            raise RuntimeError("已提供校準畫面，但靜態 int8 ONNX 版本未能導出（見上方錯誤）")
+    
+    return variants
+
+def measure_variants(clip_model, variants, pixel_values, batch_size=1, iterations=20, warmup=3):
+    """驗證每個導出版本與 get_image_features 的一致性，並在本地 CPU 上測量延遲和文件大小"""
+    with torch.no_grad():
+        reference = clip_model.get_image_features(pixel_values=pixel_values).numpy()
+    
+    for variant in variants:
+        variant["size_mb"] = model_size_mb(variant["path"])
+        run = load_runner(variant)
+        if run is None:
+            print(f"⚠️ 未安裝 onnxruntime，跳過 {variant['name']} 的一致性檢查和測速")
+            variant["parity"] = variant["latency"] = None
+            variant["parity_skipped"] = "未安裝 onnxruntime"
+            continue
+        
+        variant["output_dim"] = int(run(pixel_values[:1]).shape[-1])
+        variant["parity"] = compare_features(reference, run(pixel_values))
+        variant["latency"] = time_runner(run, pixel_values, batch_size, iterations, warmup)
+        threshold = FP32_MIN_COSINE if variant["precision"] == "fp32" else INT8_MIN_COSINE
+        variant["parity_ok"] = variant["parity"]["min_cosine"] >= threshold
+        
+    # 相對同一格式浮點版本的加速比
+    baselines = {v["format"]: v for v in variants if v["precision"] == "fp32" and v.get("latency")}
+    for variant in variants:
+        baseline = baselines.get(variant["format"])
+        if variant.get("latency") and baseline is not None:
+            variant["speedup"] = baseline["latency"]["p50_ms"] / variant["latency"]["p50_ms"]
+    
+    print(f"\n{'版本':<24}{'大小':>9}{'p50':>11}{'p95':>11}{'加速':>8}{'最小餘弦':>12}{'近鄰一致':>11}")
+    for variant in variants:
+        if not variant.get("latency"):
+            continue
+        parity = variant["parity"]
+        agreement = parity.get("neighbour_agreement")
+        print(f"{variant['name']:<24}{variant['size_mb']:7.1f}MB{variant['latency']['p50_ms']:9.2f}ms"
+              f"{variant['latency']['p95_ms']:9.2f}ms{variant.get('speedup', 1.0):7.2f}x{parity['min_cosine']:12.5f}"
+              f"{agreement if agreement is not None else float('nan'):11.1%}"
+              f"{'' if variant['parity_ok'] else '  ⚠️ 超出容差'}")
+    
+    return variants
+
+def select_variant(variants):
+    """選擇通過一致性檢查且延遲最低的版本"""
+    candidates = [v for v in variants if v.get("latency") and v.get("parity_ok")]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda v: v["latency"]["p50_ms"])
+
+def export_image_encoder(export_path="qualcomm_vision_model", formats=EXPORT_FORMATS, frames_dir=None,
+                         batch_size=1, iterations=20, warmup=3, calibration_dir=None,
+                         calibration_segments=CALIBRATION_SEGMENTS, calibration_method="minmax", image_size=None):
+    """導出圖像特徵圖（TorchScript/ONNX，fp32/int8），驗證、測速，並根據實測結果生成模型配置
+
+    calibration_dir（例如 evaluation_data）中的畫面用於靜態量化校準；與 frames_dir 相同時
+    跳過用於驗證的區域，漂移總是在未參與校準的區域上測量。
+    image_size 小於 224 時導出低解析度模型，並記錄其特徵與原生 224 輸入的差異。
+    選中的版本另存為 {export_path}.pt 或 {export_path}.onnx，配置保存為 {export_path}_config.json
+    """
+    # 靜態量化只支持 ONNX，需要 onnxruntime；在加載模型和採樣之前檢查
+    if calibration_dir is not None:
+        if "onnx" not in formats:
+            raise ValueError("靜態量化 (--calibration-frames) 需要導出 onnx 格式")
+        if ort is None:
+            raise RuntimeError("靜態量化 (--calibration-frames) 需要 onnxruntime: pip install onnxruntime")
+    
+    clip_model, processor = load_clip()
+    native_size = native_image_size(clip_model)
+    crops = sample_crops(frames_dir, count=max(16, batch_size))
+    
+    # 低解析度模式: 導出和一致性檢查都針對插值後的模型，質量另與原生輸入比較
+    resolution_quality = None
+    if image_size and image_size != native_size:
+        native_features = image_features(clip_model, preprocess(processor, crops))
+        clip_model = low_resolution_model(clip_model, image_size)
+        low_resolution_features = image_features(clip_model, preprocess(processor, crops, image_size))
+        resolution_quality = compare_features(native_features, low_resolution_features)
+        print(f"輸入 {image_size}x{image_size} 與原生 {native_size}x{native_size} 的特徵: "
+              f"平均餘弦 {resolution_quality['mean_cosine']:.4f}")
+    
+    pixel_values = preprocess(processor, crops, image_size)
+    image_size = pixel_values.shape[-1]
+    
+    calibration = None
+    if calibration_dir is not None:
+        offset = len(pixel_values) if calibration_dir == frames_dir else 0
+        calibration = sample_pixel_values(processor, calibration_dir, count=calibration_segments, offset=offset,
+                                          image_size=image_size)
+        print(f"使用 {len(calibration)} 個區域校準靜態量化 ({calibration_method})")
+    
+    variants = export_variants(clip_model, pixel_values[:1], export_path, formats, calibration, calibration_method)
+    measure_variants(clip_model, variants, pixel_values, batch_size, iterations, warmup)
+    
+    selected = select_variant(variants)
+    if selected is None:
+        raise RuntimeError("沒有通過一致性檢查並可在本地運行的導出版本")
+    model_file = export_path + os.path.splitext(selected["path"])[1]
+    shutil.copyfile(selected["path"], model_file)
+    
+    image_processor = processor.image_processor
+    config = {
+        "model_name": "visual_reference_clip",
+        "model_file": model_file,
+        "format": selected["format"],
+        "precision": selected["precision"].upper(),
+        "input_name": EXPORT_INPUT_NAME,
+        "output_name": EXPORT_OUTPUT_NAME,
+        "input_shape": [1, 3, image_size, image_size],
+        "output_shape": [1, selected["output_dim"]],
+        "preprocessing": {
+            "image_size": image_size,
+            "native_image_size": native_size,
+            "mean": list(image_processor.image_mean),
+            "std": list(image_processor.image_std)
+        },
+        "framework": "PyTorch" if selected["format"] == "torchscript" else "ONNX",
+        "description": "CLIP image embedding graph (vision tower + projection) for visual reference understanding",
+        "measured": {
+            "device": "local CPU",
+            "threads": torch.get_num_threads(),
+            **selected["latency"],
+            "size_mb": selected["size_mb"],
+            **selected["parity"]
+        },
+        "resolution_quality": resolution_quality,
+        # 未做一致性檢查的版本（不會被選中），避免報告看起來完整但實際未驗證
+        "skipped_parity": [{"name": v["name"], "reason": v["parity_skipped"]}
+                           for v in variants if v.get("parity_skipped")],
+        "variants": variants
+    }
+    
+    with open(f"{export_path}_config.json", "w") as f:
+        json.dump(config, f, indent=2)
+    
+    print(f"選中 {selected['name']}，模型已導出到: {model_file}")
+    return config
+
+def prepare_for_qualcomm_deployment(export_path="qualcomm_vision_model", **options):
     """準備部署到 Qualcomm AI Hub"""
     
     print("正在準備 Qualcomm AI Hub 部署...")
     
-    # 1. 創建優化的視覺編碼器
-    vision_encoder = QualcommVisionEncoder()
-    
-    # 2. 導出模型
-    model_path = vision_encoder.export_for_qualcomm()
+    # 1. 導出、驗證並測量圖像特徵圖
+    model_config = export_image_encoder(export_path, **options)
+    measured = model_config["measured"]
     
-    # 3. 創建部署配置
+    # 2. 根據實測結果創建部署配置
     deployment_config = {
         "target_device": "snapdragon",
         "optimization": "speed",
-        "precision": "INT8",
-        "max_batch_size": 1,
+        "precision": model_config["precision"],
+        "format": model_config["format"],
+        "max_batch_size": measured["batch_size"],
         "use_gpu": False,  # 使用 NPU/CPU
-        "model_files": [model_path],
+        "model_files": [model_config["model_file"], f"{export_path}_config.json"],
+        "measured_on_local_cpu": {
+            "p50_ms": measured["p50_ms"],
+            "p95_ms": measured["p95_ms"],
+            "per_image_ms": measured["per_image_ms"],
+            "size_mb": measured["size_mb"],
+            "min_cosine": measured["min_cosine"]
+        },
         "requirements": [
             "torch",
             "torchvision", 
@@ -140,17 +572,54 @@ def prepare_for_qualcomm_deployment():
             "numpy"
         ]
     }
+    if model_config["format"] == "onnx":
+        deployment_config["requirements"].append("onnxruntime")
     
     with open("qualcomm_deployment_config.json", "w") as f:
         json.dump(deployment_config, f, indent=2)
     
     print("✅ Qualcomm AI Hub 部署文件已準備完成!")
     print("📁 生成的文件:")
-    print("  - qualcomm_vision_model.pt (量化模型)")
-    print("  - qualcomm_vision_model_config.json (模型配置)")
+    print(f"  - {model_config['model_file']} (選中的模型: {model_config['format']} {model_config['precision']})")
+    print(f"  - {export_path}_config.json (模型配置和各版本實測結果)")
     print("  - qualcomm_deployment_config.json (部署配置)")
     
     return deployment_config
 
 if __name__ == "__main__":
-    prepare_for_qualcomm_deployment()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="導出、驗證並測量 Qualcomm 部署用的圖像特徵模型")
+    parser.add_argument("--export-path", default="qualcomm_vision_model")
+    parser.add_argument("--formats", nargs="+", default=list(EXPORT_FORMATS), choices=list(EXPORT_FORMATS))
+    parser.add_argument("--frames", default=None, help="用於驗證和測速的圖像目錄（例如 evaluation_data），默認使用合成畫面")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--calibration-frames", default=None,
+                        help="靜態量化的校準圖像目錄（例如 evaluation_data），不指定時不做靜態量化")
+    parser.add_argument("--calibration-segments", type=int, default=CALIBRATION_SEGMENTS)
+    parser.add_argument("--calibration-method", default="minmax", choices=list(CALIBRATION_METHODS))
+    parser.add_argument("--image-size", type=int, default=None,
+                        help=f"CLIP 輸入大小（32 的倍數），如 {LOW_RESOLUTION_SIZE}；默認為原生 224")
+    parser.add_argument("--evaluate-resolutions", type=int, nargs="+", default=None,
+                        help="只比較這些輸入大小的特徵質量和推理成本，如 224 160 128 96")
+    args = parser.parse_args()
+    
+    if args.evaluate_resolutions:
+        results = evaluate_resolutions(args.evaluate_resolutions, args.frames, iterations=args.iterations,
+                                       warmup=args.warmup)
+        with open(f"{args.export_path}_resolutions.json", "w") as f:
+            json.dump(results, f, indent=2)
+        raise SystemExit(0)
+    
+    prepare_for_qualcomm_deployment(
+        args.export_path,
+        formats=args.formats,
+        frames_dir=args.frames,
+        batch_size=args.batch_size,
+        iterations=args.iterations,
+        warmup=args.warmup,
+        calibration_dir=args.calibration_frames,
+        calibration_segments=args.calibration_segments,
+        calibration_method=args.calibration_method,
+        image_size=args.image_size
+    )
\ No newline at end of file
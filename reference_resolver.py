@@ -5,10 +5,137 @@ import cv2
 from PIL import Image
 import io
 import base64
+import threading
+import time
+
+from latency_trace import span
+from metrics import REGISTRY
+from text_vocabulary import format_tags
+
+OPENAI_REQUESTS = REGISTRY.counter("openai_requests_total", "OpenAI 請求數（按模型和結果）", ["model", "outcome"])
+OPENAI_SECONDS = REGISTRY.histogram("openai_request_seconds", "OpenAI 請求耗時", ["model"])
+OPENAI_PAYLOAD = REGISTRY.counter("openai_payload_bytes_total", "OpenAI 請求內容的估算大小", ["model"])
+
+# 簡單指示詞（繁體與簡體）
+DEMONSTRATIVES = ("這個", "那個", "這裡", "那裡", "這是", "那是",
+                  "这个", "那个", "这里", "那里", "这是")
+
+# 位置詞
+POSITION_WORDS = ("左上", "右上", "左下", "右下", "中間", "中间", "左", "右", "上面", "下面")
+
+# 顏色詞（繁體與簡體）
+COLOR_WORDS = ("紅", "红", "藍", "蓝", "綠", "绿", "黃", "黄", "黑", "白", "灰",
+               "紫", "橙", "粉", "棕")
+
+# 位置詞對應的網格行列: 0 為第一行/列，1 為最後一行/列，0.5 為中間，None 表示不限
+POSITION_CELLS = {
+    "左上": (0, 0), "右上": (0, 1), "左下": (1, 0), "右下": (1, 1),
+    "中間": (0.5, 0.5), "中间": (0.5, 0.5),
+    "左": (None, 0), "右": (None, 1), "上面": (0, None), "下面": (1, None)
+}
+
+# 顏色詞對應的 HSV 範圍 (OpenCV: H 0-179, S/V 0-255)，每個顏色可有多段
+COLOR_RANGES = {
+    "紅": [((0, 80, 50), (10, 255, 255)), ((170, 80, 50), (179, 255, 255))],
+    "橙": [((10, 80, 50), (22, 255, 255))],
+    "黃": [((22, 80, 50), (35, 255, 255))],
+    "綠": [((35, 60, 40), (85, 255, 255))],
+    "藍": [((85, 60, 40), (130, 255, 255))],
+    "紫": [((130, 60, 40), (160, 255, 255))],
+    "粉": [((160, 40, 120), (170, 255, 255))],
+    "棕": [((5, 80, 20), (20, 255, 150))],
+    "黑": [((0, 0, 0), (179, 255, 50))],
+    "白": [((0, 0, 200), (179, 40, 255))],
+    "灰": [((0, 0, 50), (179, 40, 200))]
+}
+SIMPLIFIED_COLORS = {"红": "紅", "蓝": "藍", "绿": "綠", "黄": "黃"}
+
+def contains_demonstrative(text):
+    """檢查文本是否包含簡單指示詞"""
+    return bool(text) and any(word in text for word in DEMONSTRATIVES)
+
+def extract_reference_cues(text):
+    """在本地從文本中提取可識別的參照線索（不調用遠程模型）
+
+    返回 {"demonstrative": bool, "positions": frozenset, "colors": frozenset}，沒有線索時返回None
+    """
+    if not text:
+        return None
+    
+    positions = set()
+    remaining = text
+    # 先匹配較長的組合位置詞，避免"左上"同時計為"左"
+    for word in POSITION_WORDS:
+        if word in remaining:
+            positions.add(word)
+            remaining = remaining.replace(word, " ")
+    
+    colors = frozenset(word for word in COLOR_WORDS if word in text)
+    demonstrative = contains_demonstrative(text)
+    
+    if not (demonstrative or positions or colors):
+        return None
+    
+    return {
+        "demonstrative": demonstrative,
+        "positions": frozenset(positions),
+        "colors": colors
+    }
+
+def parse_reference_text(ref_info):
+    """從 extract_references 的輸出中取出引用文本
+
+    明確沒有引用時返回None，找不到引用行時返回空字符串
+    """
+    lines = ref_info.strip().split('\n')
+    ref_text = ""
+    for line in lines:
+        if line.startswith("引用文本:"):
+            ref_text = line.split("引用文本:")[1].strip()
+            if ref_text == "無引用" or ref_text == "無":
+                return None
+    
+    # 如果找不到引用文本，嘗試其他格式
+    if not ref_text:
+        for line in lines:
+            if "引用:" in line:
+                ref_text = line.split("引用:")[1].strip()
+                if ref_text == "無引用" or ref_text == "無":
+                    return None
+    
+    return ref_text
+
+def payload_size(messages):
+    """估算請求內容的大小（文本和圖像 data URL 的字符數）"""
+    size = 0
+    for message in messages:
+        for part in message["content"]:
+            size += len(part.get("text") or part.get("image_url") or "")
+    return size
 
 class ReferenceResolver:
-    def __init__(self, api_key):
-        self.openai_client = openai.OpenAI(api_key=api_key)
+    def __init__(self, api_key, timeout=None, max_retries=2, refiner=None, text_only=False):
+        # timeout 為每次 OpenAI 請求的超時(秒)，避免掛起的請求長期佔用服務線程
+        self.openai_client = openai.OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+        # 可選的 HierarchicalRefiner: 在解析出的網格單元內進一步定位
+        self.refiner = refiner
+        # 區域已有詞彙標籤（見 text_vocabulary.py）時，參照解析只發送標籤文本而不發送區域圖像
+        self.text_only = text_only
+    
+    def _create_response(self, model, input):
+        """調用 OpenAI responses API，記錄模型名稱、請求大小和耗時"""
+        size = payload_size(input)
+        OPENAI_PAYLOAD.labels(model=model).inc(size)
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            with span("openai", model=model, payload_bytes=size):
+                response = self.openai_client.responses.create(model=model, input=input)
+            outcome = "ok"
+            return response
+        finally:
+            OPENAI_SECONDS.labels(model=model).observe(time.perf_counter() - started)
+            OPENAI_REQUESTS.labels(model=model, outcome=outcome).inc()
     
     def extract_references(self, text):
         """從文本中提取更複雜的指示性引用"""
@@ -31,7 +158,7 @@ class ReferenceResolver:
         
         try:
             # 嘗試使用主要模型
-            response = self.openai_client.responses.create(
+            response = self._create_response(
                 model="gpt-4.1-nano-2025-04-14",
                 input=[{
                     "role": "user",
@@ -47,7 +174,7 @@ class ReferenceResolver:
             
             try:
                 # 嘗試使用替代模型
-                response = self.openai_client.responses.create(
+                response = self._create_response(
                     model="gpt-4.1-mini",
                     input=[{
                         "role": "user",
@@ -65,43 +192,22 @@ class ReferenceResolver:
                 return "引用類型: 無引用\n引用文本: 無引用\n位置信息: 無\n特性信息: 無\n對象類型: 無"
     
     def resolve_reference(self, scene_data, reference_text):
-        """解析參照並確定其指向的視覺區域"""
-        # 提取每個區段的小圖片
-        images_data = []
-        for i, segment in enumerate(scene_data["segments"]):
-            # 將OpenCV圖像(BGR)轉換為PIL圖像(RGB)
-            img = cv2.cvtColor(segment["image"], cv2.COLOR_BGR2RGB)
-            pil_img = Image.fromarray(img)
-            
-            # 轉換為字節
-            img_byte_arr = io.BytesIO()
-            pil_img.save(img_byte_arr, format='JPEG')
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            # 添加到圖像數據列表
-            position = segment["position"]
-            pos_text = f"位置({position[0]},{position[1]})"
-            images_data.append({
-                "image": img_byte_arr,
-                "position": pos_text
-            })
-        
-        # 創建提示信息
-        content = [
-            {"type": "input_text", "text": f"請根據以下提示確定指示性引用'{reference_text}'最可能指向哪個位置的物體。僅返回最可能的位置編號，格式為'位置(行,列)'。"}
-        ]
-        
-        # 添加所有圖像
-        for img_data in images_data:
-            content.append({
-                "type": "input_image",
-                "image_url": f"data:image/jpeg;base64,{base64.b64encode(img_data['image']).decode('utf-8')}"
-            })
-            content.append({"type": "input_text", "text": img_data["position"]})
+        """解析參照並確定其指向的視覺區域（設置了 refiner 時返回單元內更精確的子區域）"""
+        segment = self.resolve_cell(scene_data, reference_text)
+        if segment is not None and self.refiner is not None:
+            segment = self.refiner.refine(scene_data, segment, reference_text)
+        return segment
+    
+    def resolve_cell(self, scene_data, reference_text):
+        """用遠程模型在場景的區域中選擇參照指向的區域"""
+        if self.text_only and scene_data["segments"] and all("tags" in s for s in scene_data["segments"]):
+            content = self._tag_content(scene_data["segments"], reference_text)
+        else:
+            content = self._image_content(scene_data["segments"], reference_text)
         
         try:
             # 嘗試使用主要模型
-            response = self.openai_client.responses.create(
+            response = self._create_response(
                 model="gpt-4.1-nano-2025-04-14",
                 input=[{
                     "role": "user",
@@ -117,7 +223,7 @@ class ReferenceResolver:
             
             try:
                 # 嘗試使用替代模型
-                response = self.openai_client.responses.create(
+                response = self._create_response(
                     model="gpt-4.1-mini",
                     input=[{
                         "role": "user",
@@ -149,12 +255,72 @@ class ReferenceResolver:
         
         return None
     
-    def generate_response(self, text, scene_data, additional_context=None, is_final_summary=False):
-        """生成對用戶查詢的回應"""
+    def _image_content(self, segments, reference_text):
+        """參照解析提示: 每個區域的 JPEG 圖像及其位置"""
+        # 提取每個區段的小圖片
+        with span("jpeg_encode", images=len(segments)):
+            images_data = []
+            for i, segment in enumerate(segments):
+                # 將OpenCV圖像(BGR)轉換為PIL圖像(RGB)
+                img = cv2.cvtColor(segment["image"], cv2.COLOR_BGR2RGB)
+                pil_img = Image.fromarray(img)
+                
+                # 轉換為字節
+                img_byte_arr = io.BytesIO()
+                pil_img.save(img_byte_arr, format='JPEG')
+                img_byte_arr = img_byte_arr.getvalue()
+                
+                # 添加到圖像數據列表
+                position = segment["position"]
+                pos_text = f"位置({position[0]},{position[1]})"
+                images_data.append({
+                    "image": img_byte_arr,
+                    "position": pos_text
+                })
+        
+        # 創建提示信息
+        content = [
+            {"type": "input_text", "text": f"請根據以下提示確定指示性引用'{reference_text}'最可能指向哪個位置的物體。僅返回最可能的位置編號，格式為'位置(行,列)'。"}
+        ]
+        
+        # 添加所有圖像
+        for img_data in images_data:
+            content.append({
+                "type": "input_image",
+                "image_url": f"data:image/jpeg;base64,{base64.b64encode(img_data['image']).decode('utf-8')}"
+            })
+            content.append({"type": "input_text", "text": img_data["position"]})
+        
+        return content
+    
+    def _tag_content(self, segments, reference_text):
+        """參照解析提示: 只用每個區域的詞彙標籤描述場景，不發送圖像"""
+        lines = [f"位置({s['position'][0]},{s['position'][1]}): {format_tags(s['tags'])}" for s in segments]
+        return [{
+            "type": "input_text",
+            "text": ("畫面被分為以下區域，每行為區域位置和其中可能的顏色與物體（自動標註，可能不準確）:\n"
+                     + "\n".join(lines)
+                     + f"\n請確定指示性引用'{reference_text}'最可能指向哪個位置的物體。僅返回最可能的位置編號，格式為'位置(行,列)'。")
+        }]
+    
+    def generate_response(self, text, scene_data, additional_context=None, is_final_summary=False,
+                          pointed_segment=None, resolved_segment=None):
+        """生成對用戶查詢的回應
+
+        若提供了手勢指向的區域段且文本包含指示詞，直接使用該區域，跳過遠程參照提取與解析；
+        若提供了已解析的區域段（例如推測解析已確認的結果），同樣直接使用
+        """
         # 如果是最終摘要，使用不同的處理邏輯
         if is_final_summary:
             return self.generate_session_summary(text, scene_data, additional_context)
         
+        if resolved_segment is not None:
+            return self.describe_segment(text, resolved_segment)
+        
+        if pointed_segment is not None and contains_demonstrative(text):
+            print(f"使用手勢指向的區域: 位置({pointed_segment['position'][0]},{pointed_segment['position'][1]})")
+            return self.describe_segment(text, pointed_segment)
+        
         # 標準處理流程
         # 提取參照
         try:
@@ -168,7 +334,7 @@ class ReferenceResolver:
         if "無引用" in ref_info:
             prompt = f"用戶說: {text}\n請提供適當的回應。"
             try:
-                response = self.openai_client.responses.create(
+                response = self._create_response(
                     model="gpt-4.1-nano-2025-04-14",
                     input=[{
                         "role": "user",
@@ -182,7 +348,7 @@ class ReferenceResolver:
                 print(f"使用 gpt-4.1-nano-2025-04-14 模型回應文本時出錯: {e}")
                 try:
                     # 嘗試使用替代模型
-                    response = self.openai_client.responses.create(
+                    response = self._create_response(
                         model="gpt-4.1-mini",
                         input=[{
                             "role": "user",
@@ -196,21 +362,9 @@ class ReferenceResolver:
                     return {"type": "text", "content": f"無法處理您的請求。請稍後再試。錯誤: {str(e2)}"}
         
         # 解析參照行獲取對象描述
-        lines = ref_info.strip().split('\n')
-        ref_text = ""
-        for line in lines:
-            if line.startswith("引用文本:"):
-                ref_text = line.split("引用文本:")[1].strip()
-                if ref_text == "無引用" or ref_text == "無":
-                    return {"type": "text", "content": "我不確定你指的是什麼。"}
-        
-        # 如果找不到引用文本，嘗試其他格式
-        if not ref_text:
-            for line in lines:
-                if "引用:" in line:
-                    ref_text = line.split("引用:")[1].strip()
-                    if ref_text == "無引用" or ref_text == "無":
-                        return {"type": "text", "content": "我不確定你指的是什麼。"}
+        ref_text = parse_reference_text(ref_info)
+        if ref_text is None:
+            return {"type": "text", "content": "我不確定你指的是什麼。"}
         
         # 解析參照到視覺區域
         try:
@@ -222,21 +376,26 @@ class ReferenceResolver:
         if referenced_segment is None:
             return {"type": "text", "content": "我不確定你指的是哪個物體。"}
         
-        # 使用GPT-4.1分析該區域
-        img = cv2.cvtColor(referenced_segment["image"], cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img)
-        
-        # 轉換為字節
-        img_byte_arr = io.BytesIO()
-        pil_img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
+        return self.describe_segment(text, referenced_segment)
+    
+    def describe_segment(self, text, referenced_segment):
+        """分析參照區域並回答用戶的問題"""
+        with span("jpeg_encode", images=1):
+            # 使用GPT-4.1分析該區域
+            img = cv2.cvtColor(referenced_segment["image"], cv2.COLOR_BGR2RGB)
+            pil_img = Image.fromarray(img)
+            
+            # 轉換為字節
+            img_byte_arr = io.BytesIO()
+            pil_img.save(img_byte_arr, format='JPEG')
+            img_byte_arr = img_byte_arr.getvalue()
         
         # 創建請求
         prompt = f"用戶問: \"{text}\"\n\n分析這個圖像並回答用戶的問題。如果用戶是在詢問圖像中的物體，請描述該物體。請給出簡潔、信息豐富的回答。"
         
         try:
             # 嘗試使用主要模型
-            response = self.openai_client.responses.create(
+            response = self._create_response(
                 model="gpt-4.1-nano-2025-04-14",
                 input=[{
                     "role": "user",
@@ -261,7 +420,7 @@ class ReferenceResolver:
             
             try:
                 # 嘗試使用替代模型
-                response = self.openai_client.responses.create(
+                response = self._create_response(
                     model="gpt-4.1-mini",
                     input=[{
                         "role": "user",
@@ -289,29 +448,30 @@ class ReferenceResolver:
     
     def generate_session_summary(self, full_transcription, final_scene, context=None):
         """生成整個錄製會話的綜合分析"""
-        # 準備完整的場景圖像
-        img = cv2.cvtColor(final_scene["frame"], cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img)
-        
-        # 轉換為字節
-        img_byte_arr = io.BytesIO()
-        pil_img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
-        # 準備分段小圖像
-        segment_images = []
-        for segment in final_scene["segments"]:
-            seg_img = cv2.cvtColor(segment["image"], cv2.COLOR_BGR2RGB)
-            seg_pil = Image.fromarray(seg_img)
+        with span("jpeg_encode", images=len(final_scene["segments"]) + 1):
+            # 準備完整的場景圖像
+            img = cv2.cvtColor(final_scene["frame"], cv2.COLOR_BGR2RGB)
+            pil_img = Image.fromarray(img)
             
-            seg_byte_arr = io.BytesIO()
-            seg_pil.save(seg_byte_arr, format='JPEG')
+            # 轉換為字節
+            img_byte_arr = io.BytesIO()
+            pil_img.save(img_byte_arr, format='JPEG')
+            img_byte_arr = img_byte_arr.getvalue()
             
-            position = segment["position"]
-            segment_images.append({
-                "image": seg_byte_arr.getvalue(),
-                "position": f"位置({position[0]},{position[1]})"
-            })
+            # 準備分段小圖像
+            segment_images = []
+            for segment in final_scene["segments"]:
+                seg_img = cv2.cvtColor(segment["image"], cv2.COLOR_BGR2RGB)
+                seg_pil = Image.fromarray(seg_img)
+                
+                seg_byte_arr = io.BytesIO()
+                seg_pil.save(seg_byte_arr, format='JPEG')
+                
+                position = segment["position"]
+                segment_images.append({
+                    "image": seg_byte_arr.getvalue(),
+                    "position": f"位置({position[0]},{position[1]})"
+                })
         
         # 準備提示
         duration_text = ""
@@ -359,7 +519,7 @@ class ReferenceResolver:
         
         try:
             # 首先嘗試使用 gpt-4.1-nano-2025-04-14 模型
-            response = self.openai_client.responses.create(
+            response = self._create_response(
                 model="gpt-4.1-nano-2025-04-14",
                 input=[{
                     "role": "user",
@@ -379,7 +539,7 @@ class ReferenceResolver:
             
             try:
                 # 嘗試使用 gpt-4.1-mini 模型作為備選
-                response = self.openai_client.responses.create(
+                response = self._create_response(
                     model="gpt-4.1-mini",
                     input=[{
                         "role": "user",
@@ -398,4 +558,423 @@ class ReferenceResolver:
                 return {
                     "type": "summary",
                     "content": f"無法生成摘要分析。請檢查您的 OpenAI API 金鑰是否有效，或者聯繫系統管理員。\n錯誤詳情: {str(e2)}"
-                }
\ No newline at end of file
+                }
+
+
+class CueReferenceResolver:
+    """只用本地線索的參照解析器，不調用遠程模型
+
+    根據文本中的位置詞選擇網格區域，根據顏色詞在候選區域中選擇該顏色像素最多的區域，
+    沒有線索時與 ReferenceResolver 一樣回退到中間區域。用於離線回放和無 API 的測試
+    """
+    
+    def resolve_reference(self, scene_data, reference_text):
+        """解析參照並確定其指向的視覺區域"""
+        segments = scene_data["segments"]
+        if not segments:
+            return None
+        
+        cues = extract_reference_cues(reference_text)
+        candidates = segments
+        if cues is not None and cues["positions"]:
+            candidates = self._filter_by_position(segments, cues["positions"]) or segments
+        
+        if cues is not None and cues["colors"]:
+            return max(candidates, key=lambda segment: self.color_score(segment["image"], cues["colors"]))
+        
+        if candidates is segments:
+            return segments[len(segments) // 2]
+        return candidates[len(candidates) // 2]
+    
+    def generate_response(self, text, scene_data, additional_context=None, is_final_summary=False,
+                          pointed_segment=None, resolved_segment=None):
+        """生成與 ReferenceResolver 相同結構的回應（內容只描述區域位置）"""
+        if resolved_segment is None:
+            if pointed_segment is not None and contains_demonstrative(text):
+                resolved_segment = pointed_segment
+            elif extract_reference_cues(text) is not None:
+                resolved_segment = self.resolve_reference(scene_data, text)
+        
+        if resolved_segment is None:
+            return {"type": "text", "content": "我不確定你指的是什麼。"}
+        
+        position = resolved_segment["position"]
+        return {
+            "type": "reference_response",
+            "content": f"位置({position[0]},{position[1]})",
+            "segment": resolved_segment
+        }
+    
+    @staticmethod
+    def _filter_by_position(segments, positions):
+        """保留符合所有位置詞的區域"""
+        rows = max(segment["position"][0] for segment in segments) + 1
+        cols = max(segment["position"][1] for segment in segments) + 1
+        
+        def matches(segment, word):
+            row, col = POSITION_CELLS[word]
+            if row is not None and segment["position"][0] != round(row * (rows - 1)):
+                return False
+            if col is not None and segment["position"][1] != round(col * (cols - 1)):
+                return False
+            return True
+        
+        return [segment for segment in segments
+                if all(matches(segment, word) for word in positions if word in POSITION_CELLS)]
+    
+    @staticmethod
+    def color_score(image, colors):
+        """區域中符合任一顏色詞的像素比例"""
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+        for color in colors:
+            for lower, upper in COLOR_RANGES.get(SIMPLIFIED_COLORS.get(color, color), []):
+                mask |= cv2.inRange(hsv, lower, upper)
+        return cv2.countNonZero(mask) / mask.size if mask.size else 0
+
+
+class ClipReferenceResolver:
+    """用 CLIP 文本特徵與各區域圖像特徵的餘弦相似度選擇區域，不調用遠程模型
+
+    encoder 為 VisionEncoder，場景中的區域需已由 encode_segments 編碼；
+    CLIP 文本編碼器只理解英文，參照中的物體和顏色詞先由 vocabulary（TextVocabulary）
+    組合為英文提示（"a photo of a red cup." 等）再編碼，沒有詞彙中的詞時放棄（返回None）；
+    refiner 為可選的 HierarchicalRefiner，在選出的區域內進一步定位（共用同一次文本編碼）
+    """
+    
+    def __init__(self, encoder, vocabulary, refiner=None):
+        self.encoder = encoder
+        self.vocabulary = vocabulary
+        self.refiner = refiner
+    
+    def resolve_reference(self, scene_data, reference_text):
+        """解析參照並確定其指向的視覺區域"""
+        segments = scene_data["segments"]
+        if not segments:
+            return None
+        
+        prompts = self.vocabulary.english_prompts(reference_text)
+        if not prompts:
+            return None
+        text_features = self.encoder.encode_text(prompts).mean(axis=0)
+        text_features = text_features / np.linalg.norm(text_features)
+        image_features = np.concatenate([segment["features"] for segment in segments])
+        image_features = image_features / np.linalg.norm(image_features, axis=1, keepdims=True)
+        segment = segments[int(np.argmax(image_features @ text_features))]
+        if self.refiner is not None:
+            segment = self.refiner.refine(scene_data, segment, reference_text, text_features=text_features)
+        return segment
+
+
+class TagReferenceResolver:
+    """用預計算的詞彙文本特徵選擇區域，不運行文本編碼器也不調用遠程模型
+
+    從參照文本中匹配詞彙中的物體和顏色詞，用位置詞過濾候選區域，
+    選擇與所有匹配詞的 CLIP 相似度之和最高的區域（一次矩陣乘法）；
+    文本中沒有詞彙中的詞時交給 fallback（默認 CueReferenceResolver）
+    """
+    
+    def __init__(self, vocabulary, fallback=None):
+        self.vocabulary = vocabulary
+        self.fallback = fallback if fallback is not None else CueReferenceResolver()
+    
+    def resolve_reference(self, scene_data, reference_text):
+        """解析參照並確定其指向的視覺區域"""
+        segments = scene_data["segments"]
+        if not segments:
+            return None
+        
+        indices = self.vocabulary.match_terms(reference_text)
+        if not indices:
+            return self.fallback.resolve_reference(scene_data, reference_text)
+        
+        cues = extract_reference_cues(reference_text)
+        candidates = segments
+        if cues is not None and cues["positions"]:
+            candidates = CueReferenceResolver._filter_by_position(segments, cues["positions"]) or segments
+        
+        scores = self.vocabulary.scores(np.concatenate([segment["features"] for segment in candidates]), indices)
+        return candidates[int(np.argmax(scores.sum(axis=1)))]
+
+
+class HierarchicalRefiner:
+    """由粗到細定位: 在已選出的區域內遞歸細分，用 CLIP 在子區域中重新排序
+
+    每層把當前區域分為 split 個略有重疊的子區域並批量編碼（一次模型調用），
+    選擇與參照文本最相似的子區域；子區域的相似度不高於當前區域（參照指向整個區域）、
+    或子區域小於 min_size 像素時停止。只對選中的區域細分，成本為每層 rows*cols 個區域，
+    與整個畫面使用細網格（每層乘以 rows*cols）相比固定不變。
+
+    返回的區域保留原網格位置 position（前端高亮、評估和位置詞不受影響），
+    coordinates 和 image 為細分後的子區域，refinement 記錄每層選中的子區域行列。
+
+    CLIP 文本編碼器只理解英文，參照文本先用 vocabulary（TextVocabulary）匹配其中的物體和顏色詞，
+    以這些詞的預計算英文提示特徵排序子區域；沒有匹配的詞時不細分，返回原區域
+    """
+    
+    def __init__(self, encoder, vocabulary, depth=2, split=(2, 2), overlap=0.25, min_size=48):
+        self.encoder = encoder
+        self.vocabulary = vocabulary
+        self.depth = depth
+        self.split = split
+        self.overlap = overlap
+        self.min_size = min_size
+    
+    def subdivide(self, coordinates):
+        """把區域分為 split 個子區域，每邊向外擴展 overlap 倍子區域大小以免切開物體"""
+        x1, y1, x2, y2 = coordinates
+        rows, cols = self.split
+        cell_w = (x2 - x1) / cols
+        cell_h = (y2 - y1) / rows
+        pad_x = cell_w * self.overlap / 2
+        pad_y = cell_h * self.overlap / 2
+        cells = []
+        for i in range(rows):
+            for j in range(cols):
+                cells.append(((i, j), (
+                    int(max(x1, x1 + j * cell_w - pad_x)),
+                    int(max(y1, y1 + i * cell_h - pad_y)),
+                    int(min(x2, x1 + (j + 1) * cell_w + pad_x)),
+                    int(min(y2, y1 + (i + 1) * cell_h + pad_y))
+                )))
+        return cells
+    
+    def refine(self, scene_data, segment, reference_text, text_features=None):
+        """在 segment 內由粗到細定位 reference_text，畫面不可用或參照中沒有詞彙中的詞時返回原區域
+
+        text_features 為調用方已計算的英文文本特徵（例如 ClipReferenceResolver），默認由詞彙得出
+        """
+        frame = scene_data.get("frame")
+        if frame is None or not reference_text or self.depth <= 0:
+            return segment
+        if text_features is None:
+            text_features = self.vocabulary.text_features(reference_text)
+            if text_features is None:
+                return segment
+        
+        rows, cols = self.split
+        with span("refine", depth=self.depth):
+            current = segment
+            score = self._scores([segment], text_features)[0] if "features" in segment else -np.inf
+            path = []
+            for _ in range(self.depth):
+                x1, y1, x2, y2 = current["coordinates"]
+                if min((x2 - x1) / cols, (y2 - y1) / rows) < self.min_size:
+                    break
+                
+                cells = [{
+                    "image": frame[cy1:cy2, cx1:cx2],
+                    "position": position,
+                    "coordinates": (cx1, cy1, cx2, cy2)
+                } for position, (cx1, cy1, cx2, cy2) in self.subdivide(current["coordinates"])]
+                encoded = self.encoder.encode_segments(cells, batch_size=None)
+                scores = self._scores(encoded, text_features)
+                best = int(np.argmax(scores))
+                if scores[best] <= score:
+                    break
+                
+                current = encoded[best]
+                score = scores[best]
+                path.append(current["position"])
+        
+        if not path:
+            return segment
+        
+        return {
+            **segment,
+            "features": current["features"],
+            "coordinates": current["coordinates"],
+            "image": current["image"],
+            "refinement": path
+        }
+    
+    @staticmethod
+    def _scores(segments, text_features):
+        """區域圖像特徵與歸一化文本特徵的餘弦相似度"""
+        image_features = np.concatenate([segment["features"] for segment in segments])
+        image_features = image_features / np.linalg.norm(image_features, axis=1, keepdims=True)
+        return image_features @ text_features
+
+
+class ReferenceSpeculator:
+    """根據即時部分轉錄推測性地提前進行場景捕獲和區域解析
+
+    部分文本中出現可識別的參照線索時，由單個後台工作線程捕獲場景並按與最終文本相同的流程
+    （extract_references 的無引用檢查、引用文本解析）解析區域。工作線程一次只執行一個推測，
+    較新的部分文本替換尚未開始的推測，執行中的推測被取代後不再調用解析器；
+    線索不變時重用已捕獲的場景。
+
+    最終文本到達時:
+      - 線索與推測不一致: 丟棄
+      - 文本與推測使用的文本相同: 使用推測的場景和區域（與最終路徑結果一致）
+      - 文本不同或推測未找到引用: 只重用已捕獲的場景，區域由最終路徑重新解析
+    """
+    
+    def __init__(self, resolver, capture_scene, find_pointed_segment=None, confirm_timeout=5.0,
+                 idle_timeout=30.0):
+        self.resolver = resolver
+        self.capture_scene = capture_scene                  # 返回場景數據的函數
+        self.find_pointed_segment = find_pointed_segment    # 根據場景返回手勢指向區域的函數
+        self.confirm_timeout = confirm_timeout
+        self.idle_timeout = idle_timeout                    # 工作線程空閒多久後退出(秒)
+        
+        self._condition = threading.Condition()
+        self._pending = None        # 等待執行的推測（只保留最新的一個）
+        self._speculation = None    # 正在執行或已完成、等待確認的推測
+        self._worker = None
+        
+        # 統計（持有 _condition 時更新）
+        self.started = 0
+        self.confirmed = 0
+        self.scenes_reused = 0
+        self.discarded = 0
+    
+    @staticmethod
+    def normalize_text(text):
+        """比較文本時忽略空白和標點"""
+        return "".join(ch for ch in (text or "") if ch.isalnum())
+    
+    def on_partial(self, text):
+        """處理一條部分轉錄，必要時排入新的推測，返回是否排入"""
+        cues = extract_reference_cues(text)
+        if cues is None:
+            return False
+        
+        with self._condition:
+            latest = self._pending or self._speculation
+            if latest is not None and self.normalize_text(latest["text"]) == self.normalize_text(text):
+                return False
+            
+            if self._pending is not None:
+                self.discarded += 1
+            self._pending = {
+                "text": text,
+                "cues": cues,
+                "scene": None,
+                "segment": None,
+                "started": time.time(),
+                "done": threading.Event()
+            }
+            self.started += 1
+            
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+        return True
+    
+    def _work(self):
+        """工作線程: 依次執行最新的推測，空閒超過 idle_timeout 後退出"""
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: self._pending is not None, timeout=self.idle_timeout):
+                    self._worker = None
+                    return
+                speculation = self._pending
+                self._pending = None
+                previous = self._speculation
+                if previous is not None:
+                    # 被新推測取代的舊推測不再等待確認
+                    self.discarded += 1
+                self._speculation = speculation
+            
+            # 線索不變時重用上一個推測的場景，避免重複讀取攝像頭和編碼
+            reuse = previous if previous is not None and previous["cues"] == speculation["cues"] else None
+            self._run(speculation, reuse["scene"] if reuse is not None else None)
+    
+    def _superseded(self, speculation):
+        """已有更新的推測排隊或推測已被確認/重置"""
+        with self._condition:
+            return self._speculation is not speculation or self._pending is not None
+    
+    def _run(self, speculation, scene=None):
+        """捕獲場景並解析區域（與 generate_response 的最終路徑相同的引用檢查）"""
+        try:
+            if scene is None:
+                scene = self.capture_scene()
+            if scene is None:
+                return
+            speculation["scene"] = scene
+            if self._superseded(speculation):
+                return
+            
+            text = speculation["text"]
+            segment = None
+            if self.find_pointed_segment is not None and contains_demonstrative(text):
+                segment = self.find_pointed_segment(scene)
+            if segment is None:
+                extract_references = getattr(self.resolver, "extract_references", None)
+                if extract_references is None:
+                    segment = self.resolver.resolve_reference(scene, text)
+                else:
+                    ref_info = extract_references(text)
+                    ref_text = None if "無引用" in ref_info else parse_reference_text(ref_info)
+                    if ref_text is not None and not self._superseded(speculation):
+                        segment = self.resolver.resolve_reference(scene, ref_text)
+            speculation["segment"] = segment
+            print(f"推測解析完成 ({time.time() - speculation['started']:.2f}s): {text}")
+        except Exception as e:
+            print(f"推測解析錯誤: {e}")
+        finally:
+            speculation["done"].set()
+    
+    def confirm(self, final_text):
+        """用最終文本確認推測結果
+
+        返回 {"scene", "segment"}: 文本與推測一致時 segment 為推測解析的區域，
+        否則為None（只重用場景）；線索不一致或推測失敗時丟棄推測並返回None
+        """
+        # 最新的推測可能還在排隊，由工作線程執行後再確認
+        with self._condition:
+            speculation = self._pending or self._speculation
+        
+        if speculation is None:
+            return None
+        
+        if extract_reference_cues(final_text) != speculation["cues"]:
+            self._finish(speculation)
+            print(f"推測與最終文本不一致，丟棄: {speculation['text']}")
+            return None
+        
+        # 推測仍在進行時等待其完成，通常比重新解析快
+        done = speculation["done"].wait(self.confirm_timeout)
+        self._finish(speculation)
+        if not done or speculation["scene"] is None:
+            return None
+        
+        segment = speculation["segment"]
+        if self.normalize_text(final_text) != self.normalize_text(speculation["text"]):
+            segment = None
+        with self._condition:
+            self.discarded -= 1     # _finish 已將其計為丟棄
+            if segment is not None:
+                self.confirmed += 1
+            else:
+                self.scenes_reused += 1
+        return {"scene": speculation["scene"], "segment": segment}
+    
+    def _finish(self, speculation):
+        """結束一個推測（計為丟棄），之後的部分文本開始新的推測"""
+        with self._condition:
+            if self._pending is speculation:
+                self._pending = None
+            if self._speculation is speculation:
+                self._speculation = None
+            self.discarded += 1
+    
+    def reset(self):
+        """丟棄當前推測"""
+        with self._condition:
+            self.discarded += (self._pending is not None) + (self._speculation is not None)
+            self._pending = None
+            self._speculation = None
+    
+    def stats(self):
+        """返回推測統計"""
+        with self._condition:
+            return {
+                "started": self.started,
+                "confirmed": self.confirmed,
+                "scenes_reused": self.scenes_reused,
+                "discarded": self.discarded
+            }
@@ -0,0 +1,149 @@
+# serve.py - 生產環境服務入口
+"""
+使用多線程 WSGI 伺服器 (waitress) 運行 Flask 應用，取代帶重載器的開發伺服器。
+
+- API 請求和視頻串流使用分開的線程配額: 串流最多佔用 STREAM_THREADS 個線程，
+  超出時返回 503，保證 API 始終有 API_THREADS 個線程可用
+- 收到 SIGINT/SIGTERM 時優雅關閉，釋放攝像頭和錄音器
+- 連接空閒超時由 CHANNEL_TIMEOUT 控制，OpenAI 請求超時由 OPENAI_TIMEOUT 控制
+
+用法:
+    python serve.py
+    HOST=0.0.0.0 PORT=8000 API_THREADS=8 STREAM_THREADS=4 python serve.py
+"""
+
+import os
+import signal
+import threading
+
+# 串流請求的路徑
+STREAM_PATHS = ("/api/video_stream",)
+
+
+class StreamLimiter:
+    """限制並發串流數的 WSGI 中間件
+
+    串流響應會長期佔用一個工作線程，限制其數量可避免 MJPEG 客戶端耗盡 API 的線程
+    """
+
+    def __init__(self, app, max_streams, stream_paths=STREAM_PATHS):
+        self.app = app
+        self.max_streams = max_streams
+        self.stream_paths = stream_paths
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+
+        # 統計
+        self.active_streams = 0
+        self.rejected_streams = 0
+
+    def __call__(self, environ, start_response):
+        if not environ.get("PATH_INFO", "").startswith(self.stream_paths):
+            return self.app(environ, start_response)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected_streams += 1
+            start_response("503 Service Unavailable", [
+                ("Content-Type", "text/plain; charset=utf-8"),
+                ("Retry-After", "5")
+            ])
+            return ["串流客戶端已達上限".encode("utf-8")]
+
+        with self._lock:
+            self.active_streams += 1
+        try:
+            result = self.app(environ, start_response)
+        except Exception:
+            self._release()
+            raise
+        return _ClosingIterator(result, self._release)
+
+    def _release(self):
+        with self._lock:
+            self.active_streams -= 1
+        self._slots.release()
+
+
+class _ClosingIterator:
+    """在響應結束（包括客戶端斷開）時調用回調"""
+
+    def __init__(self, iterable, on_close):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if hasattr(self._iterable, "close"):
+                self._iterable.close()
+        finally:
+            self._on_close()
+
+
+def run_server(app, on_shutdown=None, host=None, port=None, api_threads=None, stream_threads=None,
+               channel_timeout=None):
+    """運行生產伺服器，直到收到停止信號"""
+    host = host or os.environ.get("HOST", "127.0.0.1")
+    port = int(port or os.environ.get("PORT", "5000"))
+    api_threads = int(api_threads or os.environ.get("API_THREADS", "8"))
+    stream_threads = int(stream_threads or os.environ.get("STREAM_THREADS", "4"))
+    channel_timeout = int(channel_timeout or os.environ.get("CHANNEL_TIMEOUT", "120"))
+
+    wsgi_app = StreamLimiter(app, max_streams=stream_threads)
+
+    try:
+        from waitress.server import create_server
+    except ImportError:
+        create_server = None
+        print("未安裝 waitress，改用 werkzeug 多線程伺服器")
+
+    if create_server is not None:
+        server = create_server(
+            wsgi_app,
+            host=host,
+            port=port,
+            threads=api_threads + stream_threads,
+            channel_timeout=channel_timeout,
+            connection_limit=max(100, (api_threads + stream_threads) * 4),
+            ident="visual-reference-system"
+        )
+        serve_forever = server.run
+    else:
+        from werkzeug.serving import make_server
+        server = make_server(host, port, wsgi_app, threaded=True)
+        serve_forever = server.serve_forever
+
+    def handle_signal(signum, frame):
+        print(f"收到信號 {signum}，正在停止伺服器...")
+        # 先釋放資源並結束串流: 未結束的 MJPEG 響應會使 waitress 的主循環一直運行，
+        # 等到 serve_forever 返回後才調用 on_shutdown 則永遠不會發生
+        if on_shutdown is not None:
+            on_shutdown()
+        # 在主循環中拋出: waitress 的 run() 捕獲後停止工作線程並返回，werkzeug 則直接退出 serve_forever
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    print(f"服務已啟動: http://{host}:{port} (API 線程: {api_threads}, 串流線程: {stream_threads})")
+    try:
+        serve_forever()
+    finally:
+        if on_shutdown is not None:
+            on_shutdown()
+
+
+if __name__ == "__main__":
+    import app as app_module
+    run_server(app_module.app, on_shutdown=app_module.shutdown)
@@ -0,0 +1,275 @@
+# session_manager.py - 多用戶會話管理
+"""
+為每個瀏覽器客戶端維護獨立的會話狀態（場景、轉錄、回應和去重狀態），
+每個會話有自己的鎖；重量級模型實例（CLIP、語音識別、OpenAI 客戶端）由所有會話共享。
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from speech_recognition import TranscriptionQueue
+
+
+class SessionLimitError(Exception):
+    """並發會話數已達上限"""
+
+
+class Session:
+    """單個客戶端的會話狀態"""
+
+    def __init__(self, session_id, max_scenes=50, queue_size=16):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        # 回應發布的順序鎖: 發布後在會話鎖外執行的工作（如寫入評估數據）也按序號順序進行
+        self.publish_lock = threading.Lock()
+        self.max_scenes = max_scenes
+        self.queue_size = queue_size
+
+        # 錄製狀態
+        self.recording_active = False
+        self.recording_thread = None
+        self.transcriptions = None   # 本會話的轉錄事件隊列（錄製時創建）
+        self.speculator = None       # 本會話的推測解析器
+
+        self.created = time.time()
+        self.last_seen = self.created
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        """重置會話數據"""
+        # 存儲錄製會話的數據
+        self.data = {
+            "scenes": [],           # 最近捕獲的場景（最多 max_scenes 個）
+            "transcriptions": [],   # 所有轉錄的語音
+            "timestamps": [],       # 每個場景和轉錄的時間戳
+            "temp_responses": []    # 暫時性分析回應
+        }
+        self.current_scene = None
+        self.scene_count = 0
+
+        # 防止重複語音處理
+        self.last_processed_text = ""
+        self.last_response_content = ""
+        self.duplicate_count = 0
+
+        # 回應按提交順序發布: 每次重置遞增代數，丟棄重置前提交的結果
+        self.generation += 1
+        self.next_response_seq = 0
+        self.next_publish_seq = 0
+        self.pending_results = {}
+
+    def touch(self):
+        """更新最後活躍時間"""
+        self.last_seen = time.time()
+
+    def add_scene(self, scene, timestamp=None):
+        """添加場景，只保留最近的 max_scenes 個以限制記憶體（需持有 lock）"""
+        self.current_scene = scene
+        self.scene_count += 1
+        self.data["scenes"].append(scene)
+        self.data["timestamps"].append(timestamp if timestamp is not None else time.time())
+        if len(self.data["scenes"]) > self.max_scenes:
+            del self.data["scenes"][:-self.max_scenes]
+
+    def reserve_response_seq(self):
+        """為一次回應生成分配序號（需持有 lock），返回 (代數, 序號)"""
+        seq = self.next_response_seq
+        self.next_response_seq += 1
+        return self.generation, seq
+
+    def start(self):
+        """標記開始錄製並創建轉錄隊列"""
+        self.reset()
+        self.transcriptions = TranscriptionQueue(maxsize=self.queue_size)
+        self.recording_active = True
+
+    def stop(self):
+        """標記停止錄製，返回錄製線程以便調用方等待"""
+        self.recording_active = False
+        return self.recording_thread
+
+
+class ResponsePipeline:
+    """有界的回應生成工作池
+
+    調用方在會話鎖內只做狀態快照並分配序號，耗時的模型調用在工作池中執行，
+    結果在會話鎖內按序號順序原子地發布，較晚提交但先完成的結果會等待前面的結果；
+    publish 返回的後續工作（如磁盤寫入）在釋放會話鎖後按同樣的順序執行，不阻塞其他請求
+    """
+
+    def __init__(self, max_workers=4, max_pending=16, submit_timeout=5.0):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="response")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.submit_timeout = submit_timeout
+
+        # 統計
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    def submit(self, session, ticket, work, publish):
+        """提交一項工作
+
+        ticket 為 session.reserve_response_seq() 的返回值；work() 在工作線程中執行，
+        publish(session, result) 在持有會話鎖時按序調用（work 出錯時 result 為None），
+        只應更新會話狀態；它可返回一個無參數函數，在釋放會話鎖後調用。
+        隊列已滿且等待超時返回False，此時該序號作為空結果發布，不阻塞後續結果
+        """
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            print(f"回應工作池已滿，丟棄請求 (會話 {session.session_id[:8]})")
+            self._publish(session, ticket, None, publish)
+            return False
+
+        with self._stats_lock:
+            self.submitted += 1
+            self.in_flight += 1
+        self._executor.submit(self._run, session, ticket, work, publish)
+        return True
+
+    def _run(self, session, ticket, work, publish):
+        result = None
+        try:
+            result = work()
+        except Exception as e:
+            print(f"回應生成錯誤: {e}")
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.completed += 1
+            self._slots.release()
+            self._publish(session, ticket, result, publish)
+
+    @staticmethod
+    def _publish(session, ticket, result, publish):
+        """按序號順序發布結果，再在會話鎖外執行發布返回的後續工作"""
+        generation, seq = ticket
+        deferred = []
+        with session.publish_lock:
+            with session.lock:
+                if generation != session.generation:
+                    return
+                session.pending_results[seq] = result
+                while session.next_publish_seq in session.pending_results:
+                    ready = session.pending_results.pop(session.next_publish_seq)
+                    session.next_publish_seq += 1
+                    if ready is None:
+                        continue
+                    # 單個結果發布失敗不影響後續結果（序號已前進）
+                    try:
+                        after = publish(session, ready)
+                    except Exception as e:
+                        print(f"發布回應時出錯 (會話 {session.session_id[:8]}): {e}")
+                        continue
+                    if after is not None:
+                        deferred.append(after)
+
+            for after in deferred:
+                try:
+                    after()
+                except Exception as e:
+                    print(f"回應發布後的處理出錯 (會話 {session.session_id[:8]}): {e}")
+
+    def shutdown(self, wait=False):
+        """關閉工作池"""
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """工作池統計"""
+        with self._stats_lock:
+            return {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight
+            }
+
+
+class SessionManager:
+    """管理所有客戶端會話
+
+    超過 idle_timeout 秒未活躍的會話會被淘汰，並發會話數不超過 max_sessions；
+    HTTP請求、語音轉錄和回應發布都會調用 Session.touch() 刷新活躍時間
+    """
+
+    def __init__(self, max_sessions=8, idle_timeout=1800, max_scenes=50):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_scenes = max_scenes
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id():
+        """生成新的會話ID"""
+        return uuid.uuid4().hex
+
+    def get(self, session_id):
+        """獲取已有會話，不存在時返回None"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def get_or_create(self, session_id):
+        """獲取會話，不存在時創建；會話數已滿時拋出 SessionLimitError"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    self._evict_idle_locked()
+                if len(self._sessions) >= self.max_sessions:
+                    raise SessionLimitError(f"並發會話數已達上限 ({self.max_sessions})")
+                session = Session(session_id, max_scenes=self.max_scenes)
+                self._sessions[session_id] = session
+                print(f"創建會話 {session_id[:8]} (當前 {len(self._sessions)} 個)")
+        session.touch()
+        return session
+
+    def remove(self, session_id):
+        """移除會話並停止其錄製"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.stop()
+        return session
+
+    def evict_idle(self):
+        """淘汰空閒會話，返回被淘汰的會話"""
+        with self._lock:
+            return self._evict_idle_locked()
+
+    def _evict_idle_locked(self):
+        now = time.time()
+        evicted = [s for s in self._sessions.values() if now - s.last_seen > self.idle_timeout]
+        for session in evicted:
+            del self._sessions[session.session_id]
+            session.stop()
+            print(f"淘汰空閒會話 {session.session_id[:8]}")
+        return evicted
+
+    def sessions(self):
+        """所有會話的快照"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def recording_sessions(self):
+        """正在錄製的會話"""
+        return [s for s in self.sessions() if s.recording_active]
+
+    def stats(self):
+        """會話統計"""
+        sessions = self.sessions()
+        return {
+            "sessions": len(sessions),
+            "recording": sum(1 for s in sessions if s.recording_active),
+            "max_sessions": self.max_sessions
+        }
@@ -0,0 +1,248 @@
+# session_replay.py - 離線回放評估會話，用於回歸測試和吞吐量測試
+"""
+將 evaluation_data/<session>/ 中錄製的畫面和轉錄重新送入 VisionEncoder 和參照解析器，
+比較解析出的區域位置與錄製時的結果，並報告吞吐量、延遲和一致率。
+
+- 每條 reference_resolution 記錄: 用 resolve_reference 重新解析其參照文本
+- 帶有 text 和 segment_position 的交互（app 記錄的文本/語音交互）: 用 generate_response 重新生成
+
+解析器可以是真實的 OpenAI API (--resolver openai) 或本地線索解析器 (--resolver local)。
+設置 --min-accuracy / --min-throughput 時，低於門檻返回非零退出碼，可作為性能改動的回歸門檻。
+
+用法:
+    python session_replay.py evaluation_data --resolver local --speed 0
+    python session_replay.py evaluation_data/session_1700000000 --resolver openai --speed 1 \\
+        --output replay.json --min-accuracy 0.8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from evaluation_collector import load_session_data, DATA_FILE_NAME, EVENT_LOG_NAME
+from latency_trace import LatencyTrace, activate, stage_key
+
+
+def collect_sessions(paths):
+    """展開路徑為會話目錄（包含 data.json 或 events.jsonl 的目錄）"""
+    sessions = []
+    for path in paths:
+        if any(os.path.exists(os.path.join(path, name)) for name in (DATA_FILE_NAME, EVENT_LOG_NAME)):
+            sessions.append(path)
+            continue
+        with os.scandir(path) as entries:
+            sessions.extend(sorted(entry.path for entry in entries if entry.is_dir()))
+    return sessions
+
+
+def same_position(predicted, recorded):
+    """比較兩個區域位置（JSON 中的位置是列表）"""
+    if predicted is None or recorded is None:
+        return predicted is None and recorded is None
+    return list(predicted) == list(recorded)
+
+
+def frame_path(session_path, interaction):
+    """錄製時保存的是相對於當時工作目錄的路徑，找不到時在會話目錄的 scenes/ 中查找"""
+    path = interaction["frame"]
+    if os.path.exists(path):
+        return path
+    return os.path.join(session_path, "scenes", os.path.basename(path))
+
+
+def replay_interaction(interaction, encoder, resolver, path):
+    """回放一次交互，返回比較結果和各步驟耗時"""
+    frame = cv2.imread(path)
+    if frame is None:
+        return None
+
+    trace = LatencyTrace("replay")
+    comparisons = []
+    with activate(trace):
+        started = time.perf_counter()
+        scene = encoder.describe_frame(frame)
+        encode_time = time.perf_counter() - started
+
+        resolve_times = []
+        for record in interaction.get("reference_resolution", []):
+            started = time.perf_counter()
+            segment = resolver.resolve_reference(scene, record["reference_text"])
+            resolve_times.append(time.perf_counter() - started)
+            predicted = segment["position"] if segment else None
+            comparisons.append({
+                "kind": "reference",
+                "text": record["reference_text"],
+                "recorded": record["segment_position"],
+                "recorded_success": record.get("success"),
+                "predicted": predicted,
+                "match": same_position(predicted, record["segment_position"])
+            })
+
+        if interaction.get("text") and "segment_position" in interaction:
+            started = time.perf_counter()
+            response = resolver.generate_response(interaction["text"], scene)
+            resolve_times.append(time.perf_counter() - started)
+            segment = response.get("segment")
+            predicted = segment["position"] if segment else None
+            comparisons.append({
+                "kind": "response",
+                "text": interaction["text"],
+                "recorded": interaction["segment_position"],
+                "recorded_success": None,
+                "predicted": predicted,
+                "match": same_position(predicted, interaction["segment_position"])
+            })
+
+    return {
+        "encode_time": encode_time,
+        "resolve_times": resolve_times,
+        "comparisons": comparisons,
+        "spans": trace.spans()
+    }
+
+
+def replay_sessions(sessions, encoder, resolver, speed=0, limit=None):
+    """依次回放所有會話；speed 為回放速度倍數，0 表示盡快回放"""
+    results = []
+    skipped = 0
+    started = time.time()
+
+    for session_path in sessions:
+        data = load_session_data(session_path)
+        if data is None:
+            continue
+
+        interactions = [i for i in data["interactions"] if i.get("frame")]
+        if not interactions:
+            continue
+
+        session_started = time.time()
+        first_timestamp = interactions[0]["timestamp"]
+        for interaction in interactions:
+            if limit is not None and len(results) >= limit:
+                return results, skipped, time.time() - started
+
+            # 按錄製時的時間間隔回放
+            if speed > 0:
+                delay = (interaction["timestamp"] - first_timestamp) / speed - (time.time() - session_started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            result = replay_interaction(interaction, encoder, resolver, frame_path(session_path, interaction))
+            if result is None:
+                skipped += 1
+                continue
+            result["session"] = data["session_id"]
+            result["interaction_id"] = interaction.get("interaction_id")
+            results.append(result)
+
+    return results, skipped, time.time() - started
+
+
+def percentiles(values):
+    """p50/p95/p99，沒有數據時為None"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{p}": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def summarize(results, skipped, elapsed):
+    """匯總吞吐量、延遲和一致率"""
+    comparisons = [c for r in results for c in r["comparisons"]]
+    matches = [c["match"] for c in comparisons]
+    successful = [c["match"] for c in comparisons if c["recorded_success"]]
+
+    stages = {}
+    for result in results:
+        for record in result["spans"]:
+            stages.setdefault(stage_key(record), []).append(record["duration"])
+
+    return {
+        "interactions": len(results),
+        "skipped": skipped,
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed > 0 else None,
+        "comparisons": len(comparisons),
+        "accuracy": float(np.mean(matches)) if matches else None,
+        "accuracy_on_successful": float(np.mean(successful)) if successful else None,
+        "encode_latency": percentiles([r["encode_time"] for r in results]),
+        "resolve_latency": percentiles([t for r in results for t in r["resolve_times"]]),
+        "stages": {stage: dict(count=len(values), **percentiles(values)) for stage, values in sorted(stages.items())}
+    }
+
+
+def create_resolver(kind):
+    """創建參照解析器"""
+    if kind == "openai":
+        from reference_resolver import ReferenceResolver
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise SystemExit("使用 --resolver openai 需要設置 OPENAI_API_KEY")
+        return ReferenceResolver(api_key, timeout=float(os.environ.get("OPENAI_TIMEOUT", "30")))
+
+    from reference_resolver import CueReferenceResolver
+    return CueReferenceResolver()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線回放評估會話")
+    parser.add_argument("paths", nargs="+", help="會話目錄或包含會話目錄的目錄")
+    parser.add_argument("--resolver", default="local", choices=["local", "openai"])
+    parser.add_argument("--speed", type=float, default=0, help="回放速度倍數，0 表示盡快回放")
+    parser.add_argument("--limit", type=int, default=None, help="最多回放的交互數")
+    parser.add_argument("--min-accuracy", type=float, default=None, help="一致率低於此值時失敗")
+    parser.add_argument("--min-throughput", type=float, default=None, help="吞吐量(交互/秒)低於此值時失敗")
+    parser.add_argument("--output", default=None, help="將結果保存為 JSON")
+    args = parser.parse_args()
+
+    sessions = collect_sessions(args.paths)
+    if not sessions:
+        print("未找到會話數據")
+        return 1
+
+    from vision_encoder import VisionEncoder
+    encoder = VisionEncoder(camera_index=None)
+    resolver = create_resolver(args.resolver)
+
+    try:
+        results, skipped, elapsed = replay_sessions(sessions, encoder, resolver, speed=args.speed, limit=args.limit)
+    finally:
+        encoder.release()
+
+    summary = summarize(results, skipped, elapsed)
+
+    print("=== 會話回放摘要 ===")
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            continue
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+    print("各階段延遲 (毫秒):")
+    for stage, stats in summary["stages"].items():
+        print(f"  {stage:<40}{stats['count']:>8}{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": vars(args),
+                "summary": summary,
+                "results": [{k: v for k, v in r.items() if k != "spans"} for r in results]
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果已保存到: {args.output}")
+
+    failed = False
+    if args.min_accuracy is not None and (summary["accuracy"] is None or summary["accuracy"] < args.min_accuracy):
+        print(f"一致率低於門檻 {args.min_accuracy}")
+        failed = True
+    if args.min_throughput is not None and (summary["throughput"] or 0) < args.min_throughput:
+        print(f"吞吐量低於門檻 {args.min_throughput}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# speech_benchmark.py - 無麥克風的語音識別吞吐量與語音結束檢測延遲測試
+"""
+將 WAV 文件（例如 evaluation_data/<session>/audio/audio_*.wav）以實時或加速方式
+送入 SpeechRecognizer，測量每個文件的轉錄時間、實時率和語音結束檢測延遲。
+
+用法:
+    python speech_benchmark.py evaluation_data --model-tier small --speed 0
+    python speech_benchmark.py a.wav b.wav --speed 1 --output speech_benchmark.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PyQt6.QtCore import QCoreApplication
+
+from speech_recognition import SpeechRecognizer, WavFileSource, STT_MODEL_TIERS
+
+
+def collect_audio_files(paths):
+    """展開目錄為其中所有的 WAV 文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "*.wav"), recursive=True)))
+        else:
+            files.append(path)
+    return files
+
+
+def benchmark_file(recognizer, path, speed, timeout, settle=1.5):
+    """送入一個文件並收集其所有轉錄
+
+    第一段轉錄最多等待 timeout 秒，之後 settle 秒內沒有新的轉錄即視為該文件已處理完，
+    文件中有多句話時後面的句子不會被計入下一個文件；計時以最後一段轉錄為準
+    """
+    # 丟棄上一個文件超時後才到達的轉錄
+    stale = recognizer.text_queue.clear()
+    if stale:
+        print(f"丟棄 {stale} 條上一個文件的遲到轉錄")
+
+    source = WavFileSource(path)
+    feed = recognizer.feed_source(source, speed=speed)
+    events = []
+    event = recognizer.get_transcription_event(timeout=timeout)
+    while event is not None:
+        events.append(event)
+        event = recognizer.get_transcription_event(timeout=settle)
+
+    result = {
+        "file": path,
+        "audio_duration": source.duration(),
+        "feed_time": feed["feed_time"],
+        "utterances": len(events),
+        "text": " ".join(e["text"] for e in events) if events else None
+    }
+    if events:
+        event = events[-1]
+        processing_time = event["timestamp"] - feed["started"]
+        result["processing_time"] = processing_time
+        result["realtime_factor"] = processing_time / result["audio_duration"] if result["audio_duration"] else None
+        result["endpoint_latency"] = event["timestamp"] - feed["speech_end"]
+    return result
+
+
+def summarize(results):
+    """匯總所有文件的統計"""
+    done = [r for r in results if r["text"] is not None]
+    summary = {
+        "files": len(results),
+        "transcribed": len(done),
+        "total_audio": sum(r["audio_duration"] for r in results)
+    }
+    if done:
+        latencies = np.array([r["endpoint_latency"] for r in done])
+        total_processing = sum(r["processing_time"] for r in done)
+        summary.update({
+            "total_processing": total_processing,
+            "throughput": sum(r["audio_duration"] for r in done) / total_processing if total_processing else None,
+            "endpoint_latency_p50": float(np.percentile(latencies, 50)),
+            "endpoint_latency_p95": float(np.percentile(latencies, 95)),
+            "endpoint_latency_max": float(latencies.max())
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="語音識別吞吐量與延遲測試")
+    parser.add_argument("paths", nargs="+", help="WAV 文件或包含 WAV 文件的目錄")
+    parser.add_argument("--model-tier", default="small", choices=list(STT_MODEL_TIERS))
+    parser.add_argument("--compute-type", default=None)
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--speed", type=float, default=0, help="回放速度倍數，0 表示盡快送入")
+    parser.add_argument("--timeout", type=float, default=30.0, help="每個文件等待轉錄的超時(秒)")
+    parser.add_argument("--settle", type=float, default=1.5, help="最後一段轉錄後等待更多轉錄的時間(秒)")
+    parser.add_argument("--output", default=None, help="將結果保存為 JSON")
+    args = parser.parse_args()
+
+    files = collect_audio_files(args.paths)
+    if not files:
+        print("未找到 WAV 文件")
+        return 1
+
+    # SpeechRecognizer 的 Qt 對象需要 QCoreApplication；保留引用，否則應用對象會被立即回收
+    app = QCoreApplication.instance()
+    if app is None:
+        app = QCoreApplication(sys.argv)
+
+    # 設備為None: 不使用麥克風，只接受送入的音頻
+    recognizer = SpeechRecognizer(
+        input_device_index=None,
+        model_tier=args.model_tier,
+        compute_type=args.compute_type,
+        language=args.language
+    )
+
+    try:
+        load_started = time.time()
+        if recognizer.wait_until_ready() is None:
+            print("錄音器初始化超時")
+            return 1
+        print(f"模型加載耗時: {time.time() - load_started:.2f}s")
+
+        recognizer.start_recording()
+        results = []
+        for path in files:
+            result = benchmark_file(recognizer, path, args.speed, args.timeout, args.settle)
+            results.append(result)
+            if result["text"] is None:
+                print(f"{path}: 未得到轉錄")
+            else:
+                print(f"{path}: {result['audio_duration']:.2f}s 音頻, 處理 {result['processing_time']:.2f}s, "
+                      f"結束檢測延遲 {result['endpoint_latency']:.3f}s -> {result['text']}")
+        recognizer.stop_recording()
+    finally:
+        recognizer.cleanup()
+
+    summary = summarize(results)
+    print("\n=== 語音識別測試摘要 ===")
+    for key, value in summary.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": vars(args),
+                "summary": summary,
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果已保存到: {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
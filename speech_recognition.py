@@ -1,16 +1,265 @@
 # speech_recognition.py
-from PyQt6.QtCore import QObject, pyqtSignal, QThread, QMutex, QMutexLocker
+from PyQt6.QtCore import QObject, pyqtSignal, QThread, QMutex, QMutexLocker, QWaitCondition
 from RealtimeSTT import AudioToTextRecorder
+from abc import ABC, abstractmethod
+from collections import deque
 import pyaudio
 import threading
+import time
+import wave
 import numpy as np
 import zhconv
 
+from metrics import REGISTRY
+
+TRANSCRIPTIONS = REGISTRY.counter("speech_transcriptions_total", "完成的語音轉錄段數")
+PARTIAL_TRANSCRIPTIONS = REGISTRY.counter("speech_partial_transcriptions_total", "即時部分轉錄更新次數")
+TRANSCRIPTION_ERRORS = REGISTRY.counter("speech_transcription_errors_total", "語音識別出錯次數")
+
+
+# 語音識別模型檔位: 在延遲與準確度之間取捨
+STT_MODEL_TIERS = {
+    "tiny": {"model": "tiny", "compute_type": "int8"},
+    "base": {"model": "base", "compute_type": "int8"},
+    "small": {"model": "small", "compute_type": "int8"},
+    "medium": {"model": "medium", "compute_type": "int8"},
+    "large-v2": {"model": "large-v2", "compute_type": "default"},
+}
+
+
+class AudioInputSource(ABC):
+    """音頻輸入源: 以 16 位單聲道 PCM 字節塊的形式提供音頻"""
+    
+    def __init__(self, sample_rate=16000, chunk_duration=0.032):
+        self.sample_rate = sample_rate
+        self.chunk_duration = chunk_duration
+    
+    @property
+    def chunk_samples(self):
+        return max(1, int(self.sample_rate * self.chunk_duration))
+    
+    @abstractmethod
+    def read_samples(self):
+        """返回全部音頻的 int16 單聲道數組"""
+    
+    def iter_chunks(self):
+        """逐塊產生 PCM 字節"""
+        samples = self.read_samples()
+        step = self.chunk_samples
+        for start in range(0, len(samples), step):
+            yield samples[start:start + step].tobytes()
+    
+    def duration(self):
+        """音頻時長(秒)"""
+        return len(self.read_samples()) / self.sample_rate
+
+
+class WavFileSource(AudioInputSource):
+    """WAV 文件輸入源（例如 EvaluationCollector 保存的 audio_*.wav）"""
+    
+    def __init__(self, path, chunk_duration=0.032):
+        self.path = path
+        with wave.open(path, 'rb') as wav:
+            sample_rate = wav.getframerate()
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            frames = wav.readframes(wav.getnframes())
+        super().__init__(sample_rate=sample_rate, chunk_duration=chunk_duration)
+        self._samples = _to_mono_int16(frames, sample_width, channels)
+    
+    def read_samples(self):
+        return self._samples
+
+
+class PcmStreamSource(AudioInputSource):
+    """原始 PCM 流輸入源（16 位小端）"""
+    
+    def __init__(self, stream, sample_rate=16000, channels=1, chunk_duration=0.032):
+        super().__init__(sample_rate=sample_rate, chunk_duration=chunk_duration)
+        self.stream = stream
+        self.channels = channels
+        self._samples = None
+    
+    def read_samples(self):
+        if self._samples is None:
+            self._samples = _to_mono_int16(self.stream.read(), 2, self.channels)
+        return self._samples
+    
+    def iter_chunks(self):
+        # 已讀取過時直接使用緩存，否則邊讀邊產生，不必把整個流載入記憶體
+        if self._samples is not None:
+            yield from super().iter_chunks()
+            return
+        
+        # 流可能返回不足一個採樣幀的數據（奇數字節或不完整的多聲道幀），餘下的字節併入下一塊
+        frame_bytes = 2 * self.channels
+        chunk_bytes = self.chunk_samples * frame_bytes
+        pending = b""
+        while True:
+            data = self.stream.read(chunk_bytes)
+            if not data:
+                break
+            pending += data
+            usable = len(pending) - len(pending) % frame_bytes
+            if usable:
+                yield _to_mono_int16(pending[:usable], 2, self.channels).tobytes()
+                pending = pending[usable:]
+
+
+class _ArraySource(AudioInputSource):
+    """內存中的 int16 數組輸入源"""
+    
+    def __init__(self, samples, sample_rate=16000, chunk_duration=0.032):
+        super().__init__(sample_rate=sample_rate, chunk_duration=chunk_duration)
+        self._samples = samples
+    
+    def read_samples(self):
+        return self._samples
+
+
+def _to_mono_int16(frames, sample_width, channels):
+    """將 PCM 字節轉換為 int16 單聲道數組"""
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype=np.int16)
+    elif sample_width == 4:
+        samples = (np.frombuffer(frames, dtype=np.int32) >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"不支持的採樣寬度: {sample_width}")
+    
+    if channels > 1:
+        usable = len(samples) - len(samples) % channels
+        samples = samples[:usable].reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples
+
+
+class TranscriptionQueue:
+    """有界的線程安全轉錄事件隊列
+
+    每個事件為 {"seq", "type", "text", "timestamp", "speech_end"}，消費者可阻塞等待。
+    timestamp 為入隊時間，speech_end 為語音結束時間（未知時等於 timestamp）。
+    隊列滿時按 drop_policy 處理:
+      - "drop_oldest": 丟棄最舊的事件（默認，優先保證最新語音）
+      - "drop_newest": 丟棄新到的事件
+      - "block": 生產者等待直到有空位（最多 put_timeout 秒，超時則丟棄新事件）
+    """
+    
+    DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+    
+    def __init__(self, maxsize=16, drop_policy="drop_oldest", put_timeout=1.0):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"未知的丟棄策略: {drop_policy}")
+        
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.put_timeout = put_timeout
+        
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._next_seq = 0
+        self._last_event = None
+        
+        # 統計
+        self.enqueued = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.max_depth = 0
+        self.total_wait = 0.0   # 事件從入隊到被取出的累計等待時間
+    
+    def put(self, text, event_type="final", timestamp=None, speech_end=None):
+        """加入一個轉錄事件，返回事件；被丟棄時返回None
+
+        timestamp 默認為當前時間，轉發事件時可傳入原事件的時間戳；
+        speech_end 為錄音器檢測到的語音結束時間，默認與 timestamp 相同
+        """
+        with self._condition:
+            timestamp = timestamp if timestamp is not None else time.time()
+            event = {
+                "seq": self._next_seq,
+                "type": event_type,
+                "text": text,
+                "timestamp": timestamp,
+                "speech_end": speech_end if speech_end is not None else timestamp
+            }
+            self._next_seq += 1
+            
+            if len(self._events) >= self.maxsize:
+                if self.drop_policy == "drop_oldest":
+                    self._events.popleft()
+                    self.dropped += 1
+                elif self.drop_policy == "drop_newest":
+                    self.dropped += 1
+                    return None
+                else:
+                    deadline = time.time() + self.put_timeout
+                    while len(self._events) >= self.maxsize:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self.dropped += 1
+                            return None
+                        self._condition.wait(remaining)
+            
+            self._events.append(event)
+            self._last_event = event
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._events))
+            self._condition.notify_all()
+            return event
+    
+    def get(self, timeout=None):
+        """取出最早的事件，隊列為空時最多等待 timeout 秒，超時返回None"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._events, timeout=timeout):
+                return None
+            event = self._events.popleft()
+            self.delivered += 1
+            self.total_wait += time.time() - event["timestamp"]
+            self._condition.notify_all()
+            return event
+    
+    def get_nowait(self):
+        """非阻塞地取出最早的事件"""
+        return self.get(timeout=0)
+    
+    def peek_latest(self):
+        """返回最近加入的事件（不移除）"""
+        with self._condition:
+            return self._last_event
+    
+    def clear(self):
+        """清空隊列，返回被清除的事件數"""
+        with self._condition:
+            count = len(self._events)
+            self._events.clear()
+            self.dropped += count
+            self._condition.notify_all()
+            return count
+    
+    def __len__(self):
+        with self._condition:
+            return len(self._events)
+    
+    def stats(self):
+        """返回隊列統計"""
+        with self._condition:
+            return {
+                "depth": len(self._events),
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "delivered": self.delivered,
+                "avg_wait": self.total_wait / self.delivered if self.delivered else 0.0,
+                "drop_policy": self.drop_policy
+            }
+
+
 class SpeechRecognizerThread(QThread):
     """語音識別線程"""
     
     # 定義信號
     text_received = pyqtSignal(str)         # 接收到文本信號
+    partial_text_received = pyqtSignal(str) # 接收到即時部分文本信號
     vad_started = pyqtSignal()              # 語音活動開始信號
     vad_stopped = pyqtSignal()              # 語音活動結束信號
     error_occurred = pyqtSignal(str)        # 錯誤信號
@@ -25,9 +274,27 @@ class SpeechRecognizerThread(QThread):
         self.is_active = False
         self.need_init = True
         self.language = "zh"
+        self.speech_ended_at = None     # 最近一次語音活動結束的時間，由下一條轉錄取用
+        
+        # 預加載的錄音器池，按 (語言, 設備, 模型, 計算類型, 即時轉錄) 索引，保持模型常駐
+        self.recorders = {}
+        self.recorder_key = None
+        self.max_pooled_recorders = 2
+        self.preload_keys = []
+        
+        # 模型設置
+        self.model = "large-v2"
+        self.compute_type = "default"
+        self.enable_realtime = False       # 是否啟用即時部分轉錄
+        self.realtime_model = "tiny"       # 即時部分轉錄使用的模型
+        
+        # 轉錄事件隊列（由 SpeechRecognizer 設置）
+        self.transcription_queue = None
+        self.partial_queue = None
         
-        # 互斥鎖
+        # 互斥鎖及活躍狀態條件變量
         self.mutex = QMutex()
+        self.active_condition = QWaitCondition()
     
     def run(self):
         """線程主循環"""
@@ -35,72 +302,91 @@ class SpeechRecognizerThread(QThread):
         
         while not self.isInterruptionRequested():
             try:
-                # 檢查是否需要初始化
+                # 檢查是否需要初始化（或從錄音器池中切換）
                 if self.need_init:
-                    self._initialize_recorder()
                     self.need_init = False
+                    self._initialize_recorder()
+                
+                # 空閒時預加載其他錄音器
+                if not self.is_active and self.preload_keys:
+                    with QMutexLocker(self.mutex):
+                        key = self.preload_keys.pop(0) if self.preload_keys else None
+                    if key is not None:
+                        self._preload_recorder(key)
+                    continue
                 
-                # 檢查是否活躍
+                # 檢查是否活躍，不活躍時等待喚醒而不是輪詢
                 with QMutexLocker(self.mutex):
+                    if not self.is_active and not self.need_init and not self.preload_keys:
+                        self.active_condition.wait(self.mutex, 500)
                     is_active = self.is_active
                     recorder = self.recorder
                 
-                # 如果不活躍，跳過此次循環
                 if not is_active:
-                    self.msleep(10)
                     continue
                 
-                # 獲取識別結果
+                # 錄音器尚未就緒（例如初始化失敗），稍後重試
+                if recorder is None:
+                    self.msleep(100)
+                    continue
+                
+                # 獲取識別結果（阻塞直到一段語音結束）
                 if recorder:
                     try:
                         input_text = zhconv.convert(recorder.text(), 'zh-cn')
                         
+                        # 停止錄音時 text() 會被中止，忽略其結果
+                        if not self.is_active:
+                            continue
+                        
                         if input_text and input_text.strip():
                             print(f"[用戶說] {input_text}")
+                            TRANSCRIPTIONS.inc()
+                            # 直接推送到事件隊列，不依賴Qt事件循環轉發
+                            if self.transcription_queue is not None:
+                                self.transcription_queue.put(input_text.strip(), speech_end=self.speech_ended_at)
                             self.text_received.emit(input_text.strip())
+                        self.speech_ended_at = None
                     except Exception as e:
+                        TRANSCRIPTION_ERRORS.inc()
                         print(f"語音識別錯誤: {str(e)}")
                         self.error_occurred.emit(f"語音識別錯誤: {str(e)}")
-                
-                self.msleep(10)
+                        self.msleep(500)
                 
             except Exception as e:
                 print(f"語音線程循環出錯: {str(e)}")
                 self.error_occurred.emit(f"語音線程錯誤: {str(e)}")
                 self.msleep(500)
     
+    def current_key(self):
+        """當前設置對應的錄音器池索引"""
+        return (self.language, self.input_device_index, self.model, self.compute_type, self.enable_realtime)
+    
     def _initialize_recorder(self):
-        """初始化錄音器"""
+        """切換到當前設置的錄音器，池中沒有時才創建"""
         success = False
+        key = self.current_key()
         
         try:
-            print(f"初始化錄音器 (設備: {self.input_device_index})...")
+            recorder = self.recorders.get(key)
+            if recorder is None:
+                recorder = self._create_recorder(key)
+            else:
+                print(f"使用預加載的錄音器 (語言: {key[0]}, 設備: {key[1]}, 模型: {key[2]})")
             
-            # 關閉現有錄音器
-            if self.recorder:
-                try:
-                    self.recorder.shutdown()
-                except Exception as e:
-                    print(f"關閉舊錄音器失敗: {str(e)}")
-                self.recorder = None
+            with QMutexLocker(self.mutex):
+                previous = self.recorder
+                self.recorder = recorder
+                self.recorder_key = key
+                self.recorders[key] = self.recorders.pop(key, recorder)  # 移到最近使用
+                is_active = self.is_active
             
-            # 創建新錄音器
-            self.recorder = AudioToTextRecorder(
-                spinner=False,
-                model='large-v2',
-                language=self.language,
-                input_device_index=self.input_device_index,
-                silero_sensitivity=0.5,
-                silero_use_onnx=True,
-                silero_deactivity_detection=True,
-                webrtc_sensitivity=2,
-                post_speech_silence_duration=0.3,
-                no_log_file=True,
-                on_vad_start=self._on_vad_start,
-                on_vad_stop=self._on_vad_stop
-            )
+            # 只有當前錄音器在錄音時使用麥克風
+            if previous is not None and previous is not recorder:
+                self._set_microphone(previous, False)
+            self._set_microphone(recorder, is_active)
             
-            print("錄音器初始化成功")
+            self._evict_recorders()
             success = True
             
         except Exception as e:
@@ -109,6 +395,121 @@ class SpeechRecognizerThread(QThread):
         
         self.initialization_complete.emit(success)
     
+    def _preload_recorder(self, key):
+        """在空閒時預加載錄音器到池中"""
+        if key in self.recorders:
+            return
+        try:
+            recorder = self._create_recorder(key)
+            self._set_microphone(recorder, False)
+            with QMutexLocker(self.mutex):
+                self.recorders[key] = recorder
+                # 預加載的錄音器排在最久未使用的位置之後、當前錄音器之前
+                if self.recorder_key in self.recorders:
+                    self.recorders[self.recorder_key] = self.recorders.pop(self.recorder_key)
+            self._evict_recorders()
+        except Exception as e:
+            print(f"預加載錄音器失敗: {str(e)}")
+    
+    def _create_recorder(self, key):
+        """創建新的錄音器"""
+        language, input_device_index, model, compute_type, enable_realtime = key
+        print(f"初始化錄音器 (語言: {language}, 設備: {input_device_index}, 模型: {model}/{compute_type}, "
+              f"即時轉錄: {'開' if enable_realtime else '關'})...")
+        
+        # 即時部分轉錄設置
+        realtime_options = {}
+        if enable_realtime:
+            realtime_options = {
+                "enable_realtime_transcription": True,
+                "realtime_model_type": self.realtime_model,
+                "realtime_processing_pause": 0.1,
+                "on_realtime_transcription_update": self._on_realtime_update
+            }
+        
+        # 設備為None時不讀取麥克風，音頻通過 feed_audio 輸入（文件/回放模式）
+        recorder = AudioToTextRecorder(
+            spinner=False,
+            model=model,
+            compute_type=compute_type,
+            language=language,
+            use_microphone=input_device_index is not None,
+            input_device_index=input_device_index if input_device_index is not None else 0,
+            silero_sensitivity=0.5,
+            silero_use_onnx=True,
+            silero_deactivity_detection=True,
+            webrtc_sensitivity=2,
+            post_speech_silence_duration=0.3,
+            no_log_file=True,
+            on_vad_start=self._on_vad_start,
+            on_vad_stop=self._on_vad_stop,
+            **realtime_options
+        )
+        
+        print("錄音器初始化成功")
+        return recorder
+    
+    def _evict_recorders(self):
+        """超出池容量時關閉最久未使用的錄音器（當前錄音器除外）"""
+        while True:
+            with QMutexLocker(self.mutex):
+                if len(self.recorders) <= self.max_pooled_recorders:
+                    return
+                key = next((k for k in self.recorders if k != self.recorder_key), None)
+                if key is None:
+                    return
+                recorder = self.recorders.pop(key)
+            
+            print(f"關閉最久未使用的錄音器 (語言: {key[0]}, 設備: {key[1]})")
+            try:
+                recorder.shutdown()
+            except Exception as e:
+                print(f"關閉錄音器失敗: {str(e)}")
+    
+    def _set_microphone(self, recorder, enabled):
+        """切換錄音器是否讀取麥克風（回放模式下始終關閉）"""
+        if self.input_device_index is None:
+            enabled = False
+        try:
+            recorder.set_microphone(enabled)
+        except Exception as e:
+            print(f"切換麥克風狀態失敗: {str(e)}")
+    
+    def pause(self):
+        """暫停讀取音頻，保持模型常駐，並中止正在等待的識別"""
+        with QMutexLocker(self.mutex):
+            self.is_active = False
+            recorder = self.recorder
+        
+        if recorder is not None:
+            self._set_microphone(recorder, False)
+            try:
+                recorder.abort()
+            except Exception as e:
+                print(f"中止識別失敗: {str(e)}")
+    
+    def resume(self):
+        """恢復讀取音頻"""
+        with QMutexLocker(self.mutex):
+            self.is_active = True
+            self.speech_ended_at = None
+            recorder = self.recorder
+            self.active_condition.wakeAll()
+        
+        if recorder is not None:
+            self._set_microphone(recorder, True)
+    
+    def _on_realtime_update(self, text):
+        """收到即時部分轉錄（在錄音器的線程中調用）"""
+        partial_text = zhconv.convert(text, 'zh-cn').strip() if text else ""
+        if not partial_text:
+            return
+        PARTIAL_TRANSCRIPTIONS.inc()
+        
+        if self.partial_queue is not None:
+            self.partial_queue.put(partial_text, event_type="partial")
+        self.partial_text_received.emit(partial_text)
+    
     def _on_vad_start(self):
         """檢測到語音活動開始"""
         print("檢測到語音活動開始")
@@ -116,19 +517,23 @@ class SpeechRecognizerThread(QThread):
 
     def _on_vad_stop(self):
         """檢測到語音活動結束"""
+        self.speech_ended_at = time.time()
         print("檢測到語音活動結束")
         self.vad_stopped.emit()
     
     def cleanup(self):
-        """清理資源"""
+        """清理資源，關閉池中所有錄音器"""
         with QMutexLocker(self.mutex):
-            if self.recorder:
-                try:
-                    self.recorder.shutdown()
-                except Exception as e:
-                    print(f"關閉錄音器失敗: {str(e)}")
-                finally:
-                    self.recorder = None
+            recorders = list(self.recorders.values())
+            self.recorders = {}
+            self.recorder = None
+            self.recorder_key = None
+        
+        for recorder in recorders:
+            try:
+                recorder.shutdown()
+            except Exception as e:
+                print(f"關閉錄音器失敗: {str(e)}")
 
 
 class SpeechRecognizer(QObject):
@@ -136,41 +541,102 @@ class SpeechRecognizer(QObject):
     
     # 定義信號
     text_received = pyqtSignal(str)
+    partial_text_received = pyqtSignal(str)
     vad_started = pyqtSignal()
     vad_stopped = pyqtSignal()
     error_occurred = pyqtSignal(str)
     initialization_complete = pyqtSignal(bool)
     
-    def __init__(self, api_key=None, sample_rate=16000, input_device_index=0, parent=None):
+    def __init__(self, api_key=None, sample_rate=16000, input_device_index=0, parent=None,
+                 queue_size=16, drop_policy="drop_oldest",
+                 model_tier="large-v2", compute_type=None, enable_realtime=False, realtime_model="tiny",
+                 language="zh", max_pooled_recorders=2):
         """初始化語音識別器
         
+        model_tier 為 STT_MODEL_TIERS 中的檔位，compute_type 可覆蓋該檔位的計算類型；
+        enable_realtime 啟用即時部分轉錄，部分文本以 "partial" 事件單獨發布。
+        錄音器在會話之間保持常駐，max_pooled_recorders 為預加載錄音器池的容量。
+        input_device_index 為None時不使用麥克風，音頻通過 feed_source / transcribe_audio 輸入
+        
         注意: api_key參數保留但不使用，為了保持與舊版接口兼容
         """
         super().__init__(parent)
         
+        # 轉錄事件隊列；部分轉錄只保留最新一條
+        self.text_queue = TranscriptionQueue(maxsize=queue_size, drop_policy=drop_policy)
+        self.partial_queue = TranscriptionQueue(maxsize=1, drop_policy="drop_oldest")
+        
         # 創建工作線程
         self.thread = SpeechRecognizerThread(self)
         self.thread.input_device_index = input_device_index
+        self.thread.language = language
+        self.thread.max_pooled_recorders = max_pooled_recorders
+        self.thread.transcription_queue = self.text_queue
+        self.thread.partial_queue = self.partial_queue
+        self._apply_model_tier(model_tier, compute_type)
+        self.thread.enable_realtime = enable_realtime
+        self.thread.realtime_model = realtime_model
         
         # 連接信號
         self.thread.text_received.connect(self.text_received)
+        self.thread.partial_text_received.connect(self.partial_text_received)
         self.thread.vad_started.connect(self.vad_started)
         self.thread.vad_stopped.connect(self.vad_stopped)
         self.thread.error_occurred.connect(self.error_occurred)
         self.thread.initialization_complete.connect(self.initialization_complete)
         
-        # 創建緩存隊列來模擬舊API行為
-        self.text_queue = []
-        self.text_queue_lock = threading.Lock()
-        
         # 啟動線程
         self.thread.start()
     
     def set_language(self, language):
-        """設置識別語言"""
+        """設置識別語言，池中已有對應錄音器時立即切換"""
         with QMutexLocker(self.thread.mutex):
+            if language == self.thread.language and self.thread.recorder:
+                return
             self.thread.language = language
+        self._request_switch()
+    
+    def _request_switch(self):
+        """請求工作線程切換到當前設置的錄音器"""
+        with QMutexLocker(self.thread.mutex):
             self.thread.need_init = True
+            recorder = self.thread.recorder if self.thread.is_active else None
+            self.thread.active_condition.wakeAll()
+        
+        # 錄音中時中止正在等待的識別，讓工作線程盡快切換
+        if recorder is not None:
+            try:
+                recorder.abort()
+            except Exception as e:
+                print(f"中止識別失敗: {str(e)}")
+    
+    def preload(self, languages=None, device_indices=None):
+        """在空閒時預加載指定語言/設備組合的錄音器，之後切換無需重新加載模型"""
+        with QMutexLocker(self.thread.mutex):
+            language, device_index, model, compute_type, enable_realtime = self.thread.current_key()
+            for lang in languages or [language]:
+                for device in device_indices or [device_index]:
+                    key = (lang, device, model, compute_type, enable_realtime)
+                    if key not in self.thread.recorders and key not in self.thread.preload_keys:
+                        self.thread.preload_keys.append(key)
+            self.thread.active_condition.wakeAll()
+    
+    def _apply_model_tier(self, model_tier, compute_type=None):
+        """將模型檔位寫入工作線程設置"""
+        if model_tier not in STT_MODEL_TIERS:
+            raise ValueError(f"未知的語音識別模型檔位: {model_tier}，可選: {', '.join(STT_MODEL_TIERS)}")
+        
+        tier = STT_MODEL_TIERS[model_tier]
+        self.thread.model = tier["model"]
+        self.thread.compute_type = compute_type or tier["compute_type"]
+    
+    def set_model(self, model_tier, compute_type=None, enable_realtime=None):
+        """切換識別模型檔位和即時轉錄選項，錄音器將重新初始化"""
+        with QMutexLocker(self.thread.mutex):
+            self._apply_model_tier(model_tier, compute_type)
+            if enable_realtime is not None:
+                self.thread.enable_realtime = enable_realtime
+        self._request_switch()
     
     def set_vad_callbacks(self, on_vad_start=None, on_vad_stop=None):
         """設置VAD回調函數（保留兼容性）"""
@@ -186,24 +652,9 @@ class SpeechRecognizer(QObject):
             self.vad_started.connect(on_vad_start)
         if on_vad_stop:
             self.vad_stopped.connect(on_vad_stop)
-            
-        # 連接文本緩存處理
-        try:
-            self.text_received.disconnect(self._cache_text)
-        except:
-            pass
-        self.text_received.connect(self._cache_text)
-    
-    def _cache_text(self, text):
-        """緩存接收到的文本以便與舊API兼容"""
-        with self.text_queue_lock:
-            self.text_queue.append(text)
-            # 只保留最新的5個文本
-            if len(self.text_queue) > 5:
-                self.text_queue.pop(0)
     
     def start_recording(self):
-        """開始錄音"""
+        """開始錄音（錄音器保持常駐，只恢復讀取音頻）"""
         with QMutexLocker(self.thread.mutex):
             if self.thread.is_active:
                 return True
@@ -211,26 +662,37 @@ class SpeechRecognizer(QObject):
             if not self.thread.recorder:
                 self.thread.need_init = True
             
-            self.thread.is_active = True
+            # 丟棄上一次錄音遺留的文本
+            self.text_queue.clear()
+            self.partial_queue.clear()
         
+        self.thread.resume()
         print("錄音已開始")
         return True
     
     def stop_recording(self):
-        """停止錄音"""
-        with QMutexLocker(self.thread.mutex):
-            self.thread.is_active = False
+        """停止錄音（只暫停讀取音頻，不釋放模型）"""
+        self.thread.pause()
         
         print("錄音已停止")
         return True
     
     def get_latest_transcription(self):
-        """獲取最新的轉錄文本"""
-        with self.text_queue_lock:
-            if self.text_queue:
-                # 取得最新文本並從隊列中移除，避免重複處理
-                return self.text_queue.pop(0)
-        return ""
+        """獲取最新的轉錄文本（非阻塞，保留舊API）"""
+        event = self.text_queue.get_nowait()
+        return event["text"] if event else ""
+    
+    def get_transcription_event(self, timeout=None):
+        """阻塞等待下一個轉錄事件，超時返回None"""
+        return self.text_queue.get(timeout=timeout)
+    
+    def get_partial_event(self, timeout=None):
+        """阻塞等待下一個即時部分轉錄事件，超時返回None"""
+        return self.partial_queue.get(timeout=timeout)
+    
+    def get_queue_stats(self):
+        """獲取轉錄隊列統計"""
+        return self.text_queue.stats()
     
     def record_audio(self, duration=5, silence_threshold=0.02, silence_duration=0.8):
         """模擬舊API的record_audio方法，但現在返回模擬音頻數據"""
@@ -238,12 +700,77 @@ class SpeechRecognizer(QObject):
         dummy_audio = np.zeros((int(16000 * 1), 1), dtype=np.int16)
         return dummy_audio if self.thread.is_active else None
     
-    def transcribe_audio(self, audio_data=None):
-        """模擬舊API，返回最新一條文本"""
-        with self.text_queue_lock:
-            if self.text_queue:
-                return self.text_queue[-1]
-        return ""
+    def feed_source(self, source, speed=1.0, trailing_silence=1.0):
+        """將音頻輸入源送入當前錄音器
+        
+        speed 為回放速度倍數（1.0 為實時，0 表示盡快送入）；
+        結尾補充 trailing_silence 秒靜音以觸發語音結束檢測。
+        返回送入統計，其中 speech_end 為最後一塊音頻送入的時間
+        """
+        recorder = self.wait_until_ready()
+        if recorder is None:
+            raise RuntimeError("錄音器尚未就緒")
+        
+        chunk_interval = source.chunk_duration / speed if speed > 0 else 0
+        started = time.time()
+        chunks = 0
+        next_time = started
+        
+        for chunk in source.iter_chunks():
+            recorder.feed_audio(chunk, original_sample_rate=source.sample_rate)
+            chunks += 1
+            if chunk_interval:
+                next_time += chunk_interval
+                delay = next_time - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        speech_end = time.time()
+        
+        # 補充靜音，靜音按實時送入，讓語音結束檢測能正常觸發
+        silence = np.zeros(source.chunk_samples, dtype=np.int16).tobytes()
+        for _ in range(int(trailing_silence / source.chunk_duration)):
+            recorder.feed_audio(silence, original_sample_rate=source.sample_rate)
+            time.sleep(source.chunk_duration)
+        
+        return {
+            "chunks": chunks,
+            "audio_duration": chunks * source.chunk_duration,
+            "started": started,
+            "speech_end": speech_end,
+            "feed_time": speech_end - started
+        }
+    
+    def transcribe_audio(self, audio_data=None, timeout=30.0):
+        """轉錄音頻
+        
+        audio_data 可以是 WAV 文件路徑、AudioInputSource 或 16kHz int16 數組；
+        為None時保留舊API行為，返回最新一條文本
+        """
+        if audio_data is None:
+            event = self.text_queue.peek_latest()
+            return event["text"] if event else ""
+        
+        if isinstance(audio_data, str):
+            source = WavFileSource(audio_data)
+        elif isinstance(audio_data, AudioInputSource):
+            source = audio_data
+        else:
+            source = _ArraySource(np.asarray(audio_data, dtype=np.int16).reshape(-1))
+        
+        self.start_recording()
+        self.feed_source(source, speed=0)
+        event = self.get_transcription_event(timeout=timeout)
+        return event["text"] if event else ""
+    
+    def wait_until_ready(self, timeout=120.0):
+        """等待錄音器初始化完成並返回它，超時返回None（首次加載模型可能較慢）"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with QMutexLocker(self.thread.mutex):
+                if self.thread.recorder is not None and not self.thread.need_init:
+                    return self.thread.recorder
+            time.sleep(0.05)
+        return None
     
     def switch_device(self, device_index):
         """切換輸入設備"""
@@ -252,7 +779,7 @@ class SpeechRecognizer(QObject):
                 return True
             
             self.thread.input_device_index = device_index
-            self.thread.need_init = True
+        self._request_switch()
         
         print(f"請求切換到設備 {device_index}")
         return True
@@ -277,7 +804,7 @@ class SpeechRecognizer(QObject):
         return devices
     
     def cleanup(self):
-        """清理資源"""
+        """清理資源，關閉所有常駐錄音器並結束工作線程（僅在程序退出時調用）"""
         print("正在清理語音識別資源...")
         
         with QMutexLocker(self.thread.mutex):
@@ -285,6 +812,7 @@ class SpeechRecognizer(QObject):
         
         self.thread.cleanup()
         self.thread.requestInterruption()
+        self.thread.active_condition.wakeAll()
         
         if not self.thread.wait(2000):
             print("語音線程未能在超時時間內結束，強制終止")
@@ -0,0 +1,110 @@
+# stream_load_test.py - 並發觀看視頻串流的吞吐量測試
+"""
+開啟多個並發 MJPEG 客戶端，同時定期調用一個 API，測量每個客戶端的幀率
+以及串流負載下的 API 延遲。
+
+用法:
+    python stream_load_test.py --url http://127.0.0.1:5000 --clients 8 --duration 20
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+
+def watch_stream(url, duration, result):
+    """讀取串流並統計收到的幀數"""
+    boundary = b"--frame"
+    frames = 0
+    received = 0
+    started = time.time()
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            buffer = b""
+            while time.time() - started < duration:
+                chunk = response.read(16384)
+                if not chunk:
+                    break
+                received += len(chunk)
+                buffer += chunk
+                frames += buffer.count(boundary)
+                # 只保留可能被截斷的邊界前綴
+                buffer = buffer[-(len(boundary) - 1):]
+    except urllib.error.HTTPError as e:
+        result["error"] = f"HTTP {e.code}"
+    except Exception as e:
+        result["error"] = str(e)
+
+    elapsed = time.time() - started
+    result.update({
+        "frames": frames,
+        "bytes": received,
+        "elapsed": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0
+    })
+
+
+def probe_api(url, duration, interval, latencies):
+    """在串流負載下定期請求 API 並記錄延遲"""
+    started = time.time()
+    while time.time() - started < duration:
+        request_started = time.time()
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                response.read()
+            latencies.append(time.time() - request_started)
+        except Exception as e:
+            print(f"API 請求失敗: {e}")
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="視頻串流並發吞吐量測試")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--api-interval", type=float, default=0.5)
+    parser.add_argument("--output", default=None, help="將結果保存為 JSON")
+    args = parser.parse_args()
+
+    stream_url = f"{args.url}/api/video_stream"
+    api_url = f"{args.url}/api/stream_stats"
+
+    results = [{} for _ in range(args.clients)]
+    latencies = []
+    threads = [threading.Thread(target=watch_stream, args=(stream_url, args.duration, r)) for r in results]
+    threads.append(threading.Thread(target=probe_api, args=(api_url, args.duration, args.api_interval, latencies)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    fps = np.array([r["fps"] for r in results if "error" not in r])
+    summary = {
+        "clients": args.clients,
+        "rejected": sum(1 for r in results if "error" in r),
+        "fps_mean": float(fps.mean()) if len(fps) else 0,
+        "fps_min": float(fps.min()) if len(fps) else 0,
+        "total_fps": float(fps.sum()) if len(fps) else 0,
+        "api_requests": len(latencies),
+        "api_latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "api_latency_p95": float(np.percentile(latencies, 95)) if latencies else None
+    }
+
+    print("=== 串流吞吐量測試 ===")
+    for key, value in summary.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "clients": results}, f, ensure_ascii=False, indent=2)
+        print(f"結果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
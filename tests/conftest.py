@@ -0,0 +1,33 @@
+# 測試共用的小詞彙
+import numpy as np
+import pytest
+
+from text_vocabulary import build_vocabulary, load_vocabulary
+
+SMALL_VOCABULARY = {
+    "object": [("cup", "杯子", "杯"), ("book", "書", "书"), ("phone", "手機", "手机", "電話")],
+    "colour": [("red", "紅", "紅色"), ("blue", "藍", "藍色")]
+}
+WORDS = ["cup", "book", "phone", "red", "blue"]
+
+
+class OneHotTextEncoder:
+    """每個詞的所有提示模板都編碼為該詞的獨熱向量（維度順序同 WORDS）"""
+
+    def encode_text(self, prompts):
+        features = np.zeros((len(prompts), len(WORDS)), dtype=np.float32)
+        for k, prompt in enumerate(prompts):
+            features[k, next(i for i, word in enumerate(WORDS) if f" {word}" in prompt)] = 1.0
+        return features
+
+
+@pytest.fixture
+def vocabulary(tmp_path):
+    directory = str(tmp_path / "vocabulary")
+    build_vocabulary(OneHotTextEncoder(), directory, vocabulary=SMALL_VOCABULARY)
+    return load_vocabulary(directory)
+
+
+@pytest.fixture
+def text_encoder():
+    return OneHotTextEncoder()
@@ -0,0 +1,66 @@
+# 區域特徵列式存儲的測試
+import os
+
+import numpy as np
+
+from embedding_store import (EMBEDDINGS_DIR, FEATURES_FILE, EmbeddingWriter, iter_session_embeddings,
+                             load_session_embeddings)
+
+
+def make_scene(count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{
+        "features": rng.standard_normal((1, dim)).astype(np.float32),
+        "position": (k // 3, k % 3),
+        "coordinates": (k * 10, k * 5, k * 10 + 10, k * 5 + 5)
+    } for k in range(count)]
+
+
+def test_round_trip_restores_segments(tmp_path):
+    session_dir = str(tmp_path / "session_1")
+    writer = EmbeddingWriter(session_dir)
+    first, second = make_scene(4, seed=1), make_scene(2, seed=2)
+    assert writer.append_scene(first, 1.0, interaction_id=0) == [0, 4]
+    # 同一個場景連續記錄只保存一次
+    assert writer.append_scene(first, 1.5, interaction_id=1) == [0, 4]
+    assert writer.append_scene(second, 2.0, interaction_id=2) == [4, 2]
+    writer.close()
+
+    embeddings = load_session_embeddings(session_dir)
+    assert len(embeddings) == 6
+    assert embeddings.scene_rows(1) == (4, 2)
+
+    frame = np.arange(60 * 40 * 3, dtype=np.uint8).reshape(60, 40, 3)
+    restored = embeddings.segments([0, 4], frame=frame)
+    for original, segment in zip(first, restored):
+        assert segment["position"] == original["position"]
+        assert segment["coordinates"] == original["coordinates"]
+        assert segment["features"].shape == (1, 8)
+        # 以 float16 保存
+        np.testing.assert_allclose(segment["features"], original["features"], rtol=1e-3, atol=1e-3)
+        x1, y1, x2, y2 = original["coordinates"]
+        assert segment["image"].shape == frame[y1:y2, x1:x2].shape
+    assert embeddings.metadata["interaction_id"][4] == 2
+
+
+def test_partial_trailing_row_is_ignored(tmp_path):
+    session_dir = str(tmp_path / "session_1")
+    writer = EmbeddingWriter(session_dir)
+    writer.append_scene(make_scene(3), 1.0)
+    writer.close()
+
+    # 模擬崩潰時寫了一半的特徵行
+    with open(os.path.join(session_dir, EMBEDDINGS_DIR, FEATURES_FILE), 'ab') as f:
+        f.write(b"\x00" * 5)
+    assert len(load_session_embeddings(session_dir)) == 3
+
+
+def test_sessions_without_embeddings_are_skipped(tmp_path):
+    os.makedirs(tmp_path / "session_0")
+    writer = EmbeddingWriter(str(tmp_path / "session_1"))
+    writer.append_scene(make_scene(2), 1.0)
+    writer.close()
+
+    assert load_session_embeddings(str(tmp_path / "session_0")) is None
+    sessions = list(iter_session_embeddings(str(tmp_path)))
+    assert [os.path.basename(path) for path, _ in sessions] == ["session_1"]
@@ -0,0 +1,64 @@
+# 評估數據事件日誌的測試
+import json
+import os
+
+from evaluation_collector import (DATA_FILE_NAME, EVENT_LOG_NAME, EvaluationCollector,
+                                  load_session_data, replay_event_log)
+
+
+def make_collector(tmp_path):
+    return EvaluationCollector(output_dir=str(tmp_path), fsync_policy="close",
+                               async_writes=False, store_embeddings=False)
+
+
+def record_session(collector):
+    first = collector.record_interaction({"query": "這個是什麼", "response": "一個杯子"})
+    second = collector.record_interaction({"query": "那個呢", "response": "一本書"})
+    collector.record_reference_resolution(first, "這個", {"position": (1, 1)}, True)
+    collector.record_reference_resolution(first, "左邊", None, False)
+    collector.record_user_feedback(second, 4, "不錯")
+
+
+def test_replay_rebuilds_recorded_state(tmp_path):
+    collector = make_collector(tmp_path)
+    record_session(collector)
+    collector._log.flush()
+
+    replayed = replay_event_log(os.path.join(collector.session_dir, EVENT_LOG_NAME))
+    # 通過 JSON 往返比較，元組位置會變成列表
+    assert replayed == json.loads(json.dumps(collector.data, ensure_ascii=False))
+    assert len(replayed["interactions"][0]["reference_resolution"]) == 2
+    assert replayed["interactions"][1]["user_feedback"]["satisfaction_score"] == 4
+    collector.close()
+
+
+def test_recording_does_not_compact_until_flush_or_close(tmp_path):
+    collector = make_collector(tmp_path)
+    data_path = os.path.join(collector.session_dir, DATA_FILE_NAME)
+    for k in range(250):
+        collector.record_interaction({"query": f"問題 {k}"})
+    assert not os.path.exists(data_path)
+
+    collector.flush()
+    with open(data_path, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)["interactions"]) == 250
+
+    collector.record_interaction({"query": "最後一個"})
+    collector.close()
+    with open(data_path, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)["interactions"]) == 251
+
+
+def test_truncated_log_line_is_ignored(tmp_path):
+    collector = make_collector(tmp_path)
+    record_session(collector)
+    collector.close()
+
+    # 模擬進程崩潰時寫了一半的行
+    log_path = os.path.join(collector.session_dir, EVENT_LOG_NAME)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write('{"type":"interaction","data":{"que')
+    os.remove(os.path.join(collector.session_dir, DATA_FILE_NAME))
+
+    data = load_session_data(collector.session_dir)
+    assert [i["query"] for i in data["interactions"]] == ["這個是什麼", "那個呢"]
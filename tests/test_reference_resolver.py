@@ -0,0 +1,163 @@
+# 本地參照線索、單元內細分與推測解析的測試
+import threading
+
+import numpy as np
+
+from reference_resolver import (ClipReferenceResolver, HierarchicalRefiner, ReferenceSpeculator,
+                                extract_reference_cues)
+
+
+def test_extract_reference_cues():
+    cues = extract_reference_cues("左上那個紅色的杯子")
+    assert cues["demonstrative"] is True
+    assert cues["positions"] == frozenset({"左上"})
+    assert cues["colors"] == frozenset({"紅"})
+    assert extract_reference_cues("今天天氣很好") is None
+    assert extract_reference_cues("") is None
+
+
+def test_compound_position_is_not_split():
+    assert extract_reference_cues("右下的東西")["positions"] == frozenset({"右下"})
+
+
+class ColourImageEncoder:
+    """按區域中紅色和藍色像素的比例編碼圖像，維度與測試詞彙 (cup, book, phone, red, blue) 對應"""
+
+    def encode_segments(self, segments, batch_size=None):
+        return [{**segment, "features": self.features(segment["image"])} for segment in segments]
+
+    @staticmethod
+    def features(image):
+        b, g, r = image[..., 0].astype(int), image[..., 1].astype(int), image[..., 2].astype(int)
+        red = np.mean((r > 150) & (g < 100) & (b < 100))
+        blue = np.mean((b > 150) & (g < 100) & (r < 100))
+        return np.array([[0.1, 0.1, 0.1, red, blue]], dtype=np.float32)
+
+
+def make_cell_scene():
+    # 灰色單元，紅色方塊在右下、藍色方塊在左上
+    frame = np.full((200, 200, 3), 128, dtype=np.uint8)
+    frame[130:190, 130:190] = (0, 0, 255)
+    frame[10:70, 10:70] = (255, 0, 0)
+    segment = {"image": frame, "position": (1, 1), "coordinates": (0, 0, 200, 200),
+               "features": ColourImageEncoder.features(frame)}
+    return {"frame": frame, "segments": [segment]}, segment
+
+
+def test_refiner_picks_sub_cell_for_chinese_reference(vocabulary):
+    scene, segment = make_cell_scene()
+    refiner = HierarchicalRefiner(ColourImageEncoder(), vocabulary, depth=1)
+
+    refined = refiner.refine(scene, segment, "紅色的")
+    assert refined["refinement"] == [(1, 1)]
+    assert refined["position"] == (1, 1)
+    x1, y1, x2, y2 = refined["coordinates"]
+    assert x1 >= 75 and y1 >= 75 and (x2, y2) == (200, 200)
+
+    assert refiner.refine(scene, segment, "藍色的")["refinement"] == [(0, 0)]
+
+
+def test_refiner_keeps_segment_without_vocabulary_terms(vocabulary):
+    scene, segment = make_cell_scene()
+    refiner = HierarchicalRefiner(ColourImageEncoder(), vocabulary, depth=2)
+    assert refiner.refine(scene, segment, "這個") is segment
+
+
+def test_clip_resolver_encodes_english_prompts(vocabulary, text_encoder):
+    class Encoder(ColourImageEncoder):
+        encode_text = staticmethod(text_encoder.encode_text)
+
+    red = np.zeros((10, 10, 3), dtype=np.uint8)
+    red[:] = (0, 0, 255)
+    blue = np.zeros((10, 10, 3), dtype=np.uint8)
+    blue[:] = (255, 0, 0)
+    scene = {"segments": [{"position": (0, 0), "features": ColourImageEncoder.features(red)},
+                          {"position": (0, 1), "features": ColourImageEncoder.features(blue)}]}
+    resolver = ClipReferenceResolver(Encoder(), vocabulary)
+    assert resolver.resolve_reference(scene, "藍色的")["position"] == (0, 1)
+    assert resolver.resolve_reference(scene, "那個紅色")["position"] == (0, 0)
+    # 沒有詞彙中的詞時放棄，而不是用中文文本編碼
+    assert resolver.resolve_reference(scene, "這個") is None
+
+
+class FakeResolver:
+    """記錄調用的解析器，extract_references 的輸出與遠程模型格式相同"""
+
+    def __init__(self, reference=True):
+        self.reference = reference
+        self.resolved = []
+        self.lock = threading.Lock()
+
+    def extract_references(self, text):
+        if not self.reference:
+            return "引用類型: 無引用\n引用文本: 無引用"
+        return f"引用類型: 組合\n引用文本: {text}"
+
+    def resolve_reference(self, scene, reference_text):
+        with self.lock:
+            self.resolved.append(reference_text)
+        return {"position": (0, 0), "text": reference_text}
+
+
+def make_speculator(resolver, captures):
+    def capture():
+        captures.append(1)
+        return {"frame": None, "segments": []}
+    return ReferenceSpeculator(resolver, capture_scene=capture, confirm_timeout=5.0)
+
+
+def test_confirm_uses_segment_only_when_final_text_matches():
+    resolver = FakeResolver()
+    speculator = make_speculator(resolver, [])
+    assert speculator.on_partial("那個紅色的杯子")
+    result = speculator.confirm("那個紅色的杯子。")
+    assert result["segment"]["text"] == "那個紅色的杯子"
+    assert speculator.stats()["confirmed"] == 1
+
+
+def test_confirm_with_different_text_only_reuses_scene():
+    speculator = make_speculator(FakeResolver(), [])
+    speculator.on_partial("那個紅色")
+    result = speculator.confirm("那個紅色的杯子")
+    assert result["scene"] is not None
+    assert result["segment"] is None
+    assert speculator.stats()["scenes_reused"] == 1
+
+
+def test_no_reference_is_not_forced():
+    # 單字顏色線索（如"明白"中的"白"）在最終路徑會被判定為無引用，推測也不能給出區域
+    resolver = FakeResolver(reference=False)
+    speculator = make_speculator(resolver, [])
+    speculator.on_partial("我明白了")
+    result = speculator.confirm("我明白了")
+    assert result["segment"] is None
+    assert resolver.resolved == []
+
+
+def test_changed_cues_discard_speculation():
+    speculator = make_speculator(FakeResolver(), [])
+    speculator.on_partial("左邊的")
+    assert speculator.confirm("右邊的") is None
+    assert speculator.stats()["discarded"] == 1
+
+
+def test_single_worker_skips_superseded_partials():
+    captures = []
+    gate = threading.Event()
+    resolver = FakeResolver()
+
+    def capture():
+        gate.wait(5)
+        captures.append(1)
+        return {"frame": None, "segments": []}
+
+    speculator = ReferenceSpeculator(resolver, capture_scene=capture)
+    for text in ("那個紅", "那個紅色", "那個紅色的", "那個紅色的杯子"):
+        speculator.on_partial(text)
+    gate.set()
+    result = speculator.confirm("那個紅色的杯子")
+
+    # 第一個推測在等待攝像頭時被取代，不再解析；中間的推測從未開始，最後一個重用已捕獲的場景
+    assert result["segment"]["text"] == "那個紅色的杯子"
+    assert resolver.resolved == ["那個紅色的杯子"]
+    assert len(captures) == 1
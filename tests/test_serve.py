@@ -0,0 +1,50 @@
+# 串流限制中間件的測試
+from serve import StreamLimiter
+
+
+def stream_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "multipart/x-mixed-replace")])
+    return iter([b"frame1", b"frame2"])
+
+
+def call(limiter, path):
+    statuses = []
+    body = limiter({"PATH_INFO": path}, lambda status, headers: statuses.append(status))
+    return statuses, body
+
+
+def test_streams_over_limit_are_rejected_and_slots_released_on_close():
+    limiter = StreamLimiter(stream_app, max_streams=1)
+
+    statuses, first = call(limiter, "/api/video_stream")
+    assert statuses == ["200 OK"]
+    assert limiter.active_streams == 1
+
+    statuses, rejected = call(limiter, "/api/video_stream")
+    assert statuses[0].startswith("503")
+    assert limiter.rejected_streams == 1
+
+    # 客戶端斷開時 WSGI 伺服器調用 close()，釋放名額
+    first.close()
+    assert limiter.active_streams == 0
+    statuses, second = call(limiter, "/api/video_stream")
+    assert statuses == ["200 OK"]
+    assert list(second) == [b"frame1", b"frame2"]
+
+
+def test_exhausted_stream_releases_slot_once():
+    limiter = StreamLimiter(stream_app, max_streams=1)
+    _, body = call(limiter, "/api/video_stream")
+    assert list(body) == [b"frame1", b"frame2"]
+    body.close()
+    assert limiter.active_streams == 0
+    _, body = call(limiter, "/api/video_stream")
+    assert limiter.active_streams == 1
+
+
+def test_api_requests_bypass_limit():
+    limiter = StreamLimiter(stream_app, max_streams=1)
+    call(limiter, "/api/video_stream")
+    statuses, _ = call(limiter, "/api/ask")
+    assert statuses == ["200 OK"]
+    assert limiter.rejected_streams == 0
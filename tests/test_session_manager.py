@@ -0,0 +1,130 @@
+# 會話管理與回應工作池的測試
+import threading
+import time
+
+from session_manager import ResponsePipeline, Session, SessionManager
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("等待超時")
+        time.sleep(0.01)
+
+
+def test_results_are_published_in_submission_order():
+    pipeline = ResponsePipeline(max_workers=4)
+    session = Session("s1")
+    published = []
+    gates = [threading.Event() for _ in range(4)]
+
+    def work(k):
+        gates[k].wait(5)
+        return k
+
+    for k in range(4):
+        with session.lock:
+            ticket = session.reserve_response_seq()
+        pipeline.submit(session, ticket, lambda k=k: work(k), lambda s, r: published.append(r))
+
+    # 倒序完成，發布順序仍與提交順序一致
+    for gate in reversed(gates):
+        gate.set()
+        time.sleep(0.02)
+    wait_until(lambda: len(published) == 4)
+    assert published == [0, 1, 2, 3]
+    pipeline.shutdown(wait=True)
+
+
+def test_deferred_work_runs_outside_session_lock_in_order():
+    pipeline = ResponsePipeline(max_workers=2)
+    session = Session("s1")
+    recorded = []
+
+    def publish(s, result):
+        def after():
+            # 後續工作執行時會話鎖已釋放
+            assert s.lock.acquire(blocking=False)
+            s.lock.release()
+            recorded.append(result)
+        return after
+
+    for k in range(3):
+        with session.lock:
+            ticket = session.reserve_response_seq()
+        pipeline.submit(session, ticket, lambda k=k: k, publish)
+
+    wait_until(lambda: len(recorded) == 3)
+    assert recorded == [0, 1, 2]
+    pipeline.shutdown(wait=True)
+
+
+def test_failing_publish_does_not_block_later_results():
+    pipeline = ResponsePipeline(max_workers=1)
+    session = Session("s1")
+    published = []
+
+    def publish(s, result):
+        if result == 0:
+            raise RuntimeError("發布失敗")
+        published.append(result)
+
+    for k in range(3):
+        with session.lock:
+            ticket = session.reserve_response_seq()
+        pipeline.submit(session, ticket, lambda k=k: k, publish)
+
+    wait_until(lambda: len(published) == 2)
+    assert published == [1, 2]
+    assert session.next_publish_seq == 3
+    pipeline.shutdown(wait=True)
+
+
+def test_results_from_before_reset_are_discarded():
+    pipeline = ResponsePipeline(max_workers=1)
+    session = Session("s1")
+    published = []
+    gate = threading.Event()
+
+    with session.lock:
+        ticket = session.reserve_response_seq()
+    pipeline.submit(session, ticket, lambda: gate.wait(5) and "old", lambda s, r: published.append(r))
+    with session.lock:
+        session.reset()
+        ticket = session.reserve_response_seq()
+    gate.set()
+    pipeline.submit(session, ticket, lambda: "new", lambda s, r: published.append(r))
+
+    wait_until(lambda: pipeline.stats()["completed"] == 2)
+    assert published == ["new"]
+    pipeline.shutdown(wait=True)
+
+
+def test_failed_work_publishes_nothing_but_advances_sequence():
+    pipeline = ResponsePipeline(max_workers=1)
+    session = Session("s1")
+    published = []
+
+    def fail():
+        raise ValueError("模型調用失敗")
+
+    for work in (fail, lambda: "ok"):
+        with session.lock:
+            ticket = session.reserve_response_seq()
+        pipeline.submit(session, ticket, work, lambda s, r: published.append(r))
+
+    wait_until(lambda: published == ["ok"])
+    pipeline.shutdown(wait=True)
+
+
+def test_eviction_uses_latest_activity():
+    manager = SessionManager(max_sessions=2, idle_timeout=60)
+    idle = manager.get_or_create("idle")
+    active = manager.get_or_create("active")
+    idle.last_seen = active.last_seen = time.time() - 120
+    # 語音或回應活動刷新會話，不應被淘汰
+    active.touch()
+
+    assert manager.evict_idle() == [idle]
+    assert manager.sessions() == [active]
@@ -0,0 +1,44 @@
+# 音頻輸入源的測試
+import numpy as np
+import pytest
+
+pytest.importorskip("RealtimeSTT")
+pytest.importorskip("PyQt6")
+
+from speech_recognition import AudioInputSource, PcmStreamSource
+
+
+class ShortReadStream:
+    """每次最多返回 sizes 中下一個長度的字節，模擬管道和套接字的不完整讀取"""
+
+    def __init__(self, data, sizes):
+        self.data = data
+        self.sizes = list(sizes)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data, self.data = self.data, b""
+            return data
+        size = min(size, self.sizes.pop(0) if self.sizes else size)
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+def test_short_reads_keep_sample_alignment():
+    samples = np.arange(-500, 500, dtype=np.int16)
+    stream = ShortReadStream(samples.tobytes(), [3, 7, 1, 1, 5, 101])
+    chunks = list(PcmStreamSource(stream, chunk_duration=0.002).iter_chunks())
+    np.testing.assert_array_equal(np.frombuffer(b"".join(chunks), dtype=np.int16), samples)
+
+
+def test_short_reads_keep_stereo_frames():
+    left = np.arange(200, dtype=np.int16)
+    stereo = np.stack([left, left], axis=1).reshape(-1)
+    stream = ShortReadStream(stereo.tobytes(), [6, 3, 9, 2])
+    chunks = list(PcmStreamSource(stream, channels=2, chunk_duration=0.002).iter_chunks())
+    np.testing.assert_array_equal(np.frombuffer(b"".join(chunks), dtype=np.int16), left)
+
+
+def test_input_source_requires_read_samples():
+    with pytest.raises(TypeError):
+        AudioInputSource()
@@ -0,0 +1,48 @@
+# 區域標註詞彙的測試
+import numpy as np
+
+from text_vocabulary import PROMPT_TEMPLATES, format_tags, load_vocabulary, position_label
+
+
+def test_position_label_maps_grid_thirds():
+    assert position_label((0, 0), (3, 3)) == "左上"
+    assert position_label((1, 1), (3, 3)) == "中間"
+    assert position_label((2, 2), (3, 3)) == "右下"
+    assert position_label((5, 0), (6, 6)) == "左下"
+    # 單行網格只區分左右
+    assert position_label((0, 2), (1, 3)) == "右"
+
+
+def test_match_terms_prefers_longer_forms_and_counts_once(vocabulary):
+    words = [vocabulary.terms[i]["zh"] for i in vocabulary.match_terms("那個紅色的杯子，杯子旁邊的手机")]
+    assert sorted(words) == sorted(["紅", "杯子", "手機"])
+    assert vocabulary.match_terms("Is that a Book?") == [1]
+    assert vocabulary.match_terms("") == []
+
+
+def test_text_features_combine_matched_terms(vocabulary):
+    features = vocabulary.text_features("那個紅色的杯子")
+    np.testing.assert_allclose(features, np.array([1, 0, 0, 1, 0]) / np.sqrt(2), atol=1e-3)
+    assert vocabulary.text_features("這個是什麼") is None
+
+
+def test_english_prompts_compose_colours_and_objects(vocabulary):
+    prompts = vocabulary.english_prompts("左邊那個紅色的杯子")
+    assert "a photo of a red cup." in prompts
+    assert all("red cup" in prompt for prompt in prompts)
+    assert vocabulary.english_prompts("藍色的") == [
+        template.format("blue") for template in PROMPT_TEMPLATES["colour"]]
+    assert vocabulary.english_prompts("這個") == []
+
+
+def test_tag_segments_and_dimension_check(vocabulary, tmp_path):
+    segments = [
+        {"features": np.array([[1, 0, 0, 1, 0]], dtype=np.float32), "position": (0, 0)},
+        {"features": np.array([[0, 1, 0, 0, 1]], dtype=np.float32), "position": (2, 2)}
+    ]
+    vocabulary.tag_segments(segments, grid_size=(3, 3))
+    assert segments[0]["tags"] == {"position": "左上", "object": ["杯子"], "colour": ["紅"]}
+    assert format_tags(segments[1]["tags"]) == "藍 書（右下）"
+
+    assert load_vocabulary(vocabulary.directory, dim=vocabulary.dim + 1) is None
+    assert load_vocabulary(str(tmp_path / "missing")) is None
@@ -0,0 +1,237 @@
+# text_vocabulary.py - 預計算的 CLIP 文本特徵詞彙，用於零樣本區域標註
+"""
+把常見物體和顏色詞（中英文）用 CLIP 文本編碼器預先編碼一次，保存為可記憶體映射的矩陣:
+
+- text_features.npy  float16 歸一化文本特徵 (詞數, dim)，每行為多個提示模板的平均
+- terms.json         每行對應的詞（類別、中文、英文、別名）、模型名稱和特徵維度
+
+運行時 np.load(mmap_mode='r') 只映射文件，啟動時加載只需幾毫秒，無需加載文本編碼器。
+場景的所有區域特徵與詞彙矩陣做一次矩陣乘法即得到每個區域的物體和顏色標籤；
+位置標籤（左上、中間等）不經 CLIP，直接由區域的網格位置決定。
+標籤可用於只發送文本的遠程提示（見 ReferenceResolver 的 text_only）和本地參照解析（TagReferenceResolver）。
+
+生成詞彙（需要加載 CLIP 模型，只需運行一次）:
+    python text_vocabulary.py --output clip_vocabulary
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+VOCABULARY_DIR = "clip_vocabulary"
+FEATURES_FILE = "text_features.npy"
+TERMS_FILE = "terms.json"
+MODEL_NAME = "openai/clip-vit-base-patch32"
+
+# 詞彙: 類別 -> [(英文, 中文, 其他中文寫法...)]；CLIP 文本編碼器只理解英文，中文用於匹配和顯示
+VOCABULARY = {
+    "object": [
+        ("person", "人", "人物"), ("face", "臉", "脸"), ("hand", "手"),
+        ("cup", "杯子", "杯"), ("mug", "馬克杯", "马克杯"), ("bottle", "瓶子", "瓶"),
+        ("phone", "手機", "手机", "電話", "电话"), ("laptop", "筆電", "笔记本电脑", "筆記型電腦"),
+        ("computer monitor", "螢幕", "屏幕", "顯示器", "显示器"), ("keyboard", "鍵盤", "键盘"),
+        ("computer mouse", "滑鼠", "鼠标"), ("book", "書", "书"), ("notebook", "筆記本", "笔记本"),
+        ("paper", "紙", "纸"), ("pen", "筆", "笔"), ("pencil", "鉛筆", "铅笔"),
+        ("scissors", "剪刀"), ("bag", "包", "袋子"), ("backpack", "背包"),
+        ("chair", "椅子"), ("table", "桌子", "桌"), ("desk", "書桌", "书桌"),
+        ("window", "窗戶", "窗户", "窗"), ("door", "門", "门"), ("lamp", "燈", "灯", "檯燈", "台灯"),
+        ("plant", "植物", "盆栽"), ("flower", "花"), ("clock", "時鐘", "时钟", "鐘"),
+        ("glasses", "眼鏡", "眼镜"), ("headphones", "耳機", "耳机"), ("remote control", "遙控器", "遥控器"),
+        ("box", "盒子", "箱子"), ("picture frame", "相框", "照片"), ("poster", "海報", "海报"),
+        ("whiteboard", "白板"), ("text", "文字"), ("logo", "標誌", "标志"),
+        ("shirt", "衣服", "襯衫", "衬衫"), ("hat", "帽子"), ("shoe", "鞋子", "鞋"),
+        ("ball", "球"), ("toy", "玩具"), ("cable", "電線", "电线", "線", "线"),
+        ("charger", "充電器", "充电器"), ("wallet", "錢包", "钱包"), ("key", "鑰匙", "钥匙"),
+        ("apple", "蘋果", "苹果"), ("banana", "香蕉"), ("food", "食物")
+    ],
+    "colour": [
+        ("red", "紅", "红", "紅色", "红色"), ("orange", "橙", "橙色", "橘色"),
+        ("yellow", "黃", "黄", "黃色", "黄色"), ("green", "綠", "绿", "綠色", "绿色"),
+        ("blue", "藍", "蓝", "藍色", "蓝色"), ("purple", "紫", "紫色"),
+        ("pink", "粉", "粉紅", "粉红", "粉色"), ("brown", "棕", "棕色", "咖啡色"),
+        ("black", "黑", "黑色"), ("white", "白", "白色"), ("gray", "灰", "灰色")
+    ]
+}
+
+# 多個提示模板的平均特徵比單個詞更穩定
+PROMPT_TEMPLATES = {
+    "object": ("a photo of a {}.", "a close-up photo of a {}.", "a photo of the {} on a desk."),
+    "colour": ("a photo of something {}.", "a {} object.", "a photo in which the main colour is {}.")
+}
+
+# 位置標籤: 網格行/列所在的三等分 -> 中文位置詞（與 reference_resolver.POSITION_WORDS 一致）
+POSITION_LABELS = {
+    (0, 0): "左上", (0, 1): "上面", (0, 2): "右上",
+    (1, 0): "左", (1, 1): "中間", (1, 2): "右",
+    (2, 0): "左下", (2, 1): "下面", (2, 2): "右下"
+}
+
+
+def position_label(position, grid_size):
+    """網格位置對應的位置詞，按行列在網格中所在的三等分判斷"""
+    rows, cols = grid_size
+    row = min(2, position[0] * 3 // rows) if rows > 1 else 1
+    col = min(2, position[1] * 3 // cols) if cols > 1 else 1
+    return POSITION_LABELS[(row, col)]
+
+
+def format_tags(tags):
+    """將區域標籤格式化為提示中的文本，例如 "紅 杯子（左上）" """
+    words = " ".join(tags.get("colour", []) + tags.get("object", [])) or "未知"
+    return f"{words}（{tags['position']}）" if tags.get("position") else words
+
+
+class TextVocabulary:
+    """記憶體映射的詞彙文本特徵"""
+
+    def __init__(self, directory=VOCABULARY_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, TERMS_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.model_name = manifest["model"]
+        self.terms = manifest["terms"]
+        self.features = np.load(os.path.join(directory, FEATURES_FILE), mmap_mode='r')
+        self.dim = self.features.shape[1]
+        if len(self.terms) != self.features.shape[0]:
+            raise ValueError(f"詞彙 {directory} 的詞數 {len(self.terms)} 與特徵行數 {self.features.shape[0]} 不一致")
+
+        self.categories = {}
+        for index, term in enumerate(self.terms):
+            self.categories.setdefault(term["category"], []).append(index)
+        # 匹配文本時先匹配較長的寫法，避免"紅色"之外再匹配"紅"
+        self._surface_forms = sorted(
+            ((form, index) for index, term in enumerate(self.terms) for form in [term["zh"], term["en"], *term["aliases"]]),
+            key=lambda item: len(item[0]), reverse=True
+        )
+
+    def __len__(self):
+        return len(self.terms)
+
+    def scores(self, features, indices=None):
+        """區域特徵 (N, dim) 與詞彙（或其中 indices 行）的餘弦相似度 (N, 詞數)，一次矩陣乘法"""
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.dim)
+        features = features / np.linalg.norm(features, axis=1, keepdims=True)
+        vocabulary = self.features if indices is None else self.features[list(indices)]
+        return features @ np.asarray(vocabulary, dtype=np.float32).T
+
+    def tag_segments(self, segments, grid_size=None, top_k=None, min_probability=0.25, logit_scale=100.0):
+        """為場景的每個區域設置 segment["tags"] = {"object": [...], "colour": [...], "position": 位置詞}
+
+        每個類別內按 CLIP 的 logit 尺度做 softmax，保留概率不低於 min_probability 的詞
+        （最多 top_k 個，默認物體 2 個、顏色 1 個）；grid_size 默認由區域的最大行列推斷
+        """
+        if not segments:
+            return segments
+        top_k = top_k or {"object": 2, "colour": 1}
+        if grid_size is None:
+            grid_size = (max(s["position"][0] for s in segments) + 1, max(s["position"][1] for s in segments) + 1)
+
+        scores = self.scores(np.concatenate([segment["features"] for segment in segments]))
+        tags = [{"position": position_label(segment["position"], grid_size)} for segment in segments]
+        for category, indices in self.categories.items():
+            logits = scores[:, indices] * logit_scale
+            probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            limit = top_k.get(category, 1)
+            for k, row in enumerate(probabilities):
+                order = np.argsort(row)[::-1][:limit]
+                tags[k][category] = [self.terms[indices[i]]["zh"] for i in order if row[i] >= min_probability]
+
+        for segment, segment_tags in zip(segments, tags):
+            segment["tags"] = segment_tags
+        return segments
+
+    def match_terms(self, text):
+        """文本中提到的詞彙行號（中文、英文或別名），每個詞只計一次"""
+        if not text:
+            return []
+        remaining = text.lower()
+        matched = []
+        for form, index in self._surface_forms:
+            if form.lower() in remaining:
+                if index not in matched:
+                    matched.append(index)
+                remaining = remaining.replace(form.lower(), " ")
+        return matched
+
+    def text_features(self, text):
+        """文本中提到的詞的預計算特徵之和（歸一化）；CLIP 文本編碼器只理解英文，
+        中文參照需先映射到詞彙的英文提示特徵。沒有匹配的詞時返回None"""
+        indices = self.match_terms(text)
+        if not indices:
+            return None
+        combined = np.asarray(self.features[sorted(indices)], dtype=np.float32).sum(axis=0)
+        return combined / np.linalg.norm(combined)
+
+    def english_prompts(self, text):
+        """把文本中提到的顏色和物體詞組合為英文提示，例如 "紅色的杯子" -> "a photo of a red cup." 等；
+        只有顏色詞時使用顏色模板，沒有匹配的詞時返回空列表"""
+        indices = self.match_terms(text)
+        colours = [self.terms[i]["en"] for i in indices if self.terms[i]["category"] == "colour"]
+        objects = [self.terms[i]["en"] for i in indices if self.terms[i]["category"] == "object"]
+        if objects:
+            phrases, templates = [" ".join(colours + [name]) for name in objects], PROMPT_TEMPLATES["object"]
+        else:
+            phrases, templates = colours, PROMPT_TEMPLATES["colour"]
+        return [template.format(phrase) for phrase in phrases for template in templates]
+
+
+def load_vocabulary(directory=VOCABULARY_DIR, dim=None):
+    """加載詞彙，不存在或特徵維度與模型不一致時返回None"""
+    if not os.path.exists(os.path.join(directory, TERMS_FILE)):
+        return None
+    vocabulary = TextVocabulary(directory)
+    if dim is not None and vocabulary.dim != dim:
+        print(f"⚠️ 詞彙 {directory} 的特徵維度 {vocabulary.dim} 與模型 {dim} 不一致，已停用區域標註")
+        return None
+    return vocabulary
+
+
+def build_vocabulary(encoder, output=VOCABULARY_DIR, vocabulary=VOCABULARY):
+    """用 encoder.encode_text 編碼所有詞的提示模板，保存特徵矩陣和詞表"""
+    terms = []
+    prompts = []
+    for category, entries in vocabulary.items():
+        for en, zh, *aliases in entries:
+            terms.append({"category": category, "zh": zh, "en": en, "aliases": aliases})
+            prompts.append([template.format(en) for template in PROMPT_TEMPLATES[category]])
+
+    started = time.perf_counter()
+    flat = [prompt for group in prompts for prompt in group]
+    encoded = encoder.encode_text(flat)
+    features = []
+    offset = 0
+    for group in prompts:
+        mean = encoded[offset:offset + len(group)].mean(axis=0)
+        features.append(mean / np.linalg.norm(mean))
+        offset += len(group)
+    features = np.stack(features).astype(np.float16)
+    print(f"已編碼 {len(terms)} 個詞 ({len(flat)} 個提示)，耗時 {time.perf_counter() - started:.1f}s")
+
+    os.makedirs(output, exist_ok=True)
+    np.save(os.path.join(output, FEATURES_FILE), features)
+    with open(os.path.join(output, TERMS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"model": MODEL_NAME, "dim": int(features.shape[1]), "terms": terms}, f, ensure_ascii=False, indent=2)
+    return features, terms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="預計算區域標註用的 CLIP 文本特徵詞彙")
+    parser.add_argument("--output", default=VOCABULARY_DIR, help="詞彙輸出目錄")
+    args = parser.parse_args()
+
+    from vision_encoder import VisionEncoder
+    encoder = VisionEncoder(camera_index=None)
+    build_vocabulary(encoder, args.output)
+
+    started = time.perf_counter()
+    vocabulary = load_vocabulary(args.output)
+    print(f"詞彙已保存到 {args.output}: {len(vocabulary)} x {vocabulary.dim}，"
+          f"加載耗時 {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+# vision_benchmark.py - 視覺編碼器微基準測試
+"""
+在 CPU（或可用的 GPU）上測量 VisionEncoder 和 QualcommVisionEncoder 各步驟的延遲:
+
+- segment_image            網格分割
+- segment_image_optimized  Qualcomm 版本的分割（縮小到 128x128）
+- segment_regions          候選物體區域分割（區域上限為網格單元數）
+- encode_segments          CLIP 編碼所有區域
+- describe_frame           分割 + 編碼（即 describe_scene 去掉攝像頭讀取）
+
+掃描網格大小、輸入解析度、批大小、後端 (torch: fp32, int8: 與 qualcomm_deploy 相同的動態量化)、
+CLIP 輸入大小（224 以下為插值位置編碼的低解析度模式）和線程數，輸出延遲分布、幀率和峰值記憶體。結果保存為 JSON，可用 --baseline 與之前的結果比較。
+--exported 指定 qualcomm_deploy 導出的配置（{export_path}_config.json）時，另外測量其中每個導出版本
+（TorchScript/ONNX，fp32/int8）的 QualcommVisionEncoder 流程: segment_image_optimized + 預處理 + 導出模型，
+記為 describe_frame，後端為版本名稱，可與 torch/int8 直接比較。
+峰值記憶體使用 psutil 採樣的常駐記憶體；未安裝 psutil 時為進程歷史峰值 (ru_maxrss)，結果中記錄為 memory_source。
+prepare_aihub_upload.py 會從結果文件中讀取模型卡片的性能數據。
+
+用法:
+    python vision_benchmark.py --output vision_benchmark.json
+    python vision_benchmark.py --frames evaluation_data --grids 2x2 3x3 --resolutions 640x480 1280x720 \\
+        --batch-sizes 1 0 --backends torch int8 --clip-sizes 224 128 --threads 1 4 --baseline vision_benchmark.json
+    python vision_benchmark.py --exported qualcomm_vision_model_config.json --grids 2x2 3x3
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from vision_encoder import VisionEncoder, segment_regions
+from qualcomm_deploy import QualcommVisionEncoder
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def parse_size(text):
+    """解析 "3x3" 或 "640x480" 形式的尺寸"""
+    a, b = text.lower().split("x")
+    return int(a), int(b)
+
+
+def load_frames(path, count, seed=0):
+    """從目錄（遞歸查找 JPEG/PNG）加載畫面，沒有指定時生成合成畫面"""
+    if path:
+        files = sorted(glob.glob(os.path.join(path, "**", "*.jpg"), recursive=True) +
+                       glob.glob(os.path.join(path, "**", "*.png"), recursive=True))
+        frames = [cv2.imread(f) for f in files[:count]]
+        frames = [f for f in frames if f is not None]
+        if frames:
+            return frames
+        print(f"{path} 中沒有可讀取的圖像，改用合成畫面")
+
+    # 合成畫面: 平滑漸變加色塊和噪聲，比純噪聲更接近真實畫面的壓縮和縮放特性
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        frame[:] = np.linspace(0, 255, 1280, dtype=np.uint8)[None, :, None]
+        for _ in range(8):
+            x, y = rng.integers(0, 1100), rng.integers(0, 560)
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.rectangle(frame, (int(x), int(y)), (int(x) + 180, int(y) + 160), color, -1)
+        frame = cv2.add(frame, rng.integers(0, 20, frame.shape, dtype=np.uint8))
+        frames.append(frame)
+    return frames
+
+
+class MemorySampler:
+    """在後台線程中採樣進程常駐記憶體，記錄測量期間的峰值"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._process = psutil.Process() if psutil is not None else None
+
+    @property
+    def source(self):
+        """記憶體數據來源: "rss" 為採樣的常駐記憶體，"ru_maxrss" 為進程歷史峰值（不會隨測量下降）"""
+        return "rss" if self._process is not None else "ru_maxrss"
+
+    def current(self):
+        """當前常駐記憶體(字節)；沒有 psutil 時返回進程歷史峰值"""
+        if self._process is not None:
+            return self._process.memory_info().rss
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux 單位為 KB，macOS 為字節
+            return usage if sys.platform == "darwin" else usage * 1024
+        return 0
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+        return False
+
+
+def measure(func, frames, iterations, warmup):
+    """對輪流使用的畫面重複調用 func，返回每次的耗時(秒)和峰值記憶體"""
+    for i in range(warmup):
+        func(frames[i % len(frames)])
+
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+    latencies = []
+    with MemorySampler() as sampler:
+        for i in range(iterations):
+            frame = frames[i % len(frames)]
+            started = time.perf_counter()
+            func(frame)
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            latencies.append(time.perf_counter() - started)
+
+    memory = {"peak_rss_mb": sampler.peak / 2 ** 20, "memory_source": sampler.source}
+    if torch.cuda.is_available():
+        memory["peak_cuda_mb"] = torch.cuda.max_memory_allocated() / 2 ** 20
+    return latencies, memory
+
+
+def latency_stats(latencies):
+    """延遲分布(毫秒)和幀率"""
+    values = np.array(latencies) * 1000
+    return {
+        "mean_ms": float(values.mean()),
+        "min_ms": float(values.min()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "fps": float(1000 / values.mean()) if values.mean() > 0 else None
+    }
+
+
+def create_encoder(backend, image_size=None):
+    """創建指定後端和 CLIP 輸入大小的視覺編碼器（不打開攝像頭）"""
+    encoder = VisionEncoder(camera_index=None, image_size=image_size)
+    if backend == "int8":
+        # 與 QualcommVisionEncoder 相同的動態量化，只支持 CPU
+        encoder.device = "cpu"
+        encoder.model = torch.quantization.quantize_dynamic(
+            encoder.model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+        )
+    encoder.model.eval()
+    return encoder
+
+
+def load_exported(config_path):
+    """讀取 qualcomm_deploy 的導出配置，返回 (CLIP 輸入大小, 各導出版本)"""
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return config["preprocessing"]["image_size"], config["variants"]
+
+
+def result_key(result):
+    """用於與基線比較的配置鍵"""
+    return (result["benchmark"], result["backend"], result.get("clip_size") or 224, result["threads"],
+            result["resolution"], result["grid"], result["batch_size"])
+
+
+def run(args):
+    frames = load_frames(args.frames, args.frame_count)
+    resolutions = [parse_size(r) for r in args.resolutions]
+    grids = [parse_size(g) for g in args.grids]
+    results = []
+
+    def record(benchmark, backend, threads, resolution, grid, batch_size, latencies, memory, clip_size=None):
+        result = {
+            "benchmark": benchmark,
+            "backend": backend,
+            "clip_size": clip_size,
+            "threads": threads,
+            "resolution": f"{resolution[0]}x{resolution[1]}",
+            "grid": f"{grid[0]}x{grid[1]}",
+            "batch_size": batch_size,
+            "iterations": len(latencies),
+            **latency_stats(latencies),
+            **memory
+        }
+        results.append(result)
+        print(f"{benchmark:<24}{backend:<7}{str(clip_size or '-'):<5}t={threads:<3}{result['resolution']:<10}{result['grid']:<5}"
+              f"b={str(batch_size):<4} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+              f"{result['fps']:8.1f} fps  {result['peak_rss_mb']:7.0f}MB")
+
+    # 分割不依賴模型和線程數
+    for width, height in resolutions:
+        scaled = [cv2.resize(f, (width, height)) for f in frames]
+        for grid in grids:
+            latencies, memory = measure(lambda f: VisionEncoder.segment_image(f, grid), scaled,
+                                        args.iterations * 10, args.warmup)
+            record("segment_image", "-", 1, (width, height), grid, None, latencies, memory)
+            latencies, memory = measure(lambda f: QualcommVisionEncoder.segment_image_optimized(f, grid), scaled,
+                                        args.iterations * 10, args.warmup)
+            record("segment_image_optimized", "-", 1, (width, height), grid, None, latencies, memory)
+            latencies, memory = measure(lambda f: segment_regions(f, grid), scaled,
+                                        args.iterations * 10, args.warmup)
+            record("segment_regions", "-", 1, (width, height), grid, None, latencies, memory)
+
+    def benchmark_exported(config_path):
+        # QualcommVisionEncoder 的部署流程: 縮小分割 + 預處理 + 導出的 TorchScript/ONNX 模型
+        from transformers import CLIPProcessor
+        from qualcomm_deploy import CLIP_MODEL_NAME, load_runner, preprocess
+
+        image_size, variants = load_exported(config_path)
+        processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+        for variant in variants:
+            for threads in args.threads:
+                torch.set_num_threads(threads)
+                runner = load_runner(variant, threads=threads)
+                if runner is None:
+                    print(f"未安裝 onnxruntime，跳過 {variant['name']}")
+                    break
+                for width, height in resolutions:
+                    scaled = [cv2.resize(f, (width, height)) for f in frames]
+                    for grid in grids:
+                        for batch_size in args.batch_sizes:
+                            def describe(frame, grid=grid, batch_size=batch_size):
+                                segments = QualcommVisionEncoder.segment_image_optimized(frame, grid, size=image_size)
+                                pixel_values = preprocess(processor, [s["image"] for s in segments], image_size)
+                                return [runner(batch) for batch in pixel_values.split(batch_size or len(segments))]
+                            latencies, memory = measure(describe, scaled, args.iterations, args.warmup)
+                            record("describe_frame", variant["name"], threads, (width, height), grid, batch_size,
+                                   latencies, memory, image_size)
+
+    def benchmark_encoder(encoder, backend, clip_size):
+        # 編碼器只在本函數內被引用，返回後即可釋放，下一個模型加載前不會同時佔用記憶體
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            for width, height in resolutions:
+                scaled = [cv2.resize(f, (width, height)) for f in frames]
+                for grid in grids:
+                    segment_sets = [encoder.segment_image(f, grid_size=grid) for f in scaled]
+                    for batch_size in args.batch_sizes:
+                        batch = batch_size or None
+                        latencies, memory = measure(
+                            lambda segments: encoder.encode_segments(segments, batch_size=batch),
+                            segment_sets, args.iterations, args.warmup)
+                        record("encode_segments", backend, threads, (width, height), grid, batch_size,
+                               latencies, memory, clip_size)
+                        latencies, memory = measure(
+                            lambda f: encoder.describe_frame(f, grid_size=grid, batch_size=batch),
+                            scaled, args.iterations, args.warmup)
+                        record("describe_frame", backend, threads, (width, height), grid, batch_size,
+                               latencies, memory, clip_size)
+
+    for backend in args.backends:
+        for clip_size in args.clip_sizes:
+            benchmark_encoder(create_encoder(backend, clip_size), backend, clip_size)
+
+    if args.exported:
+        benchmark_exported(args.exported)
+
+    return results
+
+
+def compare(results, baseline_path):
+    """與基線結果比較 p50/p95，打印變化百分比"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"]}
+
+    print(f"\n=== 與基線比較 ({baseline_path}) ===")
+    for result in results:
+        base = baseline.get(result_key(result))
+        if base is None:
+            continue
+        changes = [f"{name} {(result[name] - base[name]) / base[name]:+.1%}"
+                   for name in ("p50_ms", "p95_ms") if base[name]]
+        print(f"{' '.join(str(k) for k in result_key(result))}: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="視覺編碼器微基準測試")
+    parser.add_argument("--frames", default=None, help="圖像目錄（例如 evaluation_data），默認使用合成畫面")
+    parser.add_argument("--frame-count", type=int, default=8)
+    parser.add_argument("--grids", nargs="+", default=["2x2", "3x3"], help="網格大小，如 3x3")
+    parser.add_argument("--resolutions", nargs="+", default=["640x480"], help="輸入解析度，如 640x480")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 0], help="批大小，0 表示所有區域一批")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8"], choices=["torch", "int8"])
+    parser.add_argument("--clip-sizes", nargs="+", type=int, default=[224],
+                        help="CLIP 輸入大小（32 的倍數），224 以下為低解析度模式")
+    parser.add_argument("--threads", nargs="+", type=int, default=[torch.get_num_threads()])
+    parser.add_argument("--exported", default=None,
+                        help="qualcomm_deploy 導出的配置文件（如 qualcomm_vision_model_config.json），測量其中所有導出版本")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--baseline", default=None, help="與之前保存的結果比較")
+    parser.add_argument("--output", default=None, help="將結果保存為 JSON")
+    args = parser.parse_args()
+
+    if psutil is None:
+        print("⚠️ 未安裝 psutil，記憶體數據為進程歷史峰值 (ru_maxrss)，不反映各項測量的常駐記憶體")
+
+    results = run(args)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": vars(args),
+                "environment": {
+                    "platform": platform.platform(),
+                    "processor": platform.processor(),
+                    "cpu_count": os.cpu_count(),
+                    "torch": torch.__version__,
+                    "cuda": torch.cuda.is_available()
+                },
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果已保存到: {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
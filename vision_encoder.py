@@ -5,9 +5,159 @@ from transformers import CLIPProcessor, CLIPModel
 import numpy as np
 import time
 import os
+import threading
+
+from latency_trace import span, add_span
+from metrics import REGISTRY
+
+FRAMES_CAPTURED = REGISTRY.counter("vision_frames_captured_total", "攝像頭成功讀取的畫面數")
+FRAMES_DROPPED = REGISTRY.counter("vision_frames_dropped_total", "攝像頭讀取失敗的次數")
+CAPTURE_SECONDS = REGISTRY.histogram("vision_capture_seconds", "攝像頭讀取一幀的耗時")
+CLIP_INFERENCES = REGISTRY.counter("vision_clip_inferences_total", "CLIP 圖像模型調用次數")
+CLIP_SEGMENTS = REGISTRY.counter("vision_clip_segments_total", "CLIP 編碼的區域數")
+CLIP_SECONDS = REGISTRY.histogram("vision_clip_seconds", "每次 encode_segments 的 CLIP 推理耗時")
+SCENE_CACHE = REGISTRY.counter("vision_scene_cache_total", "describe_scene 的緩存命中/未命中", ["result"])
+
+SEGMENTATION_MODES = ("grid", "regions")
+
+def propose_regions(frame, max_regions=9, min_area=0.01, max_area=0.9, work_width=320, padding=0.1):
+    """在畫面中快速找出類似物體的區域，返回按分數從高到低排列的 [(x1, y1, x2, y2, 分數), ...]
+
+    在縮小的畫面上結合顯著性（Lab 顏色與全圖平均色的距離）和邊緣，閉運算後取外輪廓的外接框；
+    面積在 [min_area, max_area]（佔畫面比例）之外的框被丟棄，分數為框內平均顯著性乘以面積的平方根
+    """
+    height, width = frame.shape[:2]
+    scale = min(1.0, work_width / width)
+    small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    small_h, small_w = small.shape[:2]
+    
+    # 顯著性: 平滑後的 Lab 顏色與全圖平均色的距離
+    lab = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2LAB).astype(np.float32), (5, 5), 0)
+    saliency = np.linalg.norm(lab - lab.reshape(-1, 3).mean(axis=0), axis=2)
+    saliency = cv2.normalize(saliency, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    _, mask = cv2.threshold(saliency, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    
+    # 邊緣補充與背景顏色相近但輪廓清晰的物體
+    edges = cv2.Canny(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), 50, 150)
+    mask |= cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    kernel_size = max(3, small_w // 40)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((kernel_size, kernel_size), np.uint8))
+    
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return []
+    boxes = np.array([cv2.boundingRect(contour) for contour in contours], dtype=np.float64)
+    areas = boxes[:, 2] * boxes[:, 3] / (small_w * small_h)
+    boxes = boxes[(areas >= min_area) & (areas <= max_area)]
+    if not len(boxes):
+        return []
+    
+    # 框內平均顯著性（積分圖，一次計算所有框）
+    integral = cv2.integral(saliency)
+    x1, y1 = boxes[:, 0].astype(int), boxes[:, 1].astype(int)
+    x2, y2 = x1 + boxes[:, 2].astype(int), y1 + boxes[:, 3].astype(int)
+    sums = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    box_areas = boxes[:, 2] * boxes[:, 3]
+    scores = sums / box_areas / 255 * np.sqrt(box_areas / (small_w * small_h))
+    
+    # 向外擴展 padding 以包含物體邊緣，並換算回原畫面坐標
+    pad_x, pad_y = boxes[:, 2] * padding, boxes[:, 3] * padding
+    coordinates = np.stack([
+        np.clip((x1 - pad_x) / scale, 0, width),
+        np.clip((y1 - pad_y) / scale, 0, height),
+        np.clip((x2 + pad_x) / scale, 0, width),
+        np.clip((y2 + pad_y) / scale, 0, height)
+    ], axis=1).astype(int)
+    
+    order = np.argsort(-scores)[:max_regions]
+    return [(*map(int, coordinates[k]), float(scores[k])) for k in order]
+
+def segment_regions(frame, grid_size=(3, 3), max_regions=None):
+    """以候選物體區域代替固定網格，區域字典與 segment_image 相同
+
+    每個區域的 position 為其中心所在的網格單元，每個單元只保留分數最高的區域，
+    因此位置詞、前端高亮和評估中的位置比較不受影響；物體不會被網格切開，空白單元不編碼。
+    參照解析按位置返回區域，同一單元的第二個物體不會被保留，max_regions 超過單元數時按單元數計；
+    需要區分更多物體時使用更細的 grid_size。
+    沒有找到候選區域時整個畫面作為中間單元的一個區域
+    """
+    height, width = frame.shape[:2]
+    rows, cols = grid_size
+    limit = min(max_regions or rows * cols, rows * cols)
+    
+    best = {}
+    for x1, y1, x2, y2, score in propose_regions(frame, max_regions=limit * 4):
+        cell = (min(rows - 1, (y1 + y2) * rows // (2 * height)), min(cols - 1, (x1 + x2) * cols // (2 * width)))
+        if cell not in best:
+            best[cell] = (x1, y1, x2, y2)
+        if len(best) >= limit:
+            break
+    
+    if not best:
+        best[(rows // 2, cols // 2)] = (0, 0, width, height)
+    
+    return [{
+        "image": frame[y1:y2, x1:x2],
+        "position": cell,
+        "coordinates": (x1, y1, x2, y2)
+    } for cell, (x1, y1, x2, y2) in sorted(best.items())]
+
+def set_clip_resolution(model, processor, image_size):
+    """讓 CLIP 視覺塔直接以 image_size x image_size 輸入推理（原地修改，返回 model）
+
+    位置編碼按新的網格雙三次插值，處理器改為縮放/裁剪到 image_size，區域不再被放大回 224；
+    ViT 的計算量與圖塊數成正比，128 輸入只有 16 個圖塊（224 為 49 個）。
+    image_size 需為圖塊大小 (32) 的整數倍
+    """
+    embeddings = model.vision_model.embeddings
+    if image_size != embeddings.image_size:
+        patch_size = embeddings.patch_size
+        if image_size % patch_size:
+            raise ValueError(f"輸入大小 {image_size} 不是圖塊大小 {patch_size} 的整數倍")
+        
+        weight = embeddings.position_embedding.weight.data
+        old_grid = embeddings.image_size // patch_size
+        new_grid = image_size // patch_size
+        dim = weight.shape[1]
+        
+        # 類別位置編碼保持不變，圖塊位置編碼在二維網格上插值
+        patch_positions = weight[1:].reshape(1, old_grid, old_grid, dim).permute(0, 3, 1, 2)
+        patch_positions = torch.nn.functional.interpolate(
+            patch_positions.float(), size=(new_grid, new_grid), mode="bicubic", align_corners=False
+        ).to(weight.dtype).permute(0, 2, 3, 1).reshape(new_grid * new_grid, dim)
+        
+        position_embedding = torch.nn.Embedding(1 + new_grid * new_grid, dim).to(weight.device, weight.dtype)
+        position_embedding.weight.data.copy_(torch.cat([weight[:1], patch_positions]))
+        embeddings.position_embedding = position_embedding
+        embeddings.image_size = image_size
+        embeddings.num_patches = new_grid * new_grid
+        embeddings.num_positions = embeddings.num_patches + 1
+        embeddings.register_buffer(
+            "position_ids", torch.arange(embeddings.num_positions, device=weight.device).expand((1, -1)),
+            persistent=False
+        )
+        model.config.vision_config.image_size = image_size
+    
+    if processor is not None:
+        image_processor = getattr(processor, "image_processor", processor)
+        image_processor.size = {"shortest_edge": image_size}
+        image_processor.crop_size = {"height": image_size, "width": image_size}
+    return model
 
 class VisionEncoder:
-    def __init__(self):
+    def __init__(self, camera_index=0, image_size=None, segmentation="grid", max_regions=None):
+        """camera_index 為None時不打開攝像頭（例如回放已錄製的畫面）
+
+        image_size: CLIP 輸入大小，None 為模型原生的 224；較小的值（如 128、160）見 set_clip_resolution
+        segmentation: "grid" 固定網格分割，"regions" 只編碼候選物體區域（見 segment_regions）；
+        max_regions 為 regions 模式的區域上限，默認且最多為網格單元數（每個單元最多一個區域）
+        """
+        if segmentation not in SEGMENTATION_MODES:
+            raise ValueError(f"未知的分割方式: {segmentation}")
+        self.segmentation = segmentation
+        self.max_regions = max_regions
+        # 可選的 TextVocabulary（見 text_vocabulary.py），設置後 describe_frame 為每個區域添加標籤
+        self.vocabulary = None
         # 加載CLIP模型
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"使用設備: {self.device}")
@@ -15,33 +165,49 @@ class VisionEncoder:
             print("正在加載 CLIP 模型...")
             self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(self.device)
             self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            print("CLIP 模型加載成功")
+            if image_size:
+                set_clip_resolution(self.model, self.processor, image_size)
+            self.image_size = self.model.vision_model.embeddings.image_size
+            print(f"CLIP 模型加載成功 (輸入 {self.image_size}x{self.image_size})")
         except Exception as e:
             print(f"加載 CLIP 模型時出錯: {e}")
             raise
         
-        # 初始化攝像頭
-        try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                raise Exception("無法打開攝像頭")
-            print("攝像頭初始化成功")
-        except Exception as e:
-            print(f"初始化攝像頭時出錯: {e}")
-            raise
+        # 初始化攝像頭；串流線程、捕獲接口和推測解析可能同時讀取，VideoCapture 不是線程安全的
+        self.cap = None
+        self.capture_lock = threading.Lock()
+        if camera_index is not None:
+            try:
+                self.cap = cv2.VideoCapture(camera_index)
+                if not self.cap.isOpened():
+                    raise Exception("無法打開攝像頭")
+                print("攝像頭初始化成功")
+            except Exception as e:
+                print(f"初始化攝像頭時出錯: {e}")
+                raise
         
+        # 場景緩存由多個會話和請求線程共享，讀寫都持有 scene_lock
+        self.scene_lock = threading.Lock()
         self.scene_cache = None
         self.cache_timestamp = None
         self.cache_duration = 5  # 緩存有效期（秒）
         
     def capture_frame(self):
         """捕獲當前畫面"""
-        ret, frame = self.cap.read()
+        if self.cap is None:
+            return None
+        started = time.perf_counter()
+        with self.capture_lock:
+            ret, frame = self.cap.read()
+        CAPTURE_SECONDS.observe(time.perf_counter() - started)
         if not ret:
+            FRAMES_DROPPED.inc()
             return None
+        FRAMES_CAPTURED.inc()
         return frame
     
-    def segment_image(self, frame, grid_size=(3, 3)):
+    @staticmethod
+    def segment_image(frame, grid_size=(3, 3)):
         """將畫面分割為網格"""
         height, width = frame.shape[:2]
         segments = []
@@ -65,61 +231,273 @@ class VisionEncoder:
         
         return segments
     
-    def encode_segments(self, segments):
-        """為每個區域生成視覺特徵和描述"""
+    def segment_regions(self, frame, grid_size=(3, 3), max_regions=None):
+        """候選物體區域分割（見模塊函數 segment_regions），默認使用實例的區域上限"""
+        return segment_regions(frame, grid_size, max_regions or self.max_regions)
+    
+    def encode_segments(self, segments, batch_size=1):
+        """為每個區域生成視覺特徵和描述
+
+        每 batch_size 個區域合併為一次模型調用（None 表示所有區域一次完成），
+        每個區域的特徵形狀不變，均為 (1, 512)
+        """
         results = []
+        preprocess_time = 0.0
+        inference_time = 0.0
+        started = time.perf_counter()
+        batch_size = batch_size or max(len(segments), 1)
         
-        for segment in segments:
+        for start in range(0, len(segments), batch_size):
+            batch = segments[start:start + batch_size]
+            
             # 處理圖像
-            inputs = self.processor(images=segment["image"], return_tensors="pt").to(self.device)
+            step = time.perf_counter()
+            inputs = self.processor(images=[segment["image"] for segment in batch], return_tensors="pt").to(self.device)
+            preprocess_time += time.perf_counter() - step
             
             # 獲取特徵
+            step = time.perf_counter()
             with torch.no_grad():
                 features = self.model.get_image_features(**inputs)
             
             # 將特徵轉換為numpy數組
             features_np = features.cpu().numpy()
+            inference_time += time.perf_counter() - step
+            CLIP_INFERENCES.inc()
             
             # 將區域添加到結果中
-            results.append({
-                "features": features_np,
-                "position": segment["position"],
-                "coordinates": segment["coordinates"],
-                "image": segment["image"]
-            })
+            for k, segment in enumerate(batch):
+                results.append({
+                    "features": features_np[k:k + 1],
+                    "position": segment["position"],
+                    "coordinates": segment["coordinates"],
+                    "image": segment["image"]
+                })
+        
+        # 記錄累計的預處理和推理耗時
+        add_span("preprocess", started, preprocess_time, segments=len(segments))
+        add_span("clip", started, inference_time, segments=len(segments), device=self.device)
+        CLIP_SEGMENTS.inc(len(segments))
+        CLIP_SECONDS.observe(inference_time)
         
         return results
     
+    def encode_text(self, texts):
+        """將文本編碼為歸一化的 CLIP 文本特徵，形狀 (len(texts), 512)"""
+        inputs = self.processor(text=list(texts), return_tensors="pt", padding=True, truncation=True).to(self.device)
+        with torch.no_grad():
+            features = self.model.get_text_features(**inputs)
+        features = features / features.norm(dim=-1, keepdim=True)
+        return features.cpu().numpy()
+    
     def describe_scene(self, force_refresh=False):
-        """捕獲當前場景並生成區域描述"""
-        current_time = time.time()
-        if (not force_refresh and 
-            self.scene_cache is not None and 
-            self.cache_timestamp is not None and
-            current_time - self.cache_timestamp < self.cache_duration):
+        """捕獲當前場景並生成區域描述
+
+        緩存未命中時在 scene_lock 內編碼，同時到達的請求等待並共用同一次結果，
+        不重複編碼；串流讀幀只使用 capture_lock，不受影響
+        """
+        with self.scene_lock:
+            current_time = time.time()
+            if (not force_refresh and 
+                self.scene_cache is not None and 
+                self.cache_timestamp is not None and
+                current_time - self.cache_timestamp < self.cache_duration):
+                SCENE_CACHE.labels(result="hit").inc()
+                return self.scene_cache
+            SCENE_CACHE.labels(result="miss").inc()
+            
+            with span("capture"):
+                frame = self.capture_frame()
+            if frame is None:
+                return None
+            
+            # 更新緩存
+            self.scene_cache = self.describe_frame(frame)
+            self.cache_timestamp = current_time
+            
             return self.scene_cache
-        
-        frame = self.capture_frame()
-        if frame is None:
-            return None
+    
+    def describe_frame(self, frame, grid_size=(3, 3), batch_size=1, segmentation=None):
+        """為給定畫面生成區域描述（不使用攝像頭和緩存）"""
+        segmentation = segmentation or self.segmentation
         
         # 分割圖像
-        segments = self.segment_image(frame)
+        with span("segment", mode=segmentation):
+            if segmentation == "regions":
+                segments = self.segment_regions(frame, grid_size=grid_size)
+                # 候選區域數量不定，一次批量編碼
+                batch_size = None
+            else:
+                segments = self.segment_image(frame, grid_size=grid_size)
         
         # 編碼區域
-        encoded_segments = self.encode_segments(segments)
+        encoded_segments = self.encode_segments(segments, batch_size=batch_size)
         
-        # 更新緩存
-        self.scene_cache = {
+        # 零樣本標註: 所有區域特徵與詞彙矩陣一次矩陣乘法
+        if self.vocabulary is not None:
+            with span("tag", segments=len(encoded_segments)):
+                self.vocabulary.tag_segments(encoded_segments, grid_size=grid_size)
+        
+        return {
             "frame": frame,
             "segments": encoded_segments
         }
-        self.cache_timestamp = current_time
-        
-        return self.scene_cache
         
     
     def release(self):
         """釋放資源"""
-        if hasattr(self, 'cap'):
-            self.cap.release()
\ No newline at end of file
+        if getattr(self, 'cap', None) is not None:
+            self.cap.release()
+
+
+class FrameBroadcaster:
+    """單線程捕獲畫面並分發給所有串流客戶端
+
+    每幀只從攝像頭讀取一次，每種疊加方式只編碼一次JPEG，
+    客戶端數量增加時攝像頭讀取和編碼成本保持不變；
+    最後一個客戶端斷開 idle_timeout 秒後捕獲線程退出，不再佔用攝像頭，下一個客戶端連接時重新啟動
+    """
+    
+    def __init__(self, capture_frame, on_frame=None, draw_overlay=None, fps=30, jpeg_quality=50, idle_timeout=2.0):
+        self.capture_frame = capture_frame
+        self.on_frame = on_frame            # 每幀回調（例如提交給手勢檢測）
+        self.draw_overlay = draw_overlay    # 在畫面上繪製疊加層的函數
+        self.frame_interval = 1.0 / fps
+        self.jpeg_quality = jpeg_quality
+        self.idle_timeout = idle_timeout
+        
+        self._condition = threading.Condition()
+        self._frame = None
+        self._frame_id = 0
+        self._encoded = {}
+        self._encoding = set()              # 正在鎖外編碼的 (幀ID, 疊加) 鍵
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._closed = False
+        
+        # 統計
+        self.clients = 0
+        self.frames_captured = 0
+        self.frames_encoded = 0
+        self.frames_sent = 0
+    
+    def start(self):
+        """啟動捕獲線程（已啟動或已停止時不重複）"""
+        with self._condition:
+            if self._closed or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+    
+    def stop(self):
+        """停止捕獲並喚醒所有等待中的客戶端（關閉服務時調用，之後的客戶端立即結束）"""
+        self._stop_event.set()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+    
+    def _run(self):
+        """捕獲線程主循環，沒有客戶端超過 idle_timeout 秒後退出"""
+        next_time = time.time()
+        idle_since = None
+        while not self._stop_event.is_set():
+            with self._condition:
+                if self.clients > 0:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.time()
+                elif time.time() - idle_since > self.idle_timeout:
+                    # 在鎖內清除線程，之後連接的客戶端會重新啟動捕獲
+                    self._thread = None
+                    return
+            
+            frame = self.capture_frame()
+            if frame is not None:
+                if self.on_frame is not None:
+                    self.on_frame(frame)
+                with self._condition:
+                    self._frame = frame
+                    self._frame_id += 1
+                    self._encoded = {}
+                    self.frames_captured += 1
+                    self._condition.notify_all()
+            
+            next_time += self.frame_interval
+            delay = next_time - time.time()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                next_time = time.time()
+    
+    def _encode(self, frame, overlay):
+        """將一幀編碼為JPEG（在鎖外調用，不阻塞捕獲線程和其他客戶端）"""
+        if overlay and self.draw_overlay is not None:
+            frame = self.draw_overlay(frame.copy())
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes()
+    
+    def frames(self, overlay=True, timeout=2.0, max_duration=None):
+        """為一個客戶端產生JPEG幀，攝像頭無畫面超過 timeout 秒或達到 max_duration 時結束
+
+        同一幀同一疊加方式只編碼一次: 第一個客戶端在鎖外編碼並發布結果，其他客戶端等待該結果
+        """
+        started = time.time()
+        with self._condition:
+            self.clients += 1
+            last_id = self._frame_id     # 從下一幀開始，不發送捕獲線程空閒前留下的舊畫面
+            self.start()
+        try:
+            while not self._stop_event.is_set():
+                if max_duration and time.time() - started > max_duration:
+                    return
+                frame = None
+                with self._condition:
+                    if not self._condition.wait_for(
+                            lambda: self._frame_id != last_id or self._stop_event.is_set(), timeout=timeout):
+                        return
+                    if self._stop_event.is_set():
+                        return
+                    last_id = self._frame_id
+                    key = (last_id, overlay)
+                    self._condition.wait_for(lambda: key not in self._encoding, timeout=timeout)
+                    data = self._encoded.get(key)
+                    if data is None:
+                        if self._frame_id != last_id:
+                            # 等待期間已有新幀，直接處理新幀
+                            continue
+                        frame = self._frame
+                        self._encoding.add(key)
+                    else:
+                        self.frames_sent += 1
+                
+                if frame is not None:
+                    try:
+                        data = self._encode(frame, overlay)
+                    finally:
+                        # 只在鎖內發布編碼結果；新幀到達後 _encoded 已清空，不再保存舊幀
+                        with self._condition:
+                            self._encoding.discard(key)
+                            if data is not None:
+                                if self._frame_id == last_id:
+                                    self._encoded[key] = data
+                                self.frames_encoded += 1
+                                self.frames_sent += 1
+                            self._condition.notify_all()
+                yield data
+        finally:
+            with self._condition:
+                self.clients -= 1
+    
+    def stats(self):
+        """返回串流統計"""
+        with self._condition:
+            return {
+                "clients": self.clients,
+                "frames_captured": self.frames_captured,
+                "frames_encoded": self.frames_encoded,
+                "frames_sent": self.frames_sent
+            }